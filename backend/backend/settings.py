@@ -1,4 +1,5 @@
 from pathlib import Path
+import json
 import os
 from dotenv import load_dotenv
 import dj_database_url
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
     # Third party
     "rest_framework",
     "rest_framework.authtoken",
+    "adrf",
     "corsheaders",
     "cloudinary",
     "cloudinary_storage",
@@ -52,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "documents.middleware.ServerTimingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -81,6 +84,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "backend.wsgi.application"
+ASGI_APPLICATION = "backend.asgi.application"
 
 # -------------------------------------------------
 # Database
@@ -149,6 +153,181 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# -------------------------------------------------
+# Document extraction
+# -------------------------------------------------
+# Upper bound for the persistent extracted-text cache (LRU eviction above it)
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Process-wide limits: download threads and CPU-bound parsing processes per worker
+EXTRACTION_DOWNLOAD_THREADS = int(os.getenv("EXTRACTION_DOWNLOAD_THREADS", 8))
+EXTRACTION_PARSE_PROCESSES = int(os.getenv("EXTRACTION_PARSE_PROCESSES", 2))
+# Files extracted concurrently for a single summarize request
+EXTRACTION_MAX_PER_REQUEST = int(os.getenv("EXTRACTION_MAX_PER_REQUEST", 4))
+# Downloads up to this size are parsed from memory; bigger ones spill to a temp file
+EXTRACTION_SPOOL_MAX_BYTES = int(os.getenv("EXTRACTION_SPOOL_MAX_BYTES", 8 * 1024 * 1024))
+# "auto" reads text-only PDF pages with pypdfium2 and the rest with pdfplumber
+PDF_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND", "auto")
+# Document formats (documents.extractors.Extractor subclasses). Files are recognized by
+# magic bytes, then extension; plug-ins in DOCUMENT_EXTRACTORS_EXTRA (comma-separated
+# dotted paths) take precedence over the built-in formats
+DOCUMENT_EXTRACTORS = [path for path in os.getenv("DOCUMENT_EXTRACTORS_EXTRA", "").split(",") if path] + [
+    "documents.extractors.PDFExtractor",
+    "documents.extractors.DOCXExtractor",
+    "documents.extractors.ImageExtractor",
+    "documents.extractors.CSVExtractor",
+    "documents.extractors.JSONExtractor",
+    "documents.extractors.HTMLExtractor",
+    "documents.extractors.XMLExtractor",
+    "documents.extractors.TextExtractor",
+]
+# Limits per extractor name as JSON, e.g. {"pdf": {"max_bytes": 52428800}, "csv": {"max_chars": 20000}}
+DOCUMENT_EXTRACTOR_LIMITS = json.loads(os.getenv("DOCUMENT_EXTRACTOR_LIMITS", "{}"))
+
+# -------------------------------------------------
+# OCR for images and scanned PDF pages (see documents/ocr.py)
+# -------------------------------------------------
+# Off by default: needs the tesseract binary (plus language data) on the
+# worker, which Render's native Python runtime doesn't have. Enabled without
+# it, a warning is logged and images and scanned pages stay unreadable.
+OCR_ENABLED = os.getenv("OCR_ENABLED", "False") == "True"
+OCR_BACKEND = os.getenv("OCR_BACKEND", "documents.ocr.TesseractBackend")
+OCR_TESSERACT_CMD = os.getenv("OCR_TESSERACT_CMD", "tesseract")
+# Tesseract language codes joined with "+", e.g. "eng+hin"
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "eng")
+# Tesseract processes running at once per worker
+OCR_PROCESSES = int(os.getenv("OCR_PROCESSES", 2))
+# Seconds allowed per strip
+OCR_TIMEOUT = int(os.getenv("OCR_TIMEOUT", 120))
+# Scanned PDF pages are rendered at this resolution
+OCR_PDF_DPI = int(os.getenv("OCR_PDF_DPI", 200))
+# Wider images are downscaled; taller ones are cut into strips of at most OCR_TILE_HEIGHT rows
+OCR_MAX_WIDTH = int(os.getenv("OCR_MAX_WIDTH", 2500))
+OCR_TILE_HEIGHT = int(os.getenv("OCR_TILE_HEIGHT", 2000))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", 7 * 24 * 60 * 60))
+
+# -------------------------------------------------
+# Summarization (see documents/summarize.py)
+# -------------------------------------------------
+# "single" (first 12k characters), "hierarchical" (map-reduce) or "auto" (hierarchical when longer)
+SUMMARY_DEFAULT_MODE = os.getenv("SUMMARY_DEFAULT_MODE", "auto")
+SUMMARY_CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", 12000))
+SUMMARY_MAX_CHUNKS = int(os.getenv("SUMMARY_MAX_CHUNKS", 40))
+# Gemini calls in flight per summary during the map and reduce phases
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", 4))
+# Partial summaries merged per reduce call, and how many reduce rounds are allowed
+SUMMARY_REDUCE_FANIN = int(os.getenv("SUMMARY_REDUCE_FANIN", 6))
+SUMMARY_MAX_REDUCE_DEPTH = int(os.getenv("SUMMARY_MAX_REDUCE_DEPTH", 2))
+
+# -------------------------------------------------
+# Retrieval for chat (see documents/retrieval.py)
+# -------------------------------------------------
+# "documents.retrieval.HashingEmbedder" runs locally on the CPU; GeminiEmbedder
+# gives semantic matches at the cost of embedding API calls
+RAG_EMBEDDER = os.getenv("RAG_EMBEDDER", "documents.retrieval.HashingEmbedder")
+RAG_CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", 1200))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 4))
+# Documents whose vectors stay loaded in memory per process
+RAG_INDEX_CACHE_SIZE = int(os.getenv("RAG_INDEX_CACHE_SIZE", 64))
+
+# -------------------------------------------------
+# Chat memory (see documents/memory.py)
+# -------------------------------------------------
+# Tokens of recent messages replayed verbatim in each chat prompt, and the
+# size of the digest that older messages are compressed into
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", 1500))
+CHAT_DIGEST_TOKENS = int(os.getenv("CHAT_DIGEST_TOKENS", 400))
+
+# -------------------------------------------------
+# Search (see documents/search.py)
+# -------------------------------------------------
+# PostgreSQL text search configuration (stemming/stopwords) for the tsvector index
+SEARCH_CONFIG = os.getenv("SEARCH_CONFIG", "english")
+# Characters of extracted text indexed per document
+SEARCH_MAX_BODY_CHARS = int(os.getenv("SEARCH_MAX_BODY_CHARS", 200000))
+
+# -------------------------------------------------
+# Gemini response cache (see documents/llm.py)
+# -------------------------------------------------
+# Identical prompts (same model, normalized text and generation config) are
+# answered from the "llm" cache. LocMemCache is per process; point
+# LLM_CACHE_BACKEND/LLM_CACHE_LOCATION at a shared backend to share entries
+# between workers.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True") == "True"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 24 * 60 * 60))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "llm": {
+        "BACKEND": os.getenv("LLM_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("LLM_CACHE_LOCATION", "gemini-responses"),
+        "TIMEOUT": LLM_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2000))},
+    },
+    # Per-page OCR results, keyed by image hash (see documents/ocr.py)
+    "ocr": {
+        "BACKEND": os.getenv("OCR_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("OCR_CACHE_LOCATION", "ocr-pages"),
+        "TIMEOUT": OCR_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("OCR_CACHE_MAX_ENTRIES", 5000))},
+    },
+}
+
+# -------------------------------------------------
+# Gemini gateway: rate limits, retries, circuit breaker (see documents/gateway.py)
+# -------------------------------------------------
+# Budget per minute (0 disables a limit). "process" enforces it in each worker
+# process; "database" also charges a bucket row shared by all workers.
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 300))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 1000000))
+LLM_RATE_LIMIT_BACKEND = os.getenv("LLM_RATE_LIMIT_BACKEND", "process")
+# Tokens assumed for a response when charging a call up front (settled with actual usage afterwards)
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", 800))
+# Seconds a call may wait for its turn before failing
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", 60))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 1))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 30))
+# Consecutive server errors that open the circuit, and seconds before a probe call
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", 5))
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", 30))
+
+# -------------------------------------------------
+# Audio summaries (see documents/audio.py)
+# -------------------------------------------------
+# Seconds before an unfinished generation is considered abandoned and retried
+AUDIO_GENERATION_TIMEOUT = int(os.getenv("AUDIO_GENERATION_TIMEOUT", 300))
+# Dotted path to a documents.tts.TTSBackend subclass, and concurrent TTS calls per process
+TTS_BACKEND = os.getenv("TTS_BACKEND", "documents.tts.GTTSBackend")
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", 4))
+
+# -------------------------------------------------
+# Metrics (see documents/instrumentation.py)
+# -------------------------------------------------
+# Per-stage timing histograms at /metrics and a Server-Timing header on responses
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+# /metrics requires "Authorization: Bearer <METRICS_TOKEN>"; without a token the endpoint is off
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# -------------------------------------------------
+# Background jobs (database-backed queue, see documents/tasks.py)
+# -------------------------------------------------
+# Run a worker thread inside each web process; disable when `manage.py process_jobs` runs separately
+BACKGROUND_WORKER_IN_PROCESS = os.getenv("BACKGROUND_WORKER_IN_PROCESS", "True") == "True"
+# Jobs run concurrently per worker process (threads)
+BACKGROUND_WORKER_THREADS = int(os.getenv("BACKGROUND_WORKER_THREADS", 2))
+BACKGROUND_JOB_POLL_SECONDS = float(os.getenv("BACKGROUND_JOB_POLL_SECONDS", 5))
+# Seconds without a heartbeat (sent every third of this) before a RUNNING job is presumed crashed and run again
+BACKGROUND_JOB_LOCK_TIMEOUT = int(os.getenv("BACKGROUND_JOB_LOCK_TIMEOUT", 600))
+BACKGROUND_JOB_MAX_ATTEMPTS = int(os.getenv("BACKGROUND_JOB_MAX_ATTEMPTS", 3))
+# Running jobs per group (e.g. one user's batch summaries), across all workers
+BACKGROUND_JOB_GROUP_CONCURRENCY = int(os.getenv("BACKGROUND_JOB_GROUP_CONCURRENCY", 2))
+# Base seconds to wait before retrying a job Gemini rate limited (doubled at random)
+BACKGROUND_JOB_RATE_LIMIT_DELAY = float(os.getenv("BACKGROUND_JOB_RATE_LIMIT_DELAY", 30))
+# Documents accepted by one batch summarize request
+SUMMARIZE_BATCH_MAX_DOCUMENTS = int(os.getenv("SUMMARIZE_BATCH_MAX_DOCUMENTS", 1000))
+
 # -------------------------------------------------
 # Email Settings (OTP)
 # -------------------------------------------------
@@ -19,11 +19,14 @@ from django.urls import path , include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from documents.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     
     path("auth/", include("users.urls")),
-    path("documents/", include("documents.urls"))
+    path("documents/", include("documents.urls")),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
 
 if settings.DEBUG:
@@ -1,8 +1,13 @@
 from django.contrib import admin
 
 # Register your models here.
-from documents.models import Document,SummarizationMessage,SummarizationSession
+from documents.models import Document,SummarizationMessage,SummarizationSession,ExtractedText,BackgroundJob,AudioArtifact,SummarizeBatch,SummarizeBatchItem
 
 admin.site.register(Document)
 admin.site.register(SummarizationSession)
-admin.site.register(SummarizationMessage)
\ No newline at end of file
+admin.site.register(SummarizationMessage)
+admin.site.register(ExtractedText)
+admin.site.register(BackgroundJob)
+admin.site.register(AudioArtifact)
+admin.site.register(SummarizeBatch)
+admin.site.register(SummarizeBatchItem)
@@ -0,0 +1,275 @@
+import asyncio
+import contextvars
+import os
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from .instrumentation import span
+from .llm import agenerate_text
+from .models import AudioArtifact
+from .tts import asynthesize
+
+# Audio artifact store: one narration + mp3 per (session, language, summary
+# hash). Ready artifacts are served as-is; concurrent requests for the same
+# artifact share one generation - in-process through a shared task, across
+# workers through the AudioArtifact row (the worker that creates or takes
+# over the row generates, the others poll it). Segments are published as
+# they are synthesized, so stream_audio() can start playback early.
+
+
+class AudioGenerationError(Exception):
+    pass
+
+
+# ---------------- NARRATION + TTS ---------------- #
+def build_narration_prompt(summary_text, lang):
+    return f"""
+                Rewrite the following summary into a natural, human-like spoken narration.
+                - Remove all markdown, symbols like ** or ##, and any formatting.
+                - Write in smooth, conversational { 'Hindi' if lang == 'hi' else 'English' }.
+                - Pretend you are narrating the content aloud for an audiobook.
+
+                ### Original Summary:
+                {summary_text}
+            """
+
+
+def audio_file_path(session, lang, summary_hash):
+    """Path relative to MEDIA_ROOT; includes the summary hash so stale audio is never served."""
+    return f"audio/summary_{session.id}_{lang}_{summary_hash[:12]}.mp3"
+
+
+def _absolute(file_path):
+    return os.path.join(settings.MEDIA_ROOT, file_path)
+
+
+def _write_file(file_path, segments):
+    path = _absolute(file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for segment in segments:
+            f.write(segment)
+    # Publish atomically so a reader never sees a half-written file
+    os.replace(tmp_path, path)
+
+
+# ---------------- ARTIFACT STORE ---------------- #
+def _is_servable(artifact):
+    return (
+        artifact is not None
+        and artifact.status == AudioArtifact.STATUS_READY
+        and os.path.exists(_absolute(artifact.file_path))
+    )
+
+
+async def _claim(session, lang, summary_hash, force):
+    """
+    Return (artifact, owner). The owner generates; everyone else waits for
+    the row to leave GENERATING.
+    """
+    try:
+        artifact = await AudioArtifact.objects.acreate(session=session, language=lang, summary_hash=summary_hash)
+        return artifact, True
+    except IntegrityError:
+        pass
+
+    lookup = {"session": session, "language": lang, "summary_hash": summary_hash}
+    artifact = await AudioArtifact.objects.aget(**lookup)
+    if not force and _is_servable(artifact):
+        return artifact, False  # finished while we were checking
+
+    stale_before = timezone.now() - timedelta(seconds=settings.AUDIO_GENERATION_TIMEOUT)
+    # Failed rows, ready rows whose file is gone (or refresh), and generations abandoned by a crashed worker
+    takeover = (
+        Q(status=AudioArtifact.STATUS_FAILED)
+        | Q(status=AudioArtifact.STATUS_READY)
+        | Q(status=AudioArtifact.STATUS_GENERATING, updated_at__lt=stale_before)
+    )
+    claimed = await AudioArtifact.objects.filter(takeover, **lookup).aupdate(
+        status=AudioArtifact.STATUS_GENERATING, error="", updated_at=timezone.now()
+    )
+    await artifact.arefresh_from_db()
+    return artifact, bool(claimed)
+
+
+async def _wait_for(artifact):
+    deadline = asyncio.get_running_loop().time() + settings.AUDIO_GENERATION_TIMEOUT
+    while artifact.status == AudioArtifact.STATUS_GENERATING:
+        if asyncio.get_running_loop().time() > deadline:
+            raise AudioGenerationError("Timed out waiting for audio generation.")
+        await asyncio.sleep(0.5)
+        await artifact.arefresh_from_db()
+
+    if artifact.status != AudioArtifact.STATUS_READY:
+        raise AudioGenerationError(artifact.error or "Audio generation failed.")
+    return artifact
+
+
+def _drop_superseded(artifact):
+    """Delete audio for older versions of the summary in the same language."""
+    old = AudioArtifact.objects.filter(session_id=artifact.session_id, language=artifact.language).exclude(
+        id=artifact.id
+    )
+    for file_path in old.exclude(file_path="").values_list("file_path", flat=True):
+        try:
+            os.remove(_absolute(file_path))
+        except FileNotFoundError:
+            pass
+    old.delete()
+
+
+class _Generation:
+    """A generation in progress: MP3 segments so far, shared with every waiting request."""
+
+    def __init__(self):
+        self.segments = []
+        self.finished = False
+        self.task = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, segment):
+        async with self._changed:
+            self.segments.append(segment)
+            self._changed.notify_all()
+
+    async def finish(self):
+        async with self._changed:
+            self.finished = True
+            self._changed.notify_all()
+
+    async def follow(self):
+        """Yield every segment, including those published before the call."""
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.finished or len(self.segments) > index)
+                new = self.segments[index:]
+                finished = self.finished
+            for segment in new:
+                yield segment
+            index += len(new)
+            if finished and index == len(self.segments):
+                return
+
+
+async def _produce(session, lang, summary_hash, force, generation):
+    try:
+        artifact, owner = await _claim(session, lang, summary_hash, force)
+        if not owner:
+            return await _wait_for(artifact)
+        return await _generate(artifact, session, lang, summary_hash, force, generation)
+    finally:
+        await generation.finish()
+
+
+async def _generate(artifact, session, lang, summary_hash, force, generation):
+    try:
+        narration = (
+            await agenerate_text(
+                build_narration_prompt(session.summary_text, lang), use_cache=not force, user=session.user_id
+            ) or ""
+        ).strip()
+        if not narration:
+            raise AudioGenerationError("Gemini returned no narration.")
+
+        # ✅ Convert narration to audio, chunk by chunk
+        with span("tts"):
+            async for segment in asynthesize(narration, lang):
+                await generation.publish(segment)
+
+        file_path = audio_file_path(session, lang, summary_hash)
+        with span("audio_write"):
+            await sync_to_async(_write_file, thread_sensitive=False)(file_path, generation.segments)
+    except Exception as e:
+        artifact.status = AudioArtifact.STATUS_FAILED
+        artifact.error = str(e)
+        await artifact.asave(update_fields=["status", "error", "updated_at"])
+        raise
+
+    artifact.narration = narration
+    artifact.narration_hash = AudioArtifact.hash_text(narration)
+    artifact.file_path = file_path
+    artifact.status = AudioArtifact.STATUS_READY
+    await artifact.asave(update_fields=["narration", "narration_hash", "file_path", "status", "updated_at"])
+    await sync_to_async(_drop_superseded)(artifact)
+    return artifact
+
+
+_inflight = {}
+
+
+async def _ready_artifact(session, lang, summary_hash):
+    artifact = await AudioArtifact.objects.filter(
+        session=session, language=lang, summary_hash=summary_hash, status=AudioArtifact.STATUS_READY
+    ).afirst()
+    return artifact if _is_servable(artifact) else None
+
+
+def _start(session, lang, summary_hash, refresh):
+    """The generation for this artifact running on this event loop, started if needed."""
+    loop = asyncio.get_running_loop()
+    key = (session.id, lang, summary_hash)
+    generation = _inflight.get(key)
+    if generation is None or generation.task.get_loop() is not loop:
+        generation = _Generation()
+        # Fresh context: the generation outlives the request that started it,
+        # including that request's thread-sensitive sync_to_async executor
+        generation.task = contextvars.Context().run(
+            loop.create_task, _produce(session, lang, summary_hash, refresh, generation)
+        )
+        _inflight[key] = generation
+        generation.task.add_done_callback(
+            lambda done: _inflight.pop(key) if key in _inflight and _inflight[key].task is done else None
+        )
+    return generation
+
+
+async def get_audio(session, lang, refresh=False):
+    """
+    Return (artifact, generated) for the session's current summary in lang,
+    generating the narration and mp3 only when no ready artifact exists (or
+    refresh is set). Raises on generation failure.
+    """
+    summary_hash = AudioArtifact.hash_text(session.summary_text)
+    if not refresh:
+        artifact = await _ready_artifact(session, lang, summary_hash)
+        if artifact is not None:
+            return artifact, False
+
+    # shield: a client disconnecting must not cancel the generation others wait on
+    return await asyncio.shield(_start(session, lang, summary_hash, refresh).task), True
+
+
+def _read_file(file_path, chunk_size=64 * 1024):
+    with open(_absolute(file_path), "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+async def stream_audio(session, lang):
+    """
+    Yield the MP3 for the session's summary in lang: the stored file when it
+    exists, otherwise segments as they are synthesized (the artifact is
+    still stored for later requests).
+    """
+    summary_hash = AudioArtifact.hash_text(session.summary_text)
+    artifact = await _ready_artifact(session, lang, summary_hash)
+    if artifact is None:
+        generation = _start(session, lang, summary_hash, refresh=False)
+        sent = 0
+        async for segment in generation.follow():
+            sent += 1
+            yield segment
+        artifact = await asyncio.shield(generation.task)
+        if sent:
+            return
+
+    # Generated by another worker, or already stored
+    for chunk in await sync_to_async(lambda: list(_read_file(artifact.file_path)), thread_sensitive=False)():
+        yield chunk
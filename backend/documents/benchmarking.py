@@ -0,0 +1,411 @@
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Fixtures for the offline pipeline benchmark (manage.py benchmark_pipeline):
+# a deterministic corpus of documents in every supported format, a local
+# stand-in for Cloudinary's raw delivery URLs and a fake Gemini API with
+# configurable latency. Nothing here talks to the network. Also the worker
+# start-up measurement behind manage.py benchmark_startup.
+
+FORMATS = (".pdf", ".docx", ".csv", ".json", ".html", ".txt")
+# Approximate bytes of text per size class, multiplied by --scale
+SIZES = {"small": 16 * 1024, "medium": 256 * 1024, "large": 2 * 1024 * 1024}
+# Text per PDF page; a 2 MB document becomes ~700 pages
+PDF_PAGE_CHARS = 3000
+PDF_LINE_CHARS = 90
+
+
+# ---------------- CORPUS ---------------- #
+class TextSource:
+    """Deterministic pseudo-text drawn from a Zipf-like vocabulary."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.vocabulary = [
+            "".join(self.rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(self.rng.randint(2, 10)))
+            for _ in range(5000)
+        ]
+        self.cum_weights = []
+        total = 0.0
+        for rank in range(len(self.vocabulary)):
+            total += 1 / (rank + 1)
+            self.cum_weights.append(total)
+
+    def words(self, count):
+        return self.rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=count)
+
+    def sentence(self):
+        words = self.words(self.rng.randint(6, 18))
+        return " ".join(words).capitalize() + "."
+
+    def paragraphs(self, chars):
+        """Paragraphs totalling about chars characters."""
+        out = []
+        total = 0
+        while total < chars:
+            paragraph = " ".join(self.sentence() for _ in range(self.rng.randint(3, 7)))
+            out.append(paragraph)
+            total += len(paragraph) + 1
+        return out
+
+
+def _pdf_lines(paragraph):
+    line = ""
+    for word in paragraph.split():
+        if line and len(line) + len(word) + 1 > PDF_LINE_CHARS:
+            yield line
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        yield line
+
+
+def write_pdf(path, paragraphs):
+    """A minimal text PDF (Helvetica, one content stream per page) without a PDF library."""
+    pages = [[]]
+    used = 0
+    for paragraph in paragraphs:
+        for line in _pdf_lines(paragraph):
+            if used + len(line) > PDF_PAGE_CHARS:
+                pages.append([])
+                used = 0
+            pages[-1].append(line)
+            used += len(line)
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        # Corpus words are plain ASCII letters, so nothing needs escaping
+        content = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_docx(path, paragraphs):
+    import docx
+
+    document = docx.Document()
+    document.add_heading("Benchmark document", level=1)
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def write_csv(path, source, chars):
+    rng = source.rng
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("id,date,region,product,quantity,price,note\n")
+        row = 0
+        while f.tell() < chars:
+            row += 1
+            f.write(
+                f"{row},2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d},"
+                f"{rng.choice(('north', 'south', 'east', 'west'))},{' '.join(source.words(2))},"
+                f"{rng.randint(1, 500)},{rng.uniform(1, 999):.2f},{' '.join(source.words(5))}\n"
+            )
+
+
+def write_json(path, source, chars):
+    records = []
+    total = 0
+    while total < chars:
+        record = {
+            "id": len(records) + 1,
+            "title": " ".join(source.words(4)),
+            "tags": source.words(3),
+            "score": round(source.rng.uniform(0, 100), 2),
+            "body": source.sentence(),
+        }
+        records.append(record)
+        total += len(json.dumps(record))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"records": records}, f)
+
+
+def write_html(path, paragraphs):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<!DOCTYPE html><html><head><title>Benchmark document</title>")
+        f.write("<style>p { margin: 0 }</style><script>var x = 1;</script></head><body>\n")
+        for index, paragraph in enumerate(paragraphs):
+            if index % 10 == 0:
+                f.write(f"<h2>Section {index // 10 + 1}</h2>\n")
+            f.write(f"<div class=\"section\"><p>{paragraph}</p></div>\n")
+        f.write("</body></html>\n")
+
+
+def write_txt(path, paragraphs):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paragraphs))
+
+
+def build_corpus(directory, sizes=("small", "medium", "large"), formats=FORMATS, scale=1.0, seed=0):
+    """
+    Write one file per (size, format) into directory and return their
+    descriptions. The same arguments always produce byte-identical text, so
+    results stay comparable between runs (DOCX zip timestamps aside).
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for size in sizes:
+        chars = max(1024, int(SIZES[size] * scale))
+        for ext in formats:
+            # One source per file: adding a format doesn't change the others
+            source = TextSource(f"{seed}:{size}:{ext}")
+            name = f"{size}{ext}"
+            path = os.path.join(directory, name)
+            if ext == ".pdf":
+                write_pdf(path, source.paragraphs(chars))
+            elif ext == ".docx":
+                write_docx(path, source.paragraphs(chars))
+            elif ext == ".csv":
+                write_csv(path, source, chars)
+            elif ext == ".json":
+                write_json(path, source, chars)
+            elif ext == ".html":
+                write_html(path, source.paragraphs(chars))
+            else:
+                write_txt(path, source.paragraphs(chars))
+            files.append({"name": name, "size": size, "format": ext, "bytes": os.path.getsize(path)})
+    return files
+
+
+# ---------------- STAND-IN SERVERS ---------------- #
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInServer:
+    """A ThreadingHTTPServer on a free localhost port, served from a daemon thread."""
+
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def netloc(self):
+        host, port = self.httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Cloudinary delivery path: [/<cloud>]/<resource type>/upload/[v<version>/]<public id>
+_DELIVERY_PATH = re.compile(r"/(?:raw|image|video)/upload/(?:v\d+/)?(?P<public_id>.+)$")
+
+
+class _CloudinaryHandler(_QuietHandler):
+    def do_GET(self):
+        server = self.server.owner
+        match = _DELIVERY_PATH.search(self.path.split("?", 1)[0])
+        # Files live flat in the corpus directory, whatever folder the public id names
+        name = os.path.basename(match.group("public_id")) if match else ""
+        path = os.path.join(server.directory, name)
+        if not name or not os.path.isfile(path):
+            self._send(404, b"not found", "text/plain")
+            return
+        with open(path, "rb") as f:
+            body = f.read()
+        with server.lock:
+            server.requests += 1
+            server.bytes_sent += len(body)
+        self._send(200, body, "application/octet-stream")
+
+
+class CloudinaryStandIn(StandInServer):
+    """
+    Serves files of directory at Cloudinary-style raw delivery URLs. Point
+    the SDK at it with cloudinary.config(cname=server.netloc, secure=False,
+    private_cdn=False) and document.file.url resolves here.
+    """
+
+    def __init__(self, directory):
+        super().__init__(_CloudinaryHandler)
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+
+
+def _gemini_body(text, prompt_tokens, output_tokens, finished=True):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+    }
+
+
+class _GeminiHandler(_QuietHandler):
+    def do_POST(self):
+        server = self.server.owner
+        length = int(self.headers.get("Content-Length") or 0)
+        request = self.rfile.read(length)
+        prompt_tokens = max(1, len(request) // 4)
+        with server.lock:
+            server.requests += 1
+            server.prompt_tokens += prompt_tokens
+
+        path = self.path.split("?", 1)[0]
+        if path.endswith(":generateContent"):
+            time.sleep(server.delay())
+            body = _gemini_body(server.reply, prompt_tokens, len(server.reply.split()))
+            self._send(200, json.dumps(body).encode("utf-8"))
+        elif path.endswith(":streamGenerateContent"):
+            self._stream(server, prompt_tokens)
+        else:
+            self._send(404, json.dumps({"error": {"code": 404, "message": "not faked"}}).encode("utf-8"))
+
+    def _stream(self, server, prompt_tokens):
+        words = server.reply.split(" ")
+        chunks = max(1, min(server.stream_chunks, len(words)))
+        step = -(-len(words) // chunks)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pause = server.delay() / chunks
+        for start in range(0, len(words), step):
+            time.sleep(pause)
+            text = " ".join(words[start:start + step]) + (" " if start + step < len(words) else "")
+            finished = start + step >= len(words)
+            event = f"data: {json.dumps(_gemini_body(text, prompt_tokens, len(words), finished))}\r\n\r\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeGemini(StandInServer):
+    """
+    Answers generateContent and streamGenerateContent after latency seconds
+    (plus up to jitter more). Point google-genai at it with GEMINI_BASE_URL.
+    """
+
+    def __init__(self, latency=0.5, jitter=0.0, reply=None, stream_chunks=8, seed=0):
+        super().__init__(_GeminiHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.reply = reply or " ".join(TextSource(seed).paragraphs(400))
+        self.stream_chunks = stream_chunks
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.prompt_tokens = 0
+
+    def delay(self):
+        with self.lock:
+            return self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+
+# ---------------- START-UP ---------------- #
+# Loaded on first use; none of these may be imported while a worker starts
+LAZY_MODULES = (
+    "google.genai", "google.auth", "numpy", "pdfplumber", "pypdfium2", "docx", "lxml", "bs4", "PIL", "gtts",
+)
+
+# What a web worker (with the in-process job worker) imports before serving
+STARTUP_CODE = """
+import time
+started = time.perf_counter()
+import django
+django.setup()
+from importlib import import_module
+from django.conf import settings
+import_module(settings.ROOT_URLCONF)
+import_module("documents.tasks")
+print((time.perf_counter() - started) * 1000)
+"""
+
+_IMPORTTIME = re.compile(r"import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| (?P<name> *\S+)$")
+
+
+def measure_startup(settings_module, cwd):
+    """
+    Start a fresh interpreter under python -X importtime and run STARTUP_CODE.
+    Returns the wall time, the total import time, the module count, the
+    top-level imports by cumulative time and which LAZY_MODULES got loaded.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+        cwd=cwd,
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": settings_module},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Start-up failed: {result.stderr.strip()[-2000:]}")
+
+    names = []
+    total_us = 0
+    top_level = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        name = match["name"]
+        names.append(name.strip())
+        total_us += int(match["self"])
+        if name == name.lstrip():  # imported by the startup code itself, not by another module
+            top_level[name] = int(match["cumulative"]) / 1000
+    return {
+        "wall_ms": round(float(result.stdout.split()[-1]), 1),
+        "import_ms": round(total_us / 1000, 1),
+        "modules": len(names),
+        "top": dict(sorted(top_level.items(), key=lambda item: item[1], reverse=True)),
+        "lazy_loaded": [
+            module for module in LAZY_MODULES if any(n == module or n.startswith(module + ".") for n in names)
+        ],
+    }
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ExtractedText
+
+
+# ---------------- EXTRACTED TEXT CACHE ---------------- #
+def get_extracted_text(document, content_hash, parser_version, max_chars=None):
+    """
+    Cached text for this exact file, or None. A truncated entry (from a
+    budgeted parse) only counts as a hit when it covers max_chars.
+    """
+    entry = (
+        ExtractedText.objects.filter(
+            document=document, content_hash=content_hash, parser_version=parser_version
+        )
+        .only("id", "text", "truncated")
+        .first()
+    )
+    if entry is None:
+        return None
+    if entry.truncated and (max_chars is None or len(entry.text) < max_chars):
+        return None
+
+    # Touch for LRU ordering
+    ExtractedText.objects.filter(id=entry.id).update(last_accessed_at=timezone.now())
+    return entry.text
+
+
+def store_extracted_text(document, content_hash, parser_version, text, truncated=False):
+    size_bytes = len(text.encode("utf-8"))
+    max_bytes = settings.EXTRACTION_CACHE_MAX_BYTES
+    if size_bytes > max_bytes:
+        return
+
+    try:
+        with transaction.atomic():
+            # The file changed (or the parser did): older entries are stale
+            ExtractedText.objects.filter(document=document).delete()
+            ExtractedText.objects.create(
+                document=document,
+                content_hash=content_hash,
+                parser_version=parser_version,
+                text=text,
+                truncated=truncated,
+                size_bytes=size_bytes,
+            )
+    except IntegrityError:
+        # Another worker stored the same extraction first
+        return
+
+    evict_extracted_text(max_bytes)
+
+
+def evict_extracted_text(max_bytes):
+    """Drop least recently used entries until the cache fits in max_bytes."""
+    total = ExtractedText.objects.aggregate(total=Sum("size_bytes"))["total"] or 0
+    if total <= max_bytes:
+        return
+
+    stale_ids = []
+    entries = ExtractedText.objects.order_by("last_accessed_at").values_list("id", "size_bytes")
+    for entry_id, size_bytes in entries.iterator():
+        if total <= max_bytes:
+            break
+        stale_ids.append(entry_id)
+        total -= size_bytes
+
+    ExtractedText.objects.filter(id__in=stale_ids).delete()
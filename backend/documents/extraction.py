@@ -0,0 +1,432 @@
+import os
+import asyncio
+import contextvars
+import hashlib
+import io
+import logging
+import multiprocessing
+import threading
+import httpx
+import requests
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import cache
+from .extractors import SNIFF_BYTES, detect
+from .instrumentation import span
+from .parsers import PAGE_BREAK
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever parser output changes so cached text from older parsers is ignored.
+EXTRACTION_VERSION = 5
+
+
+# ---------------- EXTRACTOR REGISTRY ---------------- #
+_registries = {}
+
+
+def get_extractors():
+    """Extractors of settings.DOCUMENT_EXTRACTORS, in order, with DOCUMENT_EXTRACTOR_LIMITS applied."""
+    paths = tuple(settings.DOCUMENT_EXTRACTORS)
+    limits = settings.DOCUMENT_EXTRACTOR_LIMITS
+    key = (paths, repr(limits))
+    if key not in _registries:
+        classes = [import_string(path) for path in paths]
+        _registries[key] = [cls(**limits.get(cls.name, {})) for cls in classes]
+    return _registries[key]
+
+
+def find_extractor(head, ext, fallback=True):
+    """The extractor for a file from its first bytes and extension (see extractors.detect), or None."""
+    return detect(get_extractors(), head, ext.lower(), fallback=fallback)
+
+
+# ---------------- WORKER POOLS ---------------- #
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(name, factory):
+    # Pools are per process: forked gunicorn workers must not share executors
+    key = (name, os.getpid())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = factory()
+        return _pools[key]
+
+
+def get_download_pool():
+    """Process-wide thread pool for Cloudinary downloads (global I/O limit)."""
+    return _get_pool(
+        "download",
+        lambda: ThreadPoolExecutor(
+            max_workers=settings.EXTRACTION_DOWNLOAD_THREADS,
+            thread_name_prefix="documents-download",
+        ),
+    )
+
+
+def get_parse_pool():
+    """Process-wide process pool for CPU-heavy parsing (global CPU limit)."""
+    return _get_pool(
+        "parse",
+        lambda: ProcessPoolExecutor(
+            max_workers=settings.EXTRACTION_PARSE_PROCESSES,
+            # spawn: forking a process that runs request threads is unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+        ),
+    )
+
+
+def _reset_parse_pool():
+    with _pools_lock:
+        pool = _pools.pop(("parse", os.getpid()), None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ---------------- DOWNLOAD BUFFER ---------------- #
+class _Spool:
+    """
+    Holds a download in memory up to EXTRACTION_SPOOL_MAX_BYTES, then spills
+    it to a temp file that is deleted on close. Use as a context manager so
+    a failed download or parse never leaves a file behind.
+    """
+
+    def __init__(self, ext):
+        self.ext = ext
+        self.limit = settings.EXTRACTION_SPOOL_MAX_BYTES
+        self.buffer = io.BytesIO()
+        self.file = None
+        self.size = 0
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.file is None and self.size > self.limit:
+            self.file = tempfile.NamedTemporaryFile(suffix=self.ext)
+            self.file.write(self.buffer.getbuffer())
+            self.buffer = None
+        (self.buffer if self.file is None else self.file).write(chunk)
+
+    def head(self, size=SNIFF_BYTES):
+        """The first bytes of the download, for format sniffing."""
+        if self.file is None:
+            with self.buffer.getbuffer() as view:
+                return view[:size].tobytes()
+        self.file.flush()
+        self.file.seek(0)
+        head = self.file.read(size)
+        self.file.seek(0, os.SEEK_END)
+        return head
+
+    def source(self):
+        """What parsers read: the bytes, or the path of the spilled file."""
+        if self.file is None:
+            return self.buffer.getvalue()  # hands over the buffer without copying it
+        self.file.flush()
+        return self.file.name
+
+    def close(self):
+        self.buffer = None
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# ---------------- TEXT EXTRACTION (Cloudinary URL) ---------------- #
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+def _download(file_url, ext):
+    # Download file from Cloudinary URL into memory (or a temp file when large)
+    spool = _Spool(ext)
+    try:
+        with span("download", ext) as timing:
+            with requests.get(file_url, stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                    spool.write(chunk)
+            timing.record(bytes=spool.size)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _run_parser(extractor, source, max_chars, options):
+    if not extractor.cpu_bound or settings.EXTRACTION_PARSE_PROCESSES < 1:
+        return extractor.parse(source, max_chars, **options)
+    try:
+        return get_parse_pool().submit(extractor.parse, source, max_chars, **options).result()
+    except BrokenProcessPool:
+        logger.warning("Extraction process pool died, parsing inline")
+        _reset_parse_pool()
+        return extractor.parse(source, max_chars, **options)
+
+
+def _parse(spool, ext, max_chars=None):
+    extractor = find_extractor(spool.head(), ext)
+    if extractor is None:
+        raise ValueError(f"Unsupported file type: {ext or 'unknown'}")
+    if extractor.max_bytes is not None and spool.size > extractor.max_bytes:
+        raise ValueError(
+            f"File too large for {extractor.name} extraction ({spool.size:,} bytes, limit {extractor.max_bytes:,})"
+        )
+    if extractor.max_chars is not None:
+        max_chars = extractor.max_chars if max_chars is None else min(max_chars, extractor.max_chars)
+    # Metrics are labelled with the detected format's extension
+    file_type = ext if ext in extractor.extensions else (extractor.extensions or (extractor.name,))[0]
+
+    use_ocr = False
+    if extractor.ocr:
+        from . import ocr  # ocr uses this module's pools
+
+        use_ocr = ocr.ocr_available()
+    options = {argument: getattr(settings, name) for argument, name in extractor.settings_options.items()}
+    if use_ocr and extractor.ocr == "pages":
+        options["blank_pages"] = True
+
+    source = spool.source()
+    with span("parse", file_type) as timing:
+        text = _run_parser(extractor, source, max_chars, options)
+        pages = text.count(PAGE_BREAK) + 1 if extractor.paged and text else None
+        timing.record(pages=pages, chars=len(text))
+    if not use_ocr:
+        return text
+
+    with span("ocr", file_type):
+        if extractor.ocr == "pages":
+            text = ocr.ocr_blank_pdf_pages(source, text, max_chars)
+        else:
+            text = ocr.ocr_image(source)
+    return text[:max_chars] if max_chars is not None else text
+
+
+def _download_and_parse(file_url, max_chars=None):
+    ext = os.path.splitext(file_url)[-1].lower()
+    with _download(file_url, ext) as spool:
+        return _parse(spool, ext, max_chars)
+
+
+def _unreadable(file_url):
+    return f"⚠️ Could not extract readable text from {os.path.basename(file_url)}."
+
+
+def _extraction_error(file_url, e):
+    return f"⚠️ Error extracting text from {os.path.basename(file_url)}: {str(e)}"
+
+
+def extract_text_from_file(file_url, max_chars=None):
+    try:
+        text = _download_and_parse(file_url, max_chars)
+    except Exception as e:
+        text = _extraction_error(file_url, e)
+
+    if not text.strip():
+        text = _unreadable(file_url)
+
+    return text.strip()
+
+
+# ---------------- CACHED EXTRACTION (per Document) ---------------- #
+def document_content_key(document):
+    """
+    Hash identifying the current file contents of a document. Uploads store a
+    sha256 of the bytes; older rows fall back to the versioned Cloudinary URL,
+    which also changes whenever the file is replaced.
+    """
+    if document.content_hash:
+        return document.content_hash
+    return hashlib.sha256(document.file.url.encode("utf-8")).hexdigest()
+
+
+def _get_cached(document, max_chars=None):
+    return cache.get_extracted_text(
+        document, document_content_key(document), EXTRACTION_VERSION, max_chars=max_chars
+    )
+
+
+def _store(document, raw_text, max_chars=None):
+    """Cache a fresh parse result and return its stripped text."""
+    # A budgeted parse that filled its budget may have stopped early
+    truncated = max_chars is not None and len(raw_text) >= max_chars
+    text = raw_text.strip()
+    # Only successful extractions are cached so transient errors are retried
+    if text:
+        cache.store_extracted_text(
+            document, document_content_key(document), EXTRACTION_VERSION, text, truncated=truncated
+        )
+    return text
+
+
+def parse_document(document, max_chars=None):
+    """
+    Return the stripped text of a document, using the persistent extraction
+    cache when this exact file was parsed before. With max_chars, parsing
+    may stop once that many characters are available. Download and parser
+    errors propagate to the caller.
+    """
+    cached = _get_cached(document, max_chars)
+    if cached is not None:
+        return cached[:max_chars] if max_chars is not None else cached
+
+    return _store(document, _download_and_parse(document.file.url, max_chars), max_chars)
+
+
+def _ready_texts(documents, max_chars):
+    """
+    Texts available without downloading (stored by the extraction job, or
+    cached), plus the indexes of documents that still need extracting.
+    """
+    texts = [None] * len(documents)
+    pending = []
+    for index, document in enumerate(documents):
+        if document.extraction_status == document.EXTRACTION_DONE:
+            texts[index] = document.extracted_text[:max_chars] or _unreadable(document.file.url)
+            continue
+        cached = _get_cached(document, max_chars)
+        if cached is not None:
+            texts[index] = cached[:max_chars]
+        else:
+            pending.append(index)
+    return texts, pending
+
+
+def _finish(document, result, max_chars):
+    """Text for a finished inline extraction (raw text or the exception it raised)."""
+    if isinstance(result, Exception):
+        return _extraction_error(document.file.url, result)
+    return _store(document, result, max_chars) or _unreadable(document.file.url)
+
+
+def get_documents_text(documents, max_chars=None):
+    """
+    Text for summarization, one entry per document in the given order: the
+    copy stored by the upload-time extraction job when it has finished,
+    otherwise a cached or inline extraction. max_chars bounds each entry
+    and lets inline PDF, HTML and XML parsing stop early.
+
+    Inline extractions run concurrently, at most EXTRACTION_MAX_PER_REQUEST
+    at a time, with downloads on the shared thread pool and CPU-bound
+    parsing (see Extractor.cpu_bound) on the shared process pool.
+    """
+    documents = list(documents)
+    texts, pending = _ready_texts(documents, max_chars)
+
+    pool = get_download_pool()
+    queue = iter(pending)
+    running = {}
+
+    def submit_next():
+        index = next(queue, None)
+        if index is not None:
+            # Copy the context so the stage spans reach the request's Server-Timing
+            running[pool.submit(
+                contextvars.copy_context().run, _download_and_parse, documents[index].file.url, max_chars
+            )] = index
+
+    for _ in range(max(1, settings.EXTRACTION_MAX_PER_REQUEST)):
+        submit_next()
+
+    while running:
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            # Cache writes stay on the request thread and its DB connection
+            texts[index] = _finish(documents[index], result, max_chars)
+            submit_next()
+
+    return texts
+
+
+# ---------------- ASYNC EXTRACTION ---------------- #
+_async_state = {}
+
+
+def _loop_state():
+    """
+    Per-event-loop HTTP client and download semaphore: asyncio primitives
+    and pooled connections cannot be shared between loops.
+    """
+    loop = asyncio.get_running_loop()
+    state = _async_state.get(id(loop))
+    if state is None or state["loop"] is not loop:
+        for key, old in list(_async_state.items()):
+            if old["loop"].is_closed():
+                del _async_state[key]
+        state = {
+            "loop": loop,
+            "http": httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0), follow_redirects=True),
+            "downloads": asyncio.Semaphore(max(1, settings.EXTRACTION_DOWNLOAD_THREADS)),
+        }
+        _async_state[id(loop)] = state
+    return state
+
+
+async def _adownload(file_url, ext):
+    state = _loop_state()
+    spool = _Spool(ext)
+    try:
+        async with state["downloads"]:
+            with span("download", ext) as timing:
+                async with state["http"].stream("GET", file_url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                        spool.write(chunk)
+                timing.record(bytes=spool.size)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+async def _adownload_and_parse(file_url, max_chars=None):
+    ext = os.path.splitext(file_url)[-1].lower()
+    with await _adownload(file_url, ext) as spool:
+        # Parsing blocks: hand it to a thread (which uses the process pool for CPU-bound formats).
+        # run_in_executor doesn't carry contextvars: copy them so the parse span reaches Server-Timing
+        return await asyncio.get_running_loop().run_in_executor(
+            get_download_pool(), contextvars.copy_context().run, _parse, spool, ext, max_chars
+        )
+
+
+async def aget_documents_text(documents, max_chars=None):
+    """
+    Async get_documents_text: downloads run on the event loop with httpx
+    instead of holding a thread each, at most EXTRACTION_MAX_PER_REQUEST
+    per call and EXTRACTION_DOWNLOAD_THREADS per process.
+    """
+    documents = list(documents)
+    texts, pending = await sync_to_async(_ready_texts)(documents, max_chars)
+    if not pending:
+        return texts
+
+    semaphore = asyncio.Semaphore(max(1, settings.EXTRACTION_MAX_PER_REQUEST))
+
+    async def extract(index):
+        async with semaphore:
+            return await _adownload_and_parse(documents[index].file.url, max_chars)
+
+    results = await asyncio.gather(*(extract(index) for index in pending), return_exceptions=True)
+
+    def finish_all():
+        for index, result in zip(pending, results):
+            texts[index] = _finish(documents[index], result, max_chars)
+
+    await sync_to_async(finish_all)()
+    return texts
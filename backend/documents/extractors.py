@@ -0,0 +1,182 @@
+import importlib
+
+# Document formats. Each Extractor says how to recognize a file (magic bytes
+# at the start of the download, then the extension) and names its parser by
+# dotted path; the parser module, and libraries like pdfplumber, docx, lxml
+# or numpy, is only imported the first time a file of that format is parsed.
+#
+# Extractors are listed in settings.DOCUMENT_EXTRACTORS (plug-ins are added
+# the same way) and limited per name by DOCUMENT_EXTRACTOR_LIMITS; see
+# documents/extraction.py. No Django imports: parsers run in the spawned
+# processes of the extraction process pool.
+
+# Bytes of the download handed to sniff()
+SNIFF_BYTES = 8 * 1024
+
+
+class Extractor:
+    """
+    A document format. Binary formats must sniff() as themselves (a
+    misleading extension is not enough); text formats are recognized by
+    extension, or by sniff() when the extension is missing or unknown.
+    """
+
+    name = "base"
+    extensions = ()
+    binary = False
+    # Used for files no other extractor recognizes, if sniff() accepts them
+    fallback = False
+    # "module.function" called as parser(source, max_chars, **options)
+    parser = None
+    # Parse in the extraction process pool instead of a thread
+    cpu_bound = False
+    # Text has PAGE_BREAK-separated pages (counted in metrics)
+    paged = False
+    # "pages": OCR the blank pages after parsing; "image": OCR the whole file
+    ocr = None
+    # Parser keyword arguments read from Django settings: {"argument": "SETTING_NAME"}
+    settings_options = {}
+    # Limits, overridable per name in DOCUMENT_EXTRACTOR_LIMITS (None: no limit)
+    max_bytes = None
+    max_chars = None
+
+    def __init__(self, **limits):
+        for key, value in limits.items():
+            if key not in ("max_bytes", "max_chars"):
+                raise ValueError(f"Unknown limit for the {self.name} extractor: {key}")
+            setattr(self, key, value)
+
+    def sniff(self, head, ext=""):
+        """Whether the first bytes of a file (named with extension ext) look like this format."""
+        return False
+
+    def parse(self, source, max_chars=None, **options):
+        """Text of a file given as bytes or a path; the parser module is imported on first use."""
+        module, function = self.parser.rsplit(".", 1)
+        return getattr(importlib.import_module(module), function)(source, max_chars, **options)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+
+def _text_head(head):
+    return head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+
+
+# ---------------- BUILT-IN FORMATS ---------------- #
+class PDFExtractor(Extractor):
+    name = "pdf"
+    extensions = (".pdf",)
+    binary = True
+    parser = "documents.parsers.parse_pdf"
+    cpu_bound = True
+    paged = True
+    ocr = "pages"
+    settings_options = {"backend": "PDF_TEXT_BACKEND"}
+
+    def sniff(self, head, ext=""):
+        # The header may follow some junk, which readers tolerate
+        return b"%PDF-" in head[:1024]
+
+
+class DOCXExtractor(Extractor):
+    name = "docx"
+    extensions = (".docx",)
+    binary = True
+    parser = "documents.parsers.parse_docx"
+
+    def sniff(self, head, ext=""):
+        # A zip whose first entries (names are stored uncompressed) belong to a
+        # Word document; a zip named .docx is trusted when the entries come later
+        return head.startswith(b"PK\x03\x04") and (b"word/" in head or ext in self.extensions)
+
+
+class ImageExtractor(Extractor):
+    name = "image"
+    extensions = (".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp")
+    binary = True
+    parser = "documents.parsers.parse_image"
+    paged = True
+    ocr = "image"
+    SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"BM", b"II*\x00", b"MM\x00*")
+
+    def sniff(self, head, ext=""):
+        return head.startswith(self.SIGNATURES) or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")
+
+
+class CSVExtractor(Extractor):
+    name = "csv"
+    extensions = (".csv", ".tsv")
+    parser = "documents.parsers.parse_csv"
+    cpu_bound = True
+
+
+class JSONExtractor(Extractor):
+    name = "json"
+    extensions = (".json", ".jsonl", ".ndjson")
+    parser = "documents.parsers.parse_json"
+    cpu_bound = True
+
+    def sniff(self, head, ext=""):
+        head = _text_head(head)
+        return head[:1] in (b"{", b"[") and head[1:].lstrip()[:1] in (b'"', b"{", b"[", b"]", b"}")
+
+
+class HTMLExtractor(Extractor):
+    name = "html"
+    extensions = (".html", ".htm", ".xhtml")
+    parser = "documents.parsers.parse_html"
+
+    def sniff(self, head, ext=""):
+        head = _text_head(head)
+        return head.startswith((b"<!doctype html", b"<html")) or (head.startswith(b"<") and b"<html" in head)
+
+
+class XMLExtractor(Extractor):
+    name = "xml"
+    extensions = (".xml",)
+    parser = "documents.parsers.parse_xml"
+
+    def sniff(self, head, ext=""):
+        return _text_head(head).startswith(b"<?xml")
+
+
+class TextExtractor(Extractor):
+    """Plain text: known text extensions, and the fallback for any file that decodes as text."""
+
+    name = "text"
+    extensions = (".txt", ".md", ".log")
+    fallback = True
+    parser = "documents.parsers.parse_text"
+
+    def sniff(self, head, ext=""):
+        # Binary formats practically always have NUL bytes early on; text never does
+        return b"\x00" not in head
+
+
+# ---------------- DETECTION ---------------- #
+def detect(extractors, head, ext, fallback=True):
+    """
+    The extractor for a file, from its first bytes and extension:
+    1. a binary format whose magic bytes match,
+    2. the text format registered for the extension (binary formats need
+       their magic bytes, so a mislabelled file never reaches their parser),
+    3. a text format recognized by sniff(),
+    4. with fallback, a fallback extractor (plain text) that accepts the bytes.
+    None when nothing fits.
+    """
+    for extractor in extractors:
+        if extractor.binary and extractor.sniff(head, ext):
+            return extractor
+    text_formats = [extractor for extractor in extractors if not extractor.binary]
+    for extractor in text_formats:
+        if ext in extractor.extensions:
+            return extractor
+    for extractor in text_formats:
+        if not extractor.fallback and extractor.sniff(head, ext):
+            return extractor
+    if fallback:
+        for extractor in text_formats:
+            if extractor.fallback and extractor.sniff(head, ext):
+                return extractor
+    return None
@@ -0,0 +1,525 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Every Gemini call goes through the gateway:
+#   1. circuit breaker - after LLM_CIRCUIT_FAILURES consecutive server errors
+#      calls fail fast for LLM_CIRCUIT_COOLDOWN seconds, then one probe call
+#      decides whether to close it again;
+#   2. admission - a requests/min and tokens/min bucket per process; when it
+#      runs dry, waiting calls are admitted in start-time fair order across
+#      users, so one user's batch can't starve another's chat. With
+#      LLM_RATE_LIMIT_BACKEND="database" a row-locked bucket shared by all
+#      workers is charged too;
+#   3. retries - 429s, 5xx and connection errors are retried with jittered
+#      exponential backoff. A 429 also empties the local bucket so other
+#      calls in the process back off with it.
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class GatewayError(Exception):
+    pass
+
+
+class CircuitOpenError(GatewayError):
+    pass
+
+
+class QueueTimeoutError(GatewayError):
+    pass
+
+
+# ---------------- CALLER IDENTITY ---------------- #
+_current_user = contextvars.ContextVar("llm_user", default=None)
+
+
+@contextmanager
+def llm_user(user_id):
+    """Attribute Gemini calls made inside the block to user_id (for fair queuing)."""
+    token = _current_user.set(user_id)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+
+def current_user():
+    return _current_user.get()
+
+
+# ---------------- METRICS ---------------- #
+_metrics = {
+    "requests": 0,
+    "retries": 0,
+    "failures": 0,
+    "rate_limited": 0,
+    "throttled": 0,
+    "rejected": 0,
+    "queue_wait_seconds_total": 0.0,
+    "queue_wait_seconds_max": 0.0,
+    "tokens_estimated": 0,
+    "tokens_used": 0,
+}
+_metrics_lock = threading.Lock()
+
+
+def _record(**changes):
+    with _metrics_lock:
+        for name, value in changes.items():
+            _metrics[name] += value
+
+
+def _record_wait(seconds, throttled):
+    with _metrics_lock:
+        _metrics["queue_wait_seconds_total"] += seconds
+        _metrics["queue_wait_seconds_max"] = max(_metrics["queue_wait_seconds_max"], seconds)
+        if throttled:
+            _metrics["throttled"] += 1
+
+
+def gateway_stats():
+    """Counters for this process, plus queue length and circuit state."""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    stats["queued"] = get_gateway().scheduler.queued
+    stats["circuit"] = get_gateway().breaker.state
+    return stats
+
+
+# ---------------- RATE LIMITS ---------------- #
+class TokenBucket:
+    """Classic token bucket; capacity is one minute's worth. rate_per_min <= 0 disables it."""
+
+    def __init__(self, rate_per_min):
+        self.rate = rate_per_min / 60.0
+        self.capacity = float(rate_per_min)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, cost, now):
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def take(self, cost, now):
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= min(cost, self.capacity)
+
+    def drain(self, now):
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+
+
+class FairScheduler:
+    """
+    Admits calls against a requests bucket and a tokens bucket. While both
+    have room calls pass straight through; otherwise they wait in a heap
+    ordered by start-time fair queuing tags (each user's tag advances by the
+    tokens they ask for), so users share the budget evenly.
+    """
+
+    def __init__(self, requests_per_min, tokens_per_min):
+        self.requests = TokenBucket(requests_per_min)
+        self.tokens = TokenBucket(tokens_per_min)
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._vclock = 0.0
+        self._vfinish = {}
+        self._timer = None
+        self._timer_due = None
+
+    @property
+    def queued(self):
+        return len(self._heap)
+
+    def _wait_for(self, cost, now):
+        return max(self.requests.time_until(1, now), self.tokens.time_until(cost, now))
+
+    def _take(self, cost, now):
+        self.requests.take(1, now)
+        self.tokens.take(cost, now)
+
+    def _pump_locked(self):
+        now = time.monotonic()
+        while self._heap:
+            tag, _, cost, waiter = self._heap[0]
+            if waiter.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            wait = self._wait_for(cost, now)
+            if wait > 0:
+                self._schedule_locked(now + wait)
+                return
+            heapq.heappop(self._heap)
+            self._take(cost, now)
+            self._vclock = tag
+            waiter.grant()
+        # Nobody waiting: forget per-user tags
+        self._vfinish.clear()
+
+    def _schedule_locked(self, due):
+        if self._timer is not None and self._timer_due <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(0.0, due - time.monotonic()), self._pump)
+        self._timer.daemon = True
+        self._timer_due = due
+        self._timer.start()
+
+    def _pump(self):
+        with self._lock:
+            self._timer = None
+            self._pump_locked()
+
+    def submit(self, cost, user, waiter):
+        """Grant waiter now (returns True) or queue it."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._heap and self._wait_for(cost, now) == 0:
+                self._take(cost, now)
+                return True
+            start = max(self._vclock, self._vfinish.get(user, 0.0))
+            self._vfinish[user] = start + cost
+            heapq.heappush(self._heap, (start, next(self._seq), cost, waiter))
+            self._pump_locked()
+            return False
+
+    def settle(self, estimated, actual):
+        """Charge the tokens bucket for the difference between estimated and actual usage."""
+        with self._lock:
+            self.tokens.take(actual - estimated, time.monotonic())
+
+    def drain(self):
+        with self._lock:
+            now = time.monotonic()
+            self.requests.drain(now)
+            self.tokens.drain(now)
+
+
+class _ThreadWaiter:
+    def __init__(self):
+        self.cancelled = False
+        self._event = threading.Event()
+
+    def grant(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.cancelled = False
+        self._loop = asyncio.get_running_loop()
+        self.future = self._loop.create_future()
+
+    def grant(self):
+        try:
+            self._loop.call_soon_threadsafe(self._set)
+        except RuntimeError:
+            pass  # the waiting loop has closed
+
+    def _set(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+def reserve_shared(name, cost, rate_per_min):
+    """
+    Charge cost to the database bucket `name` (shared by every worker) and
+    return how long the caller must wait. The balance may go negative: each
+    caller reserves its slot and sleeps until the bucket has refilled to it.
+    """
+    from .models import RateLimitBucket
+
+    if rate_per_min <= 0:
+        return 0.0
+    rate = rate_per_min / 60.0
+    now = time.time()
+    with transaction.atomic():
+        bucket, _ = RateLimitBucket.objects.select_for_update().get_or_create(
+            name=name, defaults={"tokens": float(rate_per_min), "updated_at": now}
+        )
+        tokens = min(float(rate_per_min), bucket.tokens + max(0.0, now - bucket.updated_at) * rate)
+        bucket.tokens = tokens - min(cost, rate_per_min)
+        bucket.updated_at = now
+        bucket.save(update_fields=["tokens", "updated_at"])
+    return max(0.0, -bucket.tokens / rate)
+
+
+def _shared_wait(tokens):
+    return max(
+        reserve_shared("gemini:requests", 1, settings.LLM_REQUESTS_PER_MINUTE),
+        reserve_shared("gemini:tokens", tokens, settings.LLM_TOKENS_PER_MINUTE),
+    )
+
+
+# ---------------- CIRCUIT BREAKER ---------------- #
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        # Token of the call probing a half-open circuit, None when no probe is in flight
+        self._probe = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError while the circuit is open. Returns a token when
+        this call is the half-open probe (else None), to hand to release()
+        once the call is over, however it ended.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return None
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and self._probe is None:
+                self._probe = object()
+                return self._probe
+        _record(rejected=1)
+        raise CircuitOpenError("Gemini is temporarily unavailable, please try again shortly.")
+
+    def release(self, probe):
+        """
+        End a probe that recorded no outcome (cancelled, abandoned stream,
+        queue timeout), so the next call probes instead of being rejected.
+        """
+        if probe is None:
+            return
+        with self._lock:
+            if self._probe is probe:
+                self._probe = None
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe = None
+
+    def record_failure(self, exc):
+        # Only outages count; bad requests and throttling say nothing about Gemini's health
+        if not _is_outage(exc):
+            with self._lock:
+                self._probe = None
+            return
+        with self._lock:
+            self._failures += 1
+            self._probe = None
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Gemini circuit opened after %s failures", self._failures)
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+# ---------------- RETRIES ---------------- #
+def api_status(exc):
+    """HTTP status of a Gemini API error, else None."""
+    # google-genai is imported lazily (documents/llm.py); an APIError means it is loaded
+    errors = sys.modules.get("google.genai.errors")
+    return exc.code if errors is not None and isinstance(exc, errors.APIError) else None
+
+
+def _is_outage(exc):
+    status = api_status(exc)
+    if status is not None:
+        return status >= 500
+    return isinstance(exc, (httpx.TransportError, TimeoutError))
+
+
+def _is_retryable(exc):
+    return api_status(exc) in RETRYABLE_STATUS or _is_outage(exc)
+
+
+def _backoff(attempt):
+    # Full jitter: spreads retries of calls that failed together
+    return random.uniform(0, min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or 0
+
+
+# ---------------- GATEWAY ---------------- #
+class Gateway:
+    def __init__(self):
+        self.scheduler = FairScheduler(settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_TOKENS_PER_MINUTE)
+        self.breaker = CircuitBreaker(settings.LLM_CIRCUIT_FAILURES, settings.LLM_CIRCUIT_COOLDOWN)
+
+    def _shared(self):
+        return settings.LLM_RATE_LIMIT_BACKEND == "database"
+
+    def admit(self, tokens, user=None):
+        user = current_user() if user is None else user
+        started = time.monotonic()
+        waiter = _ThreadWaiter()
+        throttled = not self.scheduler.submit(tokens, user, waiter)
+        if throttled:
+            if not waiter.wait(settings.LLM_MAX_QUEUE_WAIT):
+                waiter.cancelled = True
+                _record(rejected=1)
+                raise QueueTimeoutError("Too many Gemini requests are queued, please try again shortly.")
+        if self._shared():
+            delay = _shared_wait(tokens)
+            throttled = throttled or delay > 0
+            time.sleep(delay)
+        _record_wait(time.monotonic() - started, throttled)
+
+    async def aadmit(self, tokens, user=None):
+        user = current_user() if user is None else user
+        started = time.monotonic()
+        waiter = _AsyncWaiter()
+        throttled = not self.scheduler.submit(tokens, user, waiter)
+        if throttled:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), settings.LLM_MAX_QUEUE_WAIT)
+            except asyncio.TimeoutError:
+                waiter.cancelled = True
+                _record(rejected=1)
+                raise QueueTimeoutError("Too many Gemini requests are queued, please try again shortly.")
+            except asyncio.CancelledError:
+                waiter.cancelled = True
+                raise
+        if self._shared():
+            delay = await sync_to_async(_shared_wait)(tokens)
+            throttled = throttled or delay > 0
+            await asyncio.sleep(delay)
+        _record_wait(time.monotonic() - started, throttled)
+
+    def _failed(self, exc, attempt):
+        """Record a failed attempt; True when it should be retried."""
+        self.breaker.record_failure(exc)
+        if api_status(exc) == 429:
+            _record(rate_limited=1)
+            self.scheduler.drain()
+        if attempt < settings.LLM_MAX_RETRIES and _is_retryable(exc):
+            _record(retries=1)
+            return True
+        _record(failures=1)
+        return False
+
+    def _succeeded(self, tokens, response):
+        self.breaker.record_success()
+        used = _usage(response)
+        _record(tokens_estimated=tokens, tokens_used=used or tokens)
+        if used:
+            self.scheduler.settle(tokens, used)
+
+    # Each attempt releases its probe in a finally: a probe cancelled or
+    # abandoned before it recorded an outcome (the BaseExceptions
+    # CancelledError and GeneratorExit, or QueueTimeoutError from admission)
+    # would otherwise keep the circuit half-open, rejecting every later call.
+
+    def call(self, fn, tokens, user=None):
+        """fn() under admission control and retries; tokens is the estimated cost."""
+        for attempt in itertools.count():
+            probe = self.breaker.before_call()
+            try:
+                self.admit(tokens, user)
+                _record(requests=1)
+                try:
+                    response = fn()
+                except Exception as e:
+                    if not self._failed(e, attempt):
+                        raise
+                    time.sleep(_backoff(attempt))
+                    continue
+                self._succeeded(tokens, response)
+                return response
+            finally:
+                self.breaker.release(probe)
+
+    async def acall(self, fn, tokens, user=None):
+        for attempt in itertools.count():
+            probe = self.breaker.before_call()
+            try:
+                await self.aadmit(tokens, user)
+                _record(requests=1)
+                try:
+                    response = await fn()
+                except Exception as e:
+                    if not self._failed(e, attempt):
+                        raise
+                    await asyncio.sleep(_backoff(attempt))
+                    continue
+                self._succeeded(tokens, response)
+                return response
+            finally:
+                self.breaker.release(probe)
+
+    async def astream(self, open_stream, tokens, user=None):
+        """Yield chunks of await open_stream(); retried only until the first chunk arrives."""
+        for attempt in itertools.count():
+            probe = self.breaker.before_call()
+            try:
+                await self.aadmit(tokens, user)
+                _record(requests=1)
+                started = False
+                last = None
+                try:
+                    async for chunk in await open_stream():
+                        started = True
+                        last = chunk
+                        yield chunk
+                except Exception as e:
+                    if started:
+                        # Part of the answer was already yielded; it can't be replayed
+                        self.breaker.record_failure(e)
+                        _record(failures=1)
+                        raise
+                    if not self._failed(e, attempt):
+                        raise
+                    await asyncio.sleep(_backoff(attempt))
+                    continue
+                self._succeeded(tokens, last)
+                return
+            finally:
+                self.breaker.release(probe)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = Gateway()
+    return _gateway
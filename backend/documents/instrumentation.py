@@ -0,0 +1,208 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+
+# Per-stage timing for the document pipeline. Code wraps a stage in
+#   with span("download", file_type=".pdf") as s:
+#       ...
+#       s.record(bytes=n)
+# which feeds Prometheus histograms (rendered by MetricsView at /metrics) and,
+# inside a request, the Server-Timing header added by ServerTimingMiddleware.
+# With METRICS_ENABLED off, span() hands back a shared no-op object.
+#
+# Metrics live in each process; scrape every worker (or run one per pod).
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+PAGE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+CHAR_BUCKETS = (1e2, 1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 1e7)
+
+
+# ---------------- REGISTRY ---------------- #
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (plus overflow); made cumulative when rendered
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(s[0]), s[1], s[2]) for key, s in sorted(self._series.items())]
+        for values, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, values, [('le', _number(bound))])} {cumulative}"
+                )
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "intellicore_stage_duration_seconds", "Time spent in a pipeline stage.", STAGE_BUCKETS, ("stage", "file_type")
+)
+DOCUMENT_BYTES = Histogram(
+    "intellicore_document_bytes", "Size of downloaded documents.", BYTE_BUCKETS, ("file_type",)
+)
+DOCUMENT_PAGES = Histogram(
+    "intellicore_document_pages", "Pages parsed per document.", PAGE_BUCKETS, ("file_type",)
+)
+DOCUMENT_CHARS = Histogram(
+    "intellicore_document_chars", "Characters of text extracted per document.", CHAR_BUCKETS, ("file_type",)
+)
+HISTOGRAMS = [STAGE_SECONDS, DOCUMENT_BYTES, DOCUMENT_PAGES, DOCUMENT_CHARS]
+
+
+# ---------------- SPANS ---------------- #
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class Span:
+    __slots__ = ("stage", "file_type", "started")
+
+    def __init__(self, stage, file_type):
+        self.stage = stage
+        self.file_type = file_type
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, self.stage, self.file_type)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.stage, elapsed))
+
+    def record(self, bytes=None, pages=None, chars=None):
+        if bytes is not None:
+            DOCUMENT_BYTES.observe(bytes, self.file_type)
+        if pages is not None:
+            DOCUMENT_PAGES.observe(pages, self.file_type)
+        if chars is not None:
+            DOCUMENT_CHARS.observe(chars, self.file_type)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+    def record(self, bytes=None, pages=None, chars=None):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage, file_type=""):
+    """Time a pipeline stage (a context manager); see the module comment."""
+    if not settings.METRICS_ENABLED:
+        return _NOOP
+    return Span(stage, file_type)
+
+
+# ---------------- SERVER-TIMING ---------------- #
+def start_request_timings():
+    """Collect spans finished in this context; returns a token for stop_request_timings."""
+    return _request_timings.set([])
+
+
+def stop_request_timings(token):
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings, total):
+    """Server-Timing value: one entry per stage (durations summed), plus the total."""
+    stages = {}
+    for stage, elapsed in timings:
+        summed, count = stages.get(stage, (0.0, 0))
+        stages[stage] = (summed + elapsed, count + 1)
+    entries = []
+    for stage, (summed, count) in stages.items():
+        entry = f"{stage};dur={summed * 1000:.1f}"
+        if count > 1:
+            entry += f';desc="{count} calls"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+# ---------------- EXPOSITION ---------------- #
+def _counter_lines(name, documentation, value, kind="counter"):
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+def render_metrics():
+    """All metrics of this process in the Prometheus text format."""
+    from .gateway import gateway_stats
+    from .llm import cache_stats
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+
+    cache = cache_stats()
+    for name in ("hits", "misses", "bypassed"):
+        lines.extend(_counter_lines(f"intellicore_llm_cache_{name}_total", f"Gemini response cache {name}.", cache[name]))
+
+    gateway = gateway_stats()
+    for name in ("requests", "retries", "failures", "rate_limited", "throttled", "rejected"):
+        lines.extend(_counter_lines(f"intellicore_gemini_{name}_total", f"Gemini gateway calls: {name}.", gateway[name]))
+    lines.extend(_counter_lines(
+        "intellicore_gemini_queue_wait_seconds_total", "Time Gemini calls spent waiting for admission.",
+        gateway["queue_wait_seconds_total"],
+    ))
+    lines.extend(_counter_lines(
+        "intellicore_gemini_queue_wait_seconds_max", "Longest admission wait so far.",
+        gateway["queue_wait_seconds_max"], kind="gauge",
+    ))
+    lines.extend(_counter_lines(
+        "intellicore_gemini_tokens_used_total", "Gemini tokens reported used.", gateway["tokens_used"]
+    ))
+    lines.extend(_counter_lines("intellicore_gemini_queued", "Gemini calls waiting now.", gateway["queued"], kind="gauge"))
+    lines.extend(_counter_lines(
+        "intellicore_gemini_circuit_open", "1 while the Gemini circuit breaker is open.",
+        int(gateway["circuit"] != "closed"), kind="gauge",
+    ))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .gateway import api_status, get_gateway
+from .instrumentation import span
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+
+# ---------------- CLIENTS ---------------- #
+# google-genai takes most of a worker's import time, so it is only imported
+# (and the clients built) on the first Gemini call. Clients are kept for the
+# life of the process so their HTTP connections are reused.
+_clients = {}
+_aio_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _new_client():
+    # ✅ Gemini
+    from google import genai
+    from google.genai import types
+
+    # GEMINI_BASE_URL points the client at a stand-in server for load tests
+    base_url = os.environ.get("GEMINI_BASE_URL")
+    http_options = types.HttpOptions(base_url=base_url) if base_url else None
+    return genai.Client(api_key=os.environ.get("GEMINI_API_KEY"), http_options=http_options)
+
+
+def get_client():
+    """The sync Gemini client of this process, created on first use."""
+    # Keyed by pid: a forked worker must not share its parent's connections
+    pid = os.getpid()
+    client = _clients.get(pid)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(pid)
+            if client is None:
+                client = _clients[pid] = _new_client()
+    return client
+
+
+def reset_clients():
+    """Forget all clients, so the next calls build new ones (after GEMINI_* variables change)."""
+    with _clients_lock:
+        _clients.clear()
+        _aio_clients.clear()
+
+
+def _aio_models():
+    """
+    Async models API bound to the running event loop. Under ASGI there is a
+    single loop per worker; under WSGI/runserver each async view runs on a
+    fresh loop, and pooled connections from a closed loop cannot be reused.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _aio_clients.get(id(loop))
+    if entry is None or entry[0] is not loop:
+        for key, (old_loop, _) in list(_aio_clients.items()):
+            if old_loop.is_closed():
+                del _aio_clients[key]
+        entry = (loop, _new_client().aio.models)
+        _aio_clients[id(loop)] = entry
+    return entry[1]
+
+
+def is_rate_limited(exc):
+    """True for Gemini quota / rate-limit errors (HTTP 429)."""
+    return api_status(exc) == 429
+
+
+def user_content(prompt):
+    from google.genai import types
+
+    return [types.Content(role="user", parts=[types.Part(text=prompt)])]
+
+
+# ---------------- TOKEN COUNTING ---------------- #
+_TOKEN_PIECE = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+
+def count_tokens(text):
+    """
+    Local estimate of Gemini tokens in text, without an API round trip:
+    about four characters per token for Latin words and numbers, one per
+    punctuation mark or non-Latin character (Devanagari, CJK, emoji).
+    """
+    if not text:
+        return 0
+    return sum(
+        (len(piece) + 3) // 4 if piece[0].isascii() and piece[0].isalnum() else 1
+        for piece in _TOKEN_PIECE.findall(text)
+    )
+
+
+# ---------------- RESPONSE CACHE ---------------- #
+CACHE_ALIAS = "llm"
+_WHITESPACE = re.compile(r"\s+")
+
+_stats = {"hits": 0, "misses": 0, "bypassed": 0}
+_stats_lock = threading.Lock()
+
+
+def normalize_prompt(prompt):
+    """
+    Prompt text as used in the cache key: Unicode-normalized with whitespace
+    runs collapsed, so re-indented templates and stray spaces or newlines in
+    a question map to the same entry.
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", prompt)).strip()
+
+
+def cache_key(prompt, model=DEFAULT_MODEL, config=None):
+    payload = json.dumps(
+        {"model": model, "prompt": normalize_prompt(prompt), "config": config or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return "gemini:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    """Hit/miss/bypass counters for this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _cache_lookup(key, use_cache):
+    """Cached text for key, or None; records the hit, miss or bypass."""
+    if not (use_cache and settings.LLM_CACHE_ENABLED):
+        _count("bypassed")
+        return None
+    text = caches[CACHE_ALIAS].get(key)
+    _count("hits" if text is not None else "misses")
+    return text
+
+
+async def _acache_lookup(key, use_cache):
+    if not (use_cache and settings.LLM_CACHE_ENABLED):
+        _count("bypassed")
+        return None
+    text = await caches[CACHE_ALIAS].aget(key)
+    _count("hits" if text is not None else "misses")
+    return text
+
+
+def _cache_store(key, text):
+    # A bypass still refreshes the entry; empty responses are never cached
+    if text and settings.LLM_CACHE_ENABLED:
+        caches[CACHE_ALIAS].set(key, text)
+
+
+async def _acache_store(key, text):
+    if text and settings.LLM_CACHE_ENABLED:
+        await caches[CACHE_ALIAS].aset(key, text)
+
+
+# ---------------- GENERATION ---------------- #
+def _config(config):
+    if not config:
+        return None
+    from google.genai import types
+
+    return types.GenerateContentConfig(**config)
+
+
+def estimate_cost(prompt, config=None):
+    """Tokens a call is charged against the rate limit before Gemini reports actual usage."""
+    output = (config or {}).get("max_output_tokens") or settings.LLM_EXPECTED_OUTPUT_TOKENS
+    return count_tokens(prompt) + output
+
+
+def generate_text(prompt, model=DEFAULT_MODEL, config=None, use_cache=True, user=None):
+    """
+    Single-turn Gemini call; returns the response text or None. config holds
+    GenerateContentConfig fields (temperature, ...). Responses are cached on
+    (model, normalized prompt, config); use_cache=False skips the lookup.
+    Calls go through the gateway (rate limits, retries, circuit breaker),
+    queued fairly per user (default: documents.gateway.llm_user).
+    """
+    key = cache_key(prompt, model, config)
+    text = _cache_lookup(key, use_cache)
+    if text is not None:
+        return text
+
+    with span("gemini"):
+        response = get_gateway().call(
+            lambda: get_client().models.generate_content(
+                model=model, contents=user_content(prompt), config=_config(config)
+            ),
+            estimate_cost(prompt, config),
+            user,
+        )
+    text = getattr(response, "text", None)
+    _cache_store(key, text)
+    return text
+
+
+async def agenerate_text(prompt, model=DEFAULT_MODEL, config=None, use_cache=True, user=None):
+    """Async generate_text on the aio client, so waiting on Gemini doesn't hold a thread."""
+    key = cache_key(prompt, model, config)
+    text = await _acache_lookup(key, use_cache)
+    if text is not None:
+        return text
+
+    models = _aio_models()
+    with span("gemini"):
+        response = await get_gateway().acall(
+            lambda: models.generate_content(model=model, contents=user_content(prompt), config=_config(config)),
+            estimate_cost(prompt, config),
+            user,
+        )
+    text = getattr(response, "text", None)
+    await _acache_store(key, text)
+    return text
+
+
+async def astream_text(prompt, model=DEFAULT_MODEL, config=None, use_cache=True, user=None):
+    """
+    Yield response text fragments as Gemini streams them. A cached response
+    is yielded as a single fragment; a completed stream is cached.
+    """
+    key = cache_key(prompt, model, config)
+    text = await _acache_lookup(key, use_cache)
+    if text is not None:
+        yield text
+        return
+
+    models = _aio_models()
+    stream = get_gateway().astream(
+        lambda: models.generate_content_stream(model=model, contents=user_content(prompt), config=_config(config)),
+        estimate_cost(prompt, config),
+        user,
+    )
+    parts = []
+    async for chunk in stream:
+        text = getattr(chunk, "text", None)
+        if text:
+            parts.append(text)
+            yield text
+    await _acache_store(key, "".join(parts))
@@ -0,0 +1,465 @@
+import asyncio
+import datetime
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import cloudinary
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from documents import llm
+from documents.benchmarking import FORMATS, SIZES, CloudinaryStandIn, FakeGemini, build_corpus
+from documents.extraction import extract_text_from_file
+from documents.gateway import gateway_stats
+from documents.summarize import MODE_AUTO, MODES
+
+from .loadtest import percentile
+
+RESULTS_VERSION = 1
+
+# Metrics compared by --compare, and whether bigger is better
+COMPARED = {
+    "extraction": (("mb_per_s", True), ("peak_python_mb", False), ("write_syscalls", False)),
+    "summarize": (("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("throughput_rps", True)),
+}
+
+
+def _split(value, cast=str):
+    try:
+        return [cast(part.strip()) for part in value.split(",") if part.strip()]
+    except ValueError as e:
+        raise CommandError(f"Invalid option: {e}")
+
+
+def _maxrss_mb(who):
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(who).ru_maxrss
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _io_counters():
+    """Syscall and block-device counters of this process (Linux only, else None)."""
+    try:
+        with open("/proc/self/io", encoding="ascii") as f:
+            return {key: int(value) for key, value in (line.split(": ") for line in f)}
+    except OSError:
+        return None
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        )
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ---------------- EXTRACTION ---------------- #
+# Placeholder account for the Cloudinary stand-in; the SDK refuses to build URLs without one
+CLOUD_NAME = "benchmark"
+
+
+def _file_url(cdn, name, version=1):
+    return f"{cdn.base_url}/{CLOUD_NAME}/raw/upload/v{version}/documents/{name}"
+
+
+def bench_extraction(cdn, files, repeats):
+    """Download + parse throughput per file, then the Python heap peak of one inline parse."""
+    results = []
+    for entry in files:
+        url = _file_url(cdn, entry["name"])
+        chars = len(extract_text_from_file(url))  # warm-up (and pool start-up)
+        timings = []
+        io_before = _io_counters()
+        for _ in range(repeats):
+            started = time.perf_counter()
+            extract_text_from_file(url)
+            timings.append(time.perf_counter() - started)
+        io_after = _io_counters()
+
+        # Parse in this process so tracemalloc sees the parser's allocations
+        with override_settings(EXTRACTION_PARSE_PROCESSES=0):
+            tracemalloc.start()
+            extract_text_from_file(url)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        best = min(timings)
+        io = {}
+        if io_before and io_after:
+            # Per extraction; includes the stand-in server's threads, not the parse processes
+            io = {
+                "read_syscalls": round((io_after["syscr"] - io_before["syscr"]) / repeats),
+                "write_syscalls": round((io_after["syscw"] - io_before["syscw"]) / repeats),
+                "disk_write_bytes": round((io_after["write_bytes"] - io_before["write_bytes"]) / repeats),
+            }
+        results.append({
+            "format": entry["format"],
+            "size": entry["size"],
+            "bytes": entry["bytes"],
+            "chars": chars,
+            "repeats": repeats,
+            "best_ms": round(best * 1000, 2),
+            "median_ms": round(percentile(timings, 50) * 1000, 2),
+            "mb_per_s": round(entry["bytes"] / best / 1e6, 2),
+            "chars_per_s": round(chars / best),
+            "peak_python_mb": round(peak / 1e6, 2),
+            **io,
+        })
+    return results
+
+
+# ---------------- END-TO-END SUMMARIZE ---------------- #
+def _create_documents(user, cdn, files, count, offset):
+    from documents.models import Document
+
+    # A fresh version per document: every request downloads and parses cold
+    documents = [
+        Document(user=user, file=f"raw/upload/v{offset + i + 1}/documents/{files[i % len(files)]['name']}")
+        for i in range(count)
+    ]
+    return [document.id for document in Document.objects.bulk_create(documents)]
+
+
+class AppServer:
+    """This project's ASGI app under uvicorn on a free localhost port, served from a daemon thread."""
+
+    def __init__(self):
+        import uvicorn
+        from django.core.asgi import get_asgi_application
+
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        config = uvicorn.Config(get_asgi_application(), lifespan="off", log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(
+            target=self.server.run, kwargs={"sockets": [self.socket]}, name="benchmark-asgi", daemon=True
+        )
+
+    @property
+    def base_url(self):
+        host, port = self.socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise CommandError("The benchmark ASGI server did not start.")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+        self.socket.close()
+
+
+async def _summarize_level(url, headers, document_ids, concurrency, mode):
+    latencies = []
+    errors = []
+    pending = iter(document_ids)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(headers=headers, timeout=600, limits=limits) as client:
+        async def worker():
+            for document_id in pending:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json={"files": [document_id], "mode": mode})
+                    if response.status_code != 200:
+                        errors.append(f"{response.status_code}: {response.text[:200]}")
+                except httpx.HTTPError as e:
+                    errors.append(repr(e))
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(document_ids),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(document_ids) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def bench_summarize(cdn, files, levels, per_level, mode):
+    """POST /documents/summarize/ to the ASGI app (full middleware stack) at each concurrency level."""
+    from django.contrib.auth import get_user_model
+    from rest_framework.authtoken.models import Token
+
+    user = get_user_model().objects.create_user(email="benchmark@example.com", password=None)
+    headers = {"Authorization": f"Token {Token.objects.create(user=user).key}"}
+
+    # Unmeasured warm-up (parse pool start-up, Gemini client creation): one request per file
+    warmup = _create_documents(user, cdn, files, len(files), 0)
+    batches = []
+    offset = len(files)
+    for level in levels:
+        total = per_level or level * 4
+        batches.append((level, _create_documents(user, cdn, files, total, offset)))
+        offset += total
+
+    # Every request calls Gemini (the corpus repeats, so cached answers would hide it);
+    # follow-up jobs are only queued, as with a separate process_jobs worker
+    with override_settings(LLM_CACHE_ENABLED=False, BACKGROUND_WORKER_IN_PROCESS=False), AppServer() as app:
+        url = f"{app.base_url}/documents/summarize/"
+
+        async def run_levels():
+            await _summarize_level(url, headers, warmup, 1, mode)
+            return [await _summarize_level(url, headers, ids, level, mode) for level, ids in batches]
+
+        return asyncio.run(run_levels())
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline benchmark of the document pipeline: per-format extraction throughput and memory, "
+        "and end-to-end /documents/summarize/ latency under concurrency. Uses a generated corpus, "
+        "a local Cloudinary stand-in and a fake Gemini server; rows go to a throwaway test database. "
+        "Write results with --output and diff two runs with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--formats", default=",".join(FORMATS), help="Comma-separated extensions.")
+        parser.add_argument("--sizes", default="small,medium,large", help=f"Any of: {', '.join(SIZES)}.")
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the corpus sizes.")
+        parser.add_argument("--repeats", type=int, default=5, help="Timed extractions per file.")
+        parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated summarize concurrency levels.")
+        parser.add_argument(
+            "--requests", type=int, default=0,
+            help="Summarize requests per level (default: 4x the concurrency level).",
+        )
+        parser.add_argument("--summarize-size", default="medium", help="Corpus size used for summarize requests.")
+        parser.add_argument("--mode", default=MODE_AUTO, choices=MODES, help="Summary mode sent with each request.")
+        parser.add_argument("--latency", type=float, default=0.5, help="Fake Gemini latency per call, seconds.")
+        parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency up to this, seconds.")
+        parser.add_argument(
+            "--keep-rate-limits", action="store_true",
+            help="Throttle fake Gemini calls with LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE as configured.",
+        )
+        parser.add_argument("--skip-extraction", action="store_true")
+        parser.add_argument("--skip-summarize", action="store_true")
+        parser.add_argument("--corpus-dir", help="Keep the generated corpus here (default: a temp dir).")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--compare", help="Earlier --output file to compare against.")
+        parser.add_argument(
+            "--threshold", type=float, default=10.0,
+            help="With --compare, exit non-zero when a metric is worse by more than this percent.",
+        )
+
+    def handle(self, *args, **options):
+        formats = _split(options["formats"])
+        sizes = _split(options["sizes"])
+        levels = _split(options["concurrency"], int)
+        unknown = [s for s in sizes + [options["summarize_size"]] if s not in SIZES]
+        unknown += [f for f in formats if f not in FORMATS]
+        if unknown:
+            raise CommandError(f"Unknown size or format: {', '.join(unknown)}")
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        with tempfile.TemporaryDirectory(prefix="intellicore-bench-") as scratch:
+            corpus_dir = options["corpus_dir"] or scratch
+            corpus_sizes = list(dict.fromkeys(sizes + [options["summarize_size"]]))
+            files = build_corpus(corpus_dir, sizes=corpus_sizes, formats=formats, scale=options["scale"])
+            results = self._run(options, files, corpus_dir, levels, scratch)
+
+        report = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(report + "\n")
+        self._print(results)
+
+        failed = [row for row in results["summarize"] if row["requests"] and row["errors"] == row["requests"]]
+        if failed:
+            raise CommandError(
+                f"⚠️ Every summarize request failed at concurrency "
+                f"{', '.join(str(row['concurrency']) for row in failed)}: {failed[0]['first_error']}"
+            )
+        if baseline is not None and self._compare(baseline, results, options["threshold"]):
+            raise CommandError(f"⚠️ Slower than {options['compare']} by more than {options['threshold']}%.")
+
+    def _run(self, options, files, corpus_dir, levels, scratch):
+        results = {
+            "version": RESULTS_VERSION,
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "database": connection.vendor,
+                "options": {
+                    key: options[key] for key in (
+                        "formats", "sizes", "scale", "repeats", "concurrency", "requests",
+                        "summarize_size", "mode", "latency", "jitter", "keep_rate_limits",
+                    )
+                },
+                "settings": {
+                    "EXTRACTION_PARSE_PROCESSES": settings.EXTRACTION_PARSE_PROCESSES,
+                    "EXTRACTION_DOWNLOAD_THREADS": settings.EXTRACTION_DOWNLOAD_THREADS,
+                    "PDF_TEXT_BACKEND": settings.PDF_TEXT_BACKEND,
+                    "SUMMARY_MAP_CONCURRENCY": settings.SUMMARY_MAP_CONCURRENCY,
+                    "LLM_REQUESTS_PER_MINUTE": settings.LLM_REQUESTS_PER_MINUTE,
+                },
+            },
+            "corpus": files,
+            "extraction": [],
+            "summarize": [],
+        }
+        measured = [f for f in files if f["size"] in _split(options["sizes"])]
+        summarize_files = [f for f in files if f["size"] == options["summarize_size"]]
+
+        with CloudinaryStandIn(corpus_dir) as cdn, FakeGemini(options["latency"], options["jitter"]) as gemini:
+            # Delivery URLs of CloudinaryField values now point at the stand-in
+            cloudinary_config = cloudinary.config()
+            previous = cloudinary_config.__dict__.copy()
+            cloudinary.config(
+                cloud_name=CLOUD_NAME, api_key="benchmark", api_secret="benchmark",
+                cname=cdn.netloc, secure=False, private_cdn=False,
+            )
+            previous_base_url = os.environ.get("GEMINI_BASE_URL")
+            os.environ["GEMINI_BASE_URL"] = gemini.base_url
+            os.environ.setdefault("GEMINI_API_KEY", "benchmark")  # the fake accepts any key
+            # Clients read the variables when they are created
+            llm.reset_clients()
+            # The fake has no quota: unless asked, lift the gateway limits (read when it is first used)
+            limits = {} if options["keep_rate_limits"] else {
+                "LLM_REQUESTS_PER_MINUTE": 0, "LLM_TOKENS_PER_MINUTE": 0, "LLM_RATE_LIMIT_BACKEND": "process",
+            }
+            try:
+                if not options["skip_extraction"]:
+                    self.stderr.write("Measuring extraction...")
+                    results["extraction"] = bench_extraction(cdn, measured, options["repeats"])
+                if not options["skip_summarize"]:
+                    self.stderr.write("Measuring end-to-end summarize...")
+                    with override_settings(**limits):
+                        results["summarize"] = self._with_test_database(
+                            scratch, bench_summarize,
+                            cdn, summarize_files, levels, options["requests"], options["mode"],
+                        )
+            finally:
+                llm.reset_clients()
+                if previous_base_url is None:
+                    os.environ.pop("GEMINI_BASE_URL", None)
+                else:
+                    os.environ["GEMINI_BASE_URL"] = previous_base_url
+                cloudinary_config.__dict__.clear()
+                cloudinary_config.__dict__.update(previous)
+
+            gateway = gateway_stats()
+            results["gateway"] = {
+                key: gateway[key] for key in ("requests", "retries", "throttled", "queue_wait_seconds_total")
+            }
+            results["servers"] = {
+                "cdn_requests": cdn.requests,
+                "cdn_bytes": cdn.bytes_sent,
+                "gemini_requests": gemini.requests,
+                "gemini_prompt_tokens": gemini.prompt_tokens,
+            }
+
+        results["memory"] = {
+            "maxrss_mb": _maxrss_mb(resource.RUSAGE_SELF),
+            "children_maxrss_mb": _maxrss_mb(resource.RUSAGE_CHILDREN),
+        }
+        return results
+
+    def _with_test_database(self, scratch, func, *args):
+        # Same isolation as manage.py test: nothing touches the configured database
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        if connection.vendor == "sqlite" and not test_settings.get("NAME"):
+            # A shared-cache in-memory database raises "table is locked" under concurrent requests
+            test_settings["NAME"] = os.path.join(scratch, "benchmark.sqlite3")
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            return func(*args)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def _print(self, results):
+        if results["extraction"]:
+            self.stdout.write(
+                f"{'format':>7} {'size':>7} {'KB':>8} {'best ms':>9} {'MB/s':>8} {'chars/s':>11} {'peak MB':>8} "
+                f"{'syscalls':>9} {'disk KB':>8}"
+            )
+            for row in results["extraction"]:
+                syscalls = row["read_syscalls"] + row["write_syscalls"] if "read_syscalls" in row else "-"
+                disk = round(row["disk_write_bytes"] / 1024) if "disk_write_bytes" in row else "-"
+                self.stdout.write(
+                    f"{row['format']:>7} {row['size']:>7} {row['bytes'] / 1024:>8.0f} {row['best_ms']:>9} "
+                    f"{row['mb_per_s']:>8} {row['chars_per_s']:>11} {row['peak_python_mb']:>8} {syscalls:>9} {disk:>8}"
+                )
+        if results["summarize"]:
+            self.stdout.write(
+                f"{'conc':>6} {'reqs':>6} {'errors':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+            )
+            for row in results["summarize"]:
+                self.stdout.write(
+                    f"{row['concurrency']:>6} {row['requests']:>6} {row['errors']:>6} {row['throughput_rps']:>9} "
+                    f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+                )
+                if row["first_error"]:
+                    self.stderr.write(f"⚠️ {row['first_error']}")
+            gateway = results["gateway"]
+            if gateway["throttled"]:
+                self.stderr.write(
+                    f"⚠️ {gateway['throttled']} Gemini calls waited {gateway['queue_wait_seconds_total']:.1f}s "
+                    "for the rate limiter (LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE)."
+                )
+        memory = results["memory"]
+        self.stdout.write(f"max RSS {memory['maxrss_mb']} MB (parse workers {memory['children_maxrss_mb']} MB)")
+
+    def _compare(self, baseline, results, threshold):
+        """Print per-metric changes against baseline; True when any got worse than threshold."""
+        keys = {"extraction": ("format", "size"), "summarize": ("concurrency",)}
+        regressed = False
+        self.stdout.write(f"\nCompared with {baseline.get('meta', {}).get('commit') or 'baseline'}:")
+        for section, metrics in COMPARED.items():
+            before = {tuple(row[k] for k in keys[section]): row for row in baseline.get(section, [])}
+            for row in results[section]:
+                key = tuple(row[k] for k in keys[section])
+                old = before.get(key)
+                if old is None:
+                    continue
+                for metric, higher_is_better in metrics:
+                    if not old.get(metric):
+                        continue
+                    change = (row[metric] - old[metric]) / old[metric] * 100
+                    worse = -change if higher_is_better else change
+                    flag = "⚠️" if worse > threshold else "  "
+                    regressed = regressed or worse > threshold
+                    label = "/".join(str(k) for k in key)
+                    self.stdout.write(
+                        f"{flag} {section:<10} {label:<14} {metric:<15} {old[metric]:>10} -> {row[metric]:>10} "
+                        f"({change:+.1f}%)"
+                    )
+        return regressed
@@ -0,0 +1,89 @@
+import itertools
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from documents.retrieval import VectorIndex
+
+from .loadtest import percentile
+
+
+def synthetic_passages(count, chars, seed=0):
+    """Deterministic pseudo-text passages drawn from a Zipf-like vocabulary."""
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10))) for _ in range(20000)
+    ]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    passages = []
+    for _ in range(count):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=chars // 4)
+        passages.append(" ".join(words)[:chars].rsplit(" ", 1)[0])
+    return passages
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure chat retrieval as documents grow: index build time, in-memory index size "
+        "and per-query latency (query embedding + top-k search) for synthetic passages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--passages", default="100,1000,10000",
+            help="Comma-separated passage counts (one index per count).",
+        )
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--embedder", default=None, help="Dotted path (default: settings.RAG_EMBEDDER).")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON lines.")
+
+    def handle(self, *args, **options):
+        try:
+            counts = [int(count) for count in options["passages"].split(",") if count.strip()]
+        except ValueError as e:
+            raise CommandError(f"Invalid option: {e}")
+
+        embedder = import_string(options["embedder"] or settings.RAG_EMBEDDER)()
+        k = settings.RAG_TOP_K
+
+        if not options["json"]:
+            self.stdout.write(
+                f"{'passages':>9} {'index MB':>9} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+            )
+
+        for count in counts:
+            passages = synthetic_passages(count, settings.RAG_CHUNK_CHARS)
+            started = time.perf_counter()
+            index = VectorIndex(embedder.name, passages, embedder.embed(passages))
+            build_s = time.perf_counter() - started
+
+            rng = random.Random(count)
+            latencies = []
+            for _ in range(options["queries"]):
+                words = rng.choice(passages).split()
+                start = rng.randrange(max(1, len(words) - 8))
+                query = " ".join(words[start:start + 8])
+                started = time.perf_counter()
+                index.search(embedder.embed([query])[0], k)
+                latencies.append(time.perf_counter() - started)
+
+            result = {
+                "passages": count,
+                "embedder": embedder.name,
+                "index_bytes": index.nbytes,
+                "build_s": round(build_s, 3),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            }
+            if options["json"]:
+                self.stdout.write(json.dumps(result))
+            else:
+                self.stdout.write(
+                    f"{count:>9} {index.nbytes / 1024 / 1024:>9.1f} {result['build_s']:>8} "
+                    f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8}"
+                )
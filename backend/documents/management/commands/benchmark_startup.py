@@ -0,0 +1,108 @@
+import datetime
+import json
+import platform
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.benchmarking import LAZY_MODULES, measure_startup
+
+from .benchmark_pipeline import _git_commit
+
+RESULTS_VERSION = 1
+
+# Metrics compared by --compare (all: smaller is better)
+COMPARED = ("wall_ms", "import_ms", "modules")
+
+
+class Command(BaseCommand):
+    help = (
+        "Start-up time of a Django worker (settings, URLconf and job worker imports) in fresh "
+        "interpreters under python -X importtime. Fails when a heavy dependency (Gemini SDK, "
+        "numpy, PDF/OCR/TTS libraries...) is imported at start-up instead of on first use. "
+        "Write results with --output and diff two runs with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters started; medians are reported.")
+        parser.add_argument("--top", type=int, default=15, help="Slowest top-level imports listed.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--compare", help="Earlier --output file to compare against.")
+        parser.add_argument(
+            "--threshold", type=float, default=10.0,
+            help="With --compare, exit non-zero when a metric is worse by more than this percent.",
+        )
+
+    def handle(self, *args, **options):
+        if options["runs"] < 1:
+            raise CommandError("--runs must be at least 1.")
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        runs = []
+        for run in range(options["runs"]):
+            self.stderr.write(f"Starting interpreter {run + 1}/{options['runs']}...")
+            try:
+                runs.append(measure_startup(settings.SETTINGS_MODULE, settings.BASE_DIR))
+            except RuntimeError as e:
+                raise CommandError(f"⚠️ {e}")
+
+        top = {}
+        for name in runs[0]["top"]:
+            top[name] = round(statistics.median(r["top"].get(name, 0) for r in runs), 1)
+        results = {
+            "version": RESULTS_VERSION,
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "settings_module": settings.SETTINGS_MODULE,
+                "runs": options["runs"],
+            },
+            "wall_ms": round(statistics.median(r["wall_ms"] for r in runs), 1),
+            "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+            "modules": max(r["modules"] for r in runs),
+            "lazy_loaded": sorted({module for r in runs for module in r["lazy_loaded"]}),
+            "top": dict(sorted(top.items(), key=lambda item: item[1], reverse=True)[:options["top"]]),
+        }
+
+        report = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(report + "\n")
+        self._print(results)
+
+        if results["lazy_loaded"]:
+            raise CommandError(
+                f"⚠️ Imported at start-up: {', '.join(results['lazy_loaded'])}. "
+                f"These must only be imported on first use ({', '.join(LAZY_MODULES)})."
+            )
+        if baseline is not None and self._compare(baseline, results, options["threshold"]):
+            raise CommandError(f"⚠️ Slower than {options['compare']} by more than {options['threshold']}%.")
+
+    def _print(self, results):
+        self.stdout.write(f"{'import':<40} {'cumulative ms':>14}")
+        for name, ms in results["top"].items():
+            self.stdout.write(f"{name:<40} {ms:>14}")
+        self.stdout.write(
+            f"start-up {results['wall_ms']} ms, imports {results['import_ms']} ms, "
+            f"{results['modules']} modules (median of {results['meta']['runs']})"
+        )
+
+    def _compare(self, baseline, results, threshold):
+        """Print per-metric changes against baseline; True when any got worse than threshold."""
+        regressed = False
+        self.stdout.write(f"\nCompared with {baseline.get('meta', {}).get('commit') or 'baseline'}:")
+        for metric in COMPARED:
+            if not baseline.get(metric):
+                continue
+            change = (results[metric] - baseline[metric]) / baseline[metric] * 100
+            flag = "⚠️" if change > threshold else "  "
+            regressed = regressed or change > threshold
+            self.stdout.write(f"{flag} {metric:<10} {baseline[metric]:>10} -> {results[metric]:>10} ({change:+.1f}%)")
+        return regressed
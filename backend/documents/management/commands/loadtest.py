@@ -0,0 +1,105 @@
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_level(url, method, headers, payload, concurrency, total, timeout):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, headers=headers, json=payload)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test an endpoint at increasing concurrency and report throughput and latency "
+        "percentiles, e.g. to compare sync and ASGI workers. Start the server with "
+        "GEMINI_BASE_URL pointing at a stand-in Gemini server to keep quota out of it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Full URL, e.g. http://localhost:8000/documents/summaries/1/chat/")
+        parser.add_argument("--token", help="DRF auth token sent as 'Authorization: Token <token>'.")
+        parser.add_argument("--method", default="POST")
+        parser.add_argument("--payload", default="{}", help="JSON request body.")
+        parser.add_argument(
+            "--concurrency", default="1,10,50,100,200",
+            help="Comma-separated concurrency levels to run in order.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=0,
+            help="Requests per level (default: 4x the concurrency level).",
+        )
+        parser.add_argument("--timeout", type=float, default=120.0)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON lines.")
+
+    def handle(self, *args, **options):
+        try:
+            payload = json.loads(options["payload"])
+            levels = [int(level) for level in options["concurrency"].split(",") if level.strip()]
+        except ValueError as e:
+            raise CommandError(f"Invalid option: {e}")
+
+        headers = {}
+        if options["token"]:
+            headers["Authorization"] = f"Token {options['token']}"
+
+        if not options["json"]:
+            self.stdout.write(
+                f"{'conc':>6} {'reqs':>6} {'errors':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+            )
+
+        for level in levels:
+            total = options["requests"] or level * 4
+            result = asyncio.run(run_level(
+                options["url"], options["method"].upper(), headers, payload, level, total, options["timeout"]
+            ))
+            if options["json"]:
+                self.stdout.write(json.dumps(result))
+            else:
+                self.stdout.write(
+                    f"{result['concurrency']:>6} {result['requests']:>6} {result['errors']:>6} "
+                    f"{result['throughput_rps']:>9} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9}"
+                )
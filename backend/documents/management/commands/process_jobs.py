@@ -0,0 +1,41 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.tasks import work
+
+
+class Command(BaseCommand):
+    help = "Run a background worker that drains the database-backed job queue (text extraction, ...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process all runnable jobs and exit instead of polling forever.",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=None,
+            help="Jobs to run concurrently (default: settings.BACKGROUND_WORKER_THREADS).",
+        )
+
+    def handle(self, *args, **options):
+        threads = max(1, options["threads"] or settings.BACKGROUND_WORKER_THREADS)
+        self.stdout.write(f"Processing background jobs with {threads} thread(s)...")
+        stop_event = threading.Event()
+        workers = [
+            threading.Thread(target=work, kwargs={"stop_event": stop_event, "once": options["once"]}, daemon=True)
+            for _ in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(timeout=1)
+        except KeyboardInterrupt:
+            stop_event.set()
+        self.stdout.write(self.style.SUCCESS("Worker stopped."))
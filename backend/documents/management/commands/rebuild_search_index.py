@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from documents.models import Document, SummarizationSession
+from documents.search import update_document_entry, update_session_entry
+
+
+class Command(BaseCommand):
+    help = "(Re)build search entries for existing documents and summaries, e.g. after enabling search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only index this user id.")
+
+    def handle(self, *args, **options):
+        documents = Document.objects.all()
+        sessions = SummarizationSession.objects.all()
+        if options["user"]:
+            documents = documents.filter(user_id=options["user"])
+            sessions = sessions.filter(user_id=options["user"])
+
+        for document in documents.iterator():
+            update_document_entry(document)
+        for session in sessions.iterator():
+            update_session_entry(session)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Indexed {documents.count()} documents and {sessions.count()} summaries")
+        )
@@ -0,0 +1,151 @@
+from lxml import etree
+
+# Text of HTML and XML files without building a document tree. The file is
+# fed to lxml in chunks with a parser target (SAX-style callbacks), so memory
+# stays constant however large the file is, and parsing stops as soon as
+# max_chars characters of text are available.
+#
+# HTML keeps its structure as plain text: headings become "#" lines, list
+# items "- " lines, table cells are separated by " | ". Boilerplate (scripts,
+# styles, navigation, forms...) is dropped. Other XML gets one line per
+# element with text.
+#
+# No Django imports: runs in the extraction process pool like parsers.py.
+
+FEED_BYTES = 64 * 1024
+
+# Elements whose whole content is dropped
+SKIP_TAGS = {
+    "script", "style", "noscript", "template", "nav", "aside", "footer", "form",
+    "iframe", "svg", "canvas", "button", "select", "textarea", "object", "embed",
+}
+SKIP_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search"}
+
+# Elements that start a new line of text
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "body", "br", "caption", "dd", "details", "div", "dl", "dt",
+    "figcaption", "figure", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "ol",
+    "p", "pre", "section", "summary", "table", "tbody", "thead", "tfoot", "title", "tr", "ul",
+}
+HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+CELL_TAGS = {"td", "th"}
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class TextTarget:
+    """lxml parser target collecting the text of the document as lines."""
+
+    def __init__(self, html=True, max_chars=None):
+        self.html = html
+        self.max_chars = max_chars
+        self.lines = []
+        self.total = 0
+        self.parts = []
+        self.prefix = ""
+        self.skip_depth = 0
+        self.pre_depth = 0
+        self.stack = []
+
+    def _local(self, tag):
+        if not isinstance(tag, str):
+            return ""
+        if tag.startswith("{"):  # namespaced (XHTML, XML exports)
+            tag = tag.rsplit("}", 1)[1]
+        return tag.lower() if self.html else tag
+
+    def _flush(self):
+        text = "".join(self.parts)
+        self.parts = []
+        text = text.strip("\n") if self.pre_depth else " ".join(text.split())
+        if text:
+            line = self.prefix + text
+            self.lines.append(line)
+            self.total += len(line) + 1
+        self.prefix = ""
+        if self.max_chars is not None and self.total >= self.max_chars:
+            raise _StopParsing
+
+    def start(self, tag, attrib):
+        tag = self._local(tag)
+        skipped = self.skip_depth or (self.html and (
+            tag in SKIP_TAGS or attrib.get("role") in SKIP_ROLES
+            or "hidden" in attrib or attrib.get("aria-hidden") == "true"
+        ))
+        self.stack.append((tag, bool(skipped)))
+        if skipped:
+            self.skip_depth += 1
+            return
+        if not self.html or tag in BLOCK_TAGS:
+            self._flush()
+        if not self.html:
+            return
+        if tag in HEADINGS:
+            self.prefix = "#" * HEADINGS[tag] + " "
+        elif tag == "li":
+            self.prefix = "- "
+        elif tag in CELL_TAGS and self.parts:
+            self.parts.append(" | ")
+        elif tag == "pre":
+            self.pre_depth += 1
+
+    def end(self, tag):
+        tag, skipped = self.stack.pop() if self.stack else (self._local(tag), False)
+        if skipped:
+            self.skip_depth -= 1
+            return
+        if not self.html or tag in BLOCK_TAGS:
+            self._flush()
+        if tag == "pre" and self.html:
+            self.pre_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def close(self):
+        try:
+            self._flush()
+        except _StopParsing:
+            pass
+        return "\n".join(self.lines)
+
+
+def _looks_like_html(head):
+    head = head.lstrip()[:1024].lower()
+    return head.startswith((b"<!doctype html", b"<html")) or b"<html" in head
+
+
+def extract_markup_text(stream, html=True, max_chars=None):
+    """
+    Text of an HTML (html=True) or XML binary stream; see the module comment.
+    XHTML documents are read with the HTML rules.
+    """
+    first = stream.read(FEED_BYTES)
+    html = html or _looks_like_html(first)
+    target = TextTarget(html=html, max_chars=max_chars)
+    # huge_tree lifts libxml2's limits on nesting depth and text node size
+    # (10 MB), which otherwise cut large exports short; the target keeps
+    # memory flat, and entities are never expanded
+    if html:
+        parser = etree.HTMLParser(target=target, encoding="utf-8", no_network=True, huge_tree=True)
+    else:
+        # Never resolve entities or fetch DTDs: uploaded XML is untrusted
+        parser = etree.XMLParser(
+            target=target, recover=True, resolve_entities=False, no_network=True, load_dtd=False, huge_tree=True
+        )
+
+    chunk = first
+    try:
+        while chunk:
+            parser.feed(chunk)
+            chunk = stream.read(FEED_BYTES)
+    except _StopParsing:
+        pass
+    try:
+        text = parser.close()
+    except (etree.XMLSyntaxError, _StopParsing):
+        text = target.close()
+    return text[:max_chars] if max_chars is not None else text
@@ -0,0 +1,105 @@
+from django.conf import settings
+
+from .llm import count_tokens, generate_text
+from .models import SummarizationSession
+from .summarize import build_memory_prompt
+
+# Bounded chat memory. Each chat prompt carries the session's running digest
+# plus the newest messages that fit in CHAT_HISTORY_TOKENS, so its size stays
+# flat however long the conversation gets. When the messages not yet in the
+# digest outgrow that budget, a background job folds the oldest of them into
+# the digest (keeping half the budget verbatim, so it runs every few turns
+# rather than every turn).
+
+# Newest messages looked at when building a prompt
+SCAN_LIMIT = 200
+# Role label and separators around each replayed message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _history_start(session):
+    if session.memory_through_id is not None:
+        return session.memory_through_id
+    # The opening assistant message is the summary itself, already in the prompt
+    return session.messages.order_by("id").values_list("id", flat=True).first() or 0
+
+
+def pending_messages(session, limit=None):
+    """Messages not folded into the digest yet, oldest first (the newest `limit` of them)."""
+    messages = session.messages.filter(id__gt=_history_start(session)).order_by("-id").values("id", "role", "content")
+    if limit is not None:
+        messages = messages[:limit]
+    return list(messages)[::-1]
+
+
+def fit_recent(messages, budget):
+    """The longest run of newest messages whose tokens fit in budget."""
+    picked = []
+    used = 0
+    for message in reversed(messages):
+        used += _message_tokens(message)
+        if used > budget:
+            break
+        picked.append(message)
+    return picked[::-1]
+
+
+def chat_context(session):
+    """(digest, recent messages) for the next chat prompt of session."""
+    recent = fit_recent(pending_messages(session, limit=SCAN_LIMIT), settings.CHAT_HISTORY_TOKENS)
+    return session.memory_digest, recent
+
+
+def needs_compaction(session):
+    pending = pending_messages(session, limit=SCAN_LIMIT)
+    return sum(_message_tokens(m) for m in pending) > settings.CHAT_HISTORY_TOKENS
+
+
+# ---------------- COMPACTION ---------------- #
+def _clip(text, max_tokens):
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    cut = text[:len(text) * max_tokens // tokens]
+    return cut.rsplit("\n", 1)[0] if "\n" in cut else cut
+
+
+def compact(session):
+    """
+    Fold the oldest pending messages into session.memory_digest until the
+    rest fit in half of CHAT_HISTORY_TOKENS. Each Gemini call sees at most
+    CHAT_HISTORY_TOKENS of new messages, however far behind the digest is.
+    """
+    while True:
+        messages = pending_messages(session)
+        keep = fit_recent(messages, settings.CHAT_HISTORY_TOKENS // 2)
+        fold = messages[:len(messages) - len(keep)]
+        if not fold:
+            return session
+
+        batch = []
+        used = 0
+        for message in fold:
+            used += _message_tokens(message)
+            if batch and used > settings.CHAT_HISTORY_TOKENS:
+                break
+            batch.append(message)
+
+        max_words = settings.CHAT_DIGEST_TOKENS * 3 // 4
+        digest = generate_text(build_memory_prompt(session.memory_digest, batch, max_words), user=session.user_id)
+        if not digest:
+            raise RuntimeError("Gemini returned an empty memory digest.")
+        digest = _clip(digest.strip(), settings.CHAT_DIGEST_TOKENS)
+
+        # Only advance from the point this digest was built on
+        updated = SummarizationSession.objects.filter(
+            pk=session.pk, memory_through_id=session.memory_through_id
+        ).update(memory_digest=digest, memory_through_id=batch[-1]["id"])
+        if not updated:
+            return session  # another worker compacted this session meanwhile
+        session.memory_digest = digest
+        session.memory_through_id = batch[-1]["id"]
@@ -0,0 +1,45 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .instrumentation import server_timing_header, start_request_timings, stop_request_timings
+
+
+class ServerTimingMiddleware:
+    """Adds a Server-Timing header with the stage spans recorded while handling the request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        started = time.perf_counter()
+        token = start_request_timings()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = stop_request_timings(token)
+        response["Server-Timing"] = server_timing_header(timings, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        token = start_request_timings()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = stop_request_timings(token)
+        response["Server-Timing"] = server_timing_header(timings, time.perf_counter() - started)
+        return response
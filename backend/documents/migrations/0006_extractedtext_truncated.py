@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_document_extracted_at_document_extracted_text_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractedtext',
+            name='truncated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_extractedtext_truncated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioArtifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(max_length=10)),
+                ('summary_hash', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('generating', 'Generating'), ('ready', 'Ready'), ('failed', 'Failed')], default='generating', max_length=12)),
+                ('narration', models.TextField(blank=True, default='')),
+                ('narration_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('file_path', models.CharField(blank=True, default='', max_length=255)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audio_artifacts', to='documents.summarizationsession')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('session', 'language', 'summary_hash'), name='unique_audio_per_summary_language')],
+            },
+        ),
+    ]
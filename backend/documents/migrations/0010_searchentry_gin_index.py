@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+# The GIN index only exists on PostgreSQL; other databases search through
+# SearchPosting instead (see documents/search.py).
+def create_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS searchentry_vector_gin "
+            "ON documents_searchentry USING gin (search_vector)"
+        )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS searchentry_vector_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_session_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summarizationsession',
+            name='memory_digest',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='summarizationsession',
+            name='memory_through_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='backgroundjob',
+            name='kind',
+            field=models.CharField(choices=[('extract', 'Extract document text'), ('index', 'Update search index'), ('memory', 'Compress chat memory')], max_length=20),
+        ),
+    ]
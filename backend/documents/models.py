@@ -1,5 +1,10 @@
+import hashlib
+import os
+
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 from cloudinary.models import CloudinaryField
 
 
@@ -9,6 +14,17 @@ from cloudinary.models import CloudinaryField
 
 
 class Document(models.Model):
+    EXTRACTION_PENDING = "pending"
+    EXTRACTION_PROCESSING = "processing"
+    EXTRACTION_DONE = "done"
+    EXTRACTION_FAILED = "failed"
+    EXTRACTION_STATUS_CHOICES = [
+        (EXTRACTION_PENDING, "Pending"),
+        (EXTRACTION_PROCESSING, "Processing"),
+        (EXTRACTION_DONE, "Done"),
+        (EXTRACTION_FAILED, "Failed"),
+    ]
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -22,11 +38,80 @@ class Document(models.Model):
         resource_type="raw"
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # sha256 of the uploaded bytes, used to key the extraction cache
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    # ✅ Filled in by the background extraction job queued on upload
+    extraction_status = models.CharField(
+        max_length=20, choices=EXTRACTION_STATUS_CHOICES, default=EXTRACTION_PENDING
+    )
+    extracted_text = models.TextField(blank=True, default="")
+    extraction_error = models.TextField(blank=True, default="")
+    extracted_at = models.DateTimeField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        # Before pre_save uploads to Cloudinary, a new file is still an UploadedFile
+        upload = self.file
+        if hasattr(upload, "chunks"):
+            digest = hashlib.sha256()
+            for chunk in upload.chunks():
+                digest.update(chunk)
+            upload.seek(0)
+            self.content_hash = digest.hexdigest()
+        super().save(*args, **kwargs)
+
+    @property
+    def filename(self):
+        return os.path.basename(self.file.url) if self.file else ""
 
     def __str__(self):
         return f"{self.file} uploaded by {self.user}"
 
 
+class ExtractedText(models.Model):
+    """Persistent, size-bounded LRU cache of parsed document text."""
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="extracted_texts")
+    content_hash = models.CharField(max_length=64)
+    parser_version = models.PositiveIntegerField(default=1)
+    text = models.TextField()
+    # True when a character-budgeted parse stopped before the end of the file
+    truncated = models.BooleanField(default=False)
+    size_bytes = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["document", "content_hash", "parser_version"],
+                name="unique_extracted_text_per_content",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Extracted text for document {self.document_id} ({self.size_bytes} bytes)"
+
+
+
+class DocumentChunk(models.Model):
+    """A passage of a document's extracted text with its embedding (see documents/retrieval.py)."""
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="chunks")
+    # Document content the chunks were cut from (extraction.document_content_key)
+    content_hash = models.CharField(max_length=64)
+    embedder = models.CharField(max_length=100)
+    position = models.PositiveIntegerField()
+    text = models.TextField()
+    # float32 vector, L2-normalized
+    embedding = models.BinaryField()
+
+    class Meta:
+        ordering = ["position"]
+        constraints = [
+            models.UniqueConstraint(fields=["document", "position"], name="unique_chunk_position"),
+        ]
+
+    def __str__(self):
+        return f"Chunk {self.position} of document {self.document_id}"
+
 
 from django.db import models
 from django.conf import settings
@@ -38,9 +123,32 @@ class SummarizationSession(models.Model):
     title = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     summary_text = models.TextField()
+    # Chat memory: a running digest of the messages up to memory_through_id
+    # (see documents/memory.py); later messages are replayed verbatim
+    memory_digest = models.TextField(blank=True, default="")
+    memory_through_id = models.PositiveBigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Summaries list: filter(user=...) ordered newest first (cursor pagination)
+            models.Index(fields=["user", "-created_at", "-id"], name="session_user_created_idx"),
+        ]
+
+    @classmethod
+    def create_for_documents(cls, user, documents, summary_text):
+        """Save a summary of documents (linked to the first) with its opening message."""
+        first_doc = documents[0]
+        session = cls.objects.create(
+            user=user,
+            document=first_doc,
+            title=f'Summarization "{first_doc.filename}"',
+            summary_text=summary_text,
+        )
+        SummarizationMessage.objects.create(session=session, role="assistant", content=summary_text)
+        return session
 
     def __str__(self):
-        return f"{self.title} ({self.user.username})"
+        return f"{self.title} (user {self.user_id})"
 
 
 class SummarizationMessage(models.Model):
@@ -51,3 +159,185 @@ class SummarizationMessage(models.Model):
 
     def __str__(self):
         return f"[{self.role}] {self.content[:30]}"
+
+
+class AudioArtifact(models.Model):
+    """Narration and synthesized audio for a summary in one language."""
+    STATUS_GENERATING = "generating"
+    STATUS_READY = "ready"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_GENERATING, "Generating"),
+        (STATUS_READY, "Ready"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    session = models.ForeignKey(SummarizationSession, on_delete=models.CASCADE, related_name="audio_artifacts")
+    language = models.CharField(max_length=10)
+    # sha256 of the summary text the narration was written from
+    summary_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=STATUS_GENERATING)
+    narration = models.TextField(blank=True, default="")
+    narration_hash = models.CharField(max_length=64, blank=True, default="")
+    # Path relative to MEDIA_ROOT
+    file_path = models.CharField(max_length=255, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["session", "language", "summary_hash"],
+                name="unique_audio_per_summary_language",
+            ),
+        ]
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __str__(self):
+        return f"Audio for session {self.session_id} [{self.language}] ({self.status})"
+
+
+class SearchEntry(models.Model):
+    """One searchable document or summary session of a user (see documents/search.py)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="search_entries")
+    document = models.OneToOneField(
+        Document, null=True, blank=True, on_delete=models.CASCADE, related_name="search_entry"
+    )
+    session = models.OneToOneField(
+        SummarizationSession, null=True, blank=True, on_delete=models.CASCADE, related_name="search_entry"
+    )
+    title = models.CharField(max_length=255)
+    preview = models.CharField(max_length=300, blank=True, default="")
+    # Indexed tokens, for BM25 length normalization
+    length = models.PositiveIntegerField(default=0)
+    # Maintained on PostgreSQL only (GIN-indexed, see migration 0010)
+    search_vector = SearchVectorField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def kind(self):
+        return "document" if self.document_id else "summary"
+
+    def __str__(self):
+        return f"Search entry: {self.title}"
+
+
+class SearchPosting(models.Model):
+    """Inverted index row (term -> entry) used when PostgreSQL full-text search is unavailable."""
+    entry = models.ForeignKey(SearchEntry, on_delete=models.CASCADE, related_name="postings")
+    # Denormalized from the entry so BM25 scoring needs no join
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    term = models.CharField(max_length=64)
+    tf = models.PositiveIntegerField()
+    length = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "term"], name="posting_user_term_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> entry {self.entry_id} ({self.tf})"
+
+
+class BackgroundJob(models.Model):
+    """Row in the database-backed job queue drained by documents.tasks workers."""
+    KIND_EXTRACT = "extract"
+    KIND_INDEX = "index"
+    KIND_MEMORY = "memory"
+    KIND_SUMMARIZE = "summarize"
+    KIND_CHOICES = [
+        (KIND_EXTRACT, "Extract document text"),
+        (KIND_INDEX, "Update search index"),
+        (KIND_MEMORY, "Compress chat memory"),
+        (KIND_SUMMARIZE, "Summarize a batch document"),
+    ]
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict)
+    # Jobs sharing a group run at most BACKGROUND_JOB_GROUP_CONCURRENCY at a time
+    group = models.CharField(max_length=64, blank=True, default="")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job #{self.pk} ({self.status})"
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket shared by all workers (documents.gateway, LLM_RATE_LIMIT_BACKEND="database")."""
+    name = models.CharField(max_length=64, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField()  # unix time of the last refill
+
+    def __str__(self):
+        return f"{self.name}: {self.tokens:.1f}"
+
+
+class SummarizeBatch(models.Model):
+    """Many documents summarized separately by background jobs, one session each."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    mode = models.CharField(max_length=20)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def progress(self):
+        """Item counts per status, plus the total."""
+        counts = dict.fromkeys([status for status, _ in SummarizeBatchItem.STATUS_CHOICES], 0)
+        counts.update(self.items.order_by().values_list("status").annotate(n=models.Count("id")))
+        counts["total"] = sum(counts.values())
+        return counts
+
+    def __str__(self):
+        return f"Batch #{self.pk} (user {self.user_id})"
+
+
+class SummarizeBatchItem(models.Model):
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    batch = models.ForeignKey(SummarizeBatch, on_delete=models.CASCADE, related_name="items")
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="+")
+    session = models.ForeignKey(SummarizationSession, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"Batch #{self.batch_id} document {self.document_id} ({self.status})"
@@ -0,0 +1,208 @@
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pypdfium2
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from PIL import Image, ImageSequence
+
+from .extraction import _get_pool
+from .parsers import PAGE_BREAK
+
+logger = logging.getLogger(__name__)
+
+# OCR for image uploads and for PDF pages without a text layer (scans).
+# Pages are converted to grayscale, downscaled to OCR_MAX_WIDTH and cut into
+# horizontal strips of at most OCR_TILE_HEIGHT at blank rows (so no line of
+# text is split). Every strip is recognized by its own Tesseract process,
+# OCR_PROCESSES at a time per worker. Page results are cached in the "ocr"
+# cache, keyed by a hash of the prepared image.
+
+CACHE_ALIAS = "ocr"
+# Rows searched above a strip boundary for the blankest place to cut
+CUT_SEARCH_ROWS = 200
+
+
+# ---------------- BACKENDS ---------------- #
+class OCRBackend:
+    """Turns a grayscale PIL image into text. recognize() is called from worker threads."""
+
+    name = "base"
+
+    def available(self):
+        return True
+
+    def recognize(self, image, languages):
+        raise NotImplementedError
+
+
+class TesseractBackend(OCRBackend):
+    """The tesseract binary, fed the image on stdin (no temp files)."""
+
+    name = "tesseract"
+
+    def available(self):
+        return shutil.which(settings.OCR_TESSERACT_CMD) is not None
+
+    def recognize(self, image, languages):
+        buffer = io.BytesIO()
+        image.save(buffer, format="PPM")  # uncompressed: cheap to write and to read
+        result = subprocess.run(
+            [settings.OCR_TESSERACT_CMD, "stdin", "stdout", "-l", languages, "--psm", "3"],
+            input=buffer.getvalue(),
+            capture_output=True,
+            timeout=settings.OCR_TIMEOUT,
+            # One thread per process: parallelism comes from running several
+            env={**os.environ, "OMP_THREAD_LIMIT": "1"},
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"tesseract failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result.stdout.decode("utf-8", "replace")
+
+
+_backends = {}
+_unavailable_logged = set()
+
+
+def get_ocr_backend():
+    path = settings.OCR_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def ocr_available():
+    if not settings.OCR_ENABLED:
+        return False
+    if get_ocr_backend().available():
+        return True
+    if settings.OCR_BACKEND not in _unavailable_logged:
+        _unavailable_logged.add(settings.OCR_BACKEND)
+        logger.warning("⚠️ OCR backend %s is not available (is Tesseract installed?)", settings.OCR_BACKEND)
+    return False
+
+
+def get_ocr_pool():
+    """Process-wide thread pool; each thread drives one OCR process (global CPU limit)."""
+    return _get_pool(
+        "ocr",
+        lambda: ThreadPoolExecutor(max_workers=max(1, settings.OCR_PROCESSES), thread_name_prefix="documents-ocr"),
+    )
+
+
+# ---------------- IMAGE PREPARATION ---------------- #
+def prepare(image):
+    """Grayscale, at most OCR_MAX_WIDTH pixels wide."""
+    image = image.convert("L")
+    if image.width > settings.OCR_MAX_WIDTH:
+        height = max(1, round(image.height * settings.OCR_MAX_WIDTH / image.width))
+        image = image.resize((settings.OCR_MAX_WIDTH, height), Image.LANCZOS)
+    return image
+
+
+def _is_blank(image):
+    low, high = image.getextrema()
+    return high - low < 16
+
+
+def tile(image):
+    """Horizontal strips of at most OCR_TILE_HEIGHT rows, cut at the blankest row near each boundary."""
+    max_height = settings.OCR_TILE_HEIGHT
+    if image.height <= max_height:
+        return [image]
+    # Mean brightness of every row, computed in C
+    rows = list(image.resize((1, image.height), Image.BOX).getdata())
+    strips = []
+    top = 0
+    while image.height - top > max_height:
+        limit = top + max_height
+        # Searched bottom up (ties keep strips tall), never above the middle of the strip
+        lowest = max(top + 1, top + max_height // 2, limit - CUT_SEARCH_ROWS)
+        cut = max(range(limit, lowest - 1, -1), key=lambda y: rows[y])
+        strips.append(image.crop((0, top, image.width, cut)))
+        top = cut
+    strips.append(image.crop((0, top, image.width, image.height)))
+    return [strip for strip in strips if not _is_blank(strip)]
+
+
+def _page_key(image, backend):
+    digest = hashlib.sha256(image.tobytes())
+    digest.update(f"{image.mode}:{image.size}:{backend.name}:{settings.OCR_LANGUAGES}".encode())
+    return "ocr:" + digest.hexdigest()
+
+
+# ---------------- RECOGNITION ---------------- #
+def recognize_pages(images):
+    """
+    Text of each PIL image, in order. Cached pages are not recognized again;
+    strips of the others run on the OCR pool in parallel.
+    """
+    backend = get_ocr_backend()
+    cache = caches[CACHE_ALIAS]
+    pages = [prepare(image) for image in images]
+    keys = [_page_key(page, backend) for page in pages]
+    cached = cache.get_many(set(keys))
+
+    pool = get_ocr_pool()
+    pending = {}
+    for page, key in zip(pages, keys):
+        if key in cached or key in pending or _is_blank(page):
+            continue
+        pending[key] = [pool.submit(backend.recognize, strip, settings.OCR_LANGUAGES) for strip in tile(page)]
+
+    fresh = {key: "\n".join(f.result().strip() for f in futures).strip() for key, futures in pending.items()}
+    if fresh:
+        cache.set_many(fresh, timeout=settings.OCR_CACHE_TTL)
+    cached.update(fresh)
+    return [cached.get(key, "") for key in keys]
+
+
+def ocr_image(source):
+    """Text of an image file (every frame of a multi-page TIFF), given as bytes or a path."""
+    stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else open(source, "rb")
+    with stream, Image.open(stream) as image:
+        frames = [frame.copy() for frame in ImageSequence.Iterator(image)]
+    return ("\n" + PAGE_BREAK).join(text for text in recognize_pages(frames) if text)
+
+
+def _text_length(pages):
+    return sum(len(page) + 1 for page in pages if page.strip())
+
+
+def ocr_blank_pdf_pages(source, text, max_chars=None):
+    """
+    Fill the blank pages of parsed PDF text (parse_pdf(..., blank_pages=True))
+    with OCR of the rendered pages, and drop the pages that stay blank. Pages
+    are recognized in order and OCR stops once max_chars characters precede
+    the next blank page (a scan otherwise costs one Tesseract run per page).
+    """
+    pages = text.split("\n" + PAGE_BREAK)
+    blank = [index for index, page in enumerate(pages) if not page.strip()]
+    if blank:
+        pdf = pypdfium2.PdfDocument(source)
+        try:
+            # Bounded batches keep at most a few rendered pages in memory
+            batch_size = max(1, settings.OCR_PROCESSES) * 2
+            for start in range(0, len(blank), batch_size):
+                indexes = blank[start:start + batch_size]
+                if max_chars is not None and _text_length(pages[:indexes[0]]) >= max_chars:
+                    pages = pages[:indexes[0]]
+                    break
+                images = []
+                for index in indexes:
+                    page = pdf[index]
+                    try:
+                        images.append(page.render(scale=settings.OCR_PDF_DPI / 72, grayscale=True).to_pil())
+                    finally:
+                        page.close()
+                for index, page_text in zip(indexes, recognize_pages(images)):
+                    pages[index] = page_text
+        finally:
+            pdf.close()
+    return ("\n" + PAGE_BREAK).join(page for page in pages if page.strip())
@@ -0,0 +1,167 @@
+import io
+
+# Parsers only depend on the downloaded bytes or file (no Django imports) so
+# they can run in the spawned processes of the extraction process pool. They
+# are looked up by documents/extractors.py; format libraries are imported
+# inside the parsers, so a process only loads what it actually parses.
+
+PDF_BACKENDS = ("pdfplumber", "pdfium", "auto")
+
+# Separates PDF pages in extracted text so chunking can split on page boundaries
+PAGE_BREAK = "\f"
+
+
+# ---------------- PDF (streaming, page by page) ---------------- #
+def _is_text_only(page):
+    import pypdfium2.raw as pdfium_c
+
+    # Tables and figures are drawn with path/image objects; pdfium's plain
+    # text dump loses their layout, so only text-only pages skip pdfplumber.
+    for obj in page.get_objects(max_depth=1):
+        if obj.type != pdfium_c.FPDF_PAGEOBJ_TEXT:
+            return False
+    return True
+
+
+def _pdfium_page_text(page):
+    textpage = page.get_textpage()
+    try:
+        return textpage.get_text_bounded().replace("\r\n", "\n")
+    finally:
+        textpage.close()
+
+
+def iter_pdf_pages(source, backend="auto"):
+    """
+    Yield the text of each PDF page in order, parsing lazily so callers can
+    stop early. `source` is a path or binary file object.
+
+    Backends: "pdfplumber" (layout aware), "pdfium" (pypdfium2, much faster)
+    or "auto", which uses pypdfium2 for text-only pages and pdfplumber for
+    pages containing drawings or images.
+    """
+    import pdfplumber
+    import pypdfium2
+
+    if backend not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF backend: {backend}")
+
+    if backend == "pdfplumber":
+        with pdfplumber.open(source) as pdf:
+            for page in pdf.pages:
+                yield page.extract_text() or ""
+                page.close()  # drop cached layout objects as we go
+        return
+
+    pdf = pypdfium2.PdfDocument(source)
+    plumber = None
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            try:
+                if backend == "pdfium" or _is_text_only(page):
+                    yield _pdfium_page_text(page)
+                    continue
+            finally:
+                page.close()
+
+            if plumber is None:
+                if hasattr(source, "seek"):
+                    source.seek(0)
+                plumber = pdfplumber.open(source)
+            plumber_page = plumber.pages[index]
+            yield plumber_page.extract_text() or ""
+            plumber_page.close()
+    finally:
+        if plumber is not None:
+            plumber.close()
+        pdf.close()
+
+
+def extract_pdf_text(source, max_chars=None, backend="auto", blank_pages=False):
+    """
+    Join page texts, stopping as soon as max_chars characters are available.
+    With blank_pages, pages without text keep an empty slot (for OCR).
+    """
+    parts = []
+    total = 0
+    for page_text in iter_pdf_pages(source, backend=backend):
+        if not page_text.strip() and not blank_pages:
+            continue
+        parts.append(page_text)
+        total += len(page_text) + 1
+        if max_chars is not None and total >= max_chars:
+            break
+
+    text = ("\n" + PAGE_BREAK).join(parts)
+    return text[:max_chars] if max_chars is not None else text
+
+
+# ---------------- FILE PARSERS ---------------- #
+def _open_source(source):
+    """Binary stream over a downloaded file: its bytes (read from memory) or its path."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return open(source, "rb")
+
+
+def _text(stream, newline=None):
+    return io.TextIOWrapper(stream, encoding="utf-8", errors="ignore", newline=newline)
+
+
+def _limit(text, max_chars):
+    return text[:max_chars] if max_chars is not None else text
+
+
+# Every parser takes the file (bytes or a path) and max_chars; see Extractor.parse
+def parse_pdf(source, max_chars=None, backend="auto", blank_pages=False):
+    """Stops once max_chars characters are available; blank_pages keeps empty slots for OCR."""
+    with _open_source(source) as stream:
+        return extract_pdf_text(stream, max_chars=max_chars, backend=backend, blank_pages=blank_pages)
+
+
+def parse_docx(source, max_chars=None):
+    import docx
+
+    with _open_source(source) as stream:
+        doc = docx.Document(stream)
+        return _limit("\n".join(para.text for para in doc.paragraphs), max_chars)
+
+
+def parse_csv(source, max_chars=None):
+    """A column digest of the whole table (see documents/tabular.py)."""
+    from .tabular import csv_digest
+
+    with _open_source(source) as stream:
+        return _limit(csv_digest(_text(stream, newline="")), max_chars)
+
+
+def parse_json(source, max_chars=None):
+    from .tabular import json_digest
+
+    with _open_source(source) as stream:
+        return _limit(json_digest(_text(stream)), max_chars)
+
+
+def parse_html(source, max_chars=None):
+    from .markup import extract_markup_text
+
+    with _open_source(source) as stream:
+        return extract_markup_text(stream, html=True, max_chars=max_chars)
+
+
+def parse_xml(source, max_chars=None):
+    from .markup import extract_markup_text
+
+    with _open_source(source) as stream:
+        return extract_markup_text(stream, html=False, max_chars=max_chars)
+
+
+def parse_image(source, max_chars=None):
+    # Images have no text layer; their text comes from OCR (documents/ocr.py)
+    return ""
+
+
+def parse_text(source, max_chars=None):
+    with _open_source(source) as stream:
+        return _text(stream).read(max_chars)
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .extraction import document_content_key
+from .llm import count_tokens, get_client
+from .gateway import get_gateway
+from .models import DocumentChunk
+from .search import tokenize
+from .summarize import chunk_text
+
+logger = logging.getLogger(__name__)
+
+# Retrieval for chat: a document's extracted text is cut into passages,
+# embedded once (when extraction finishes) and stored as DocumentChunk rows.
+# At question time the vectors are loaded into a NumPy matrix (kept in a
+# per-process LRU) and the top-k passages by cosine similarity go into the
+# chat prompt next to the summary.
+
+
+# ---------------- EMBEDDERS ---------------- #
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class Embedder:
+    """Maps texts to L2-normalized float32 vectors. name identifies the vector space."""
+
+    name = None
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Local CPU embedder: hashed word unigrams and bigrams with sublinear term
+    frequency. No model download or API quota; good at lexical matches.
+    """
+
+    dimensions = 1024
+    name = f"hashing-{dimensions}"
+
+    def _features(self, text):
+        tokens = tokenize(text)
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                # Signed hashing keeps collisions from only ever adding up
+                matrix[row, h % self.dimensions] += 1.0 if h >> 63 else -1.0
+        return _normalize(np.sign(matrix) * np.log1p(np.abs(matrix)))
+
+
+class GeminiEmbedder(Embedder):
+    """Gemini embedding model (semantic matches; costs API calls at index and query time)."""
+
+    model = "text-embedding-004"
+    name = f"gemini:{model}"
+    batch_size = 100
+
+    def embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            response = get_gateway().call(
+                lambda: get_client().models.embed_content(model=self.model, contents=batch),
+                sum(count_tokens(text) for text in batch),
+            )
+            vectors.extend(embedding.values for embedding in response.embeddings)
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+_embedders = {}
+
+
+def get_embedder(name=None):
+    """
+    The configured embedder (settings.RAG_EMBEDDER), or the one that built an
+    existing index when name is given. None for an unknown name.
+    """
+    path = settings.RAG_EMBEDDER
+    if path not in _embedders:
+        _embedders[path] = import_string(path)()
+    configured = _embedders[path]
+    if name is None or name == configured.name:
+        return configured
+    if name == HashingEmbedder.name:
+        return HashingEmbedder()
+    return None
+
+
+# ---------------- VECTOR INDEX ---------------- #
+class VectorIndex:
+    """Passages of one document and their embeddings as a (n, d) float32 matrix."""
+
+    def __init__(self, embedder_name, texts, matrix):
+        self.embedder_name = embedder_name
+        self.texts = texts
+        self.matrix = matrix
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + sum(len(t.encode("utf-8")) for t in self.texts)
+
+    def search(self, query_vector, k):
+        """(score, text) of the k passages most similar to query_vector, best first."""
+        if not self.texts or k < 1:
+            return []
+        scores = self.matrix @ query_vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.texts[i]) for i in top]
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _cache_index(key, index):
+    with _indexes_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > settings.RAG_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+
+
+def _cached_index(key):
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+        return index
+
+
+# ---------------- INDEXING ---------------- #
+def index_document(document, text):
+    """Chunk and embed a document's text, replacing any previous chunks."""
+    passages = chunk_text(text, settings.RAG_CHUNK_CHARS)
+    embedder = get_embedder()
+    try:
+        matrix = embedder.embed(passages) if passages else np.zeros((0, 0), dtype=np.float32)
+    except Exception:
+        if isinstance(embedder, HashingEmbedder):
+            raise
+        logger.exception("Embedding with %s failed, using the local embedder", embedder.name)
+        embedder = HashingEmbedder()
+        matrix = embedder.embed(passages)
+
+    content_hash = document_content_key(document)
+    with transaction.atomic():
+        DocumentChunk.objects.filter(document=document).delete()
+        DocumentChunk.objects.bulk_create(
+            [
+                DocumentChunk(
+                    document=document,
+                    content_hash=content_hash,
+                    embedder=embedder.name,
+                    position=position,
+                    text=passage,
+                    embedding=matrix[position].tobytes(),
+                )
+                for position, passage in enumerate(passages)
+            ],
+            batch_size=500,
+        )
+
+    index = VectorIndex(embedder.name, passages, matrix)
+    _cache_index((document.id, content_hash), index)
+    return index
+
+
+def _load_index(document):
+    content_hash = document_content_key(document)
+    key = (document.id, content_hash)
+    index = _cached_index(key)
+    if index is not None:
+        return index
+
+    rows = list(
+        DocumentChunk.objects.filter(document=document, content_hash=content_hash).values_list(
+            "embedder", "text", "embedding"
+        )
+    )
+    if rows:
+        matrix = np.vstack([np.frombuffer(bytes(row[2]), dtype=np.float32) for row in rows])
+        index = VectorIndex(rows[0][0], [row[1] for row in rows], matrix)
+        _cache_index(key, index)
+        return index
+
+    # Extracted before indexing existed (or the file changed): index now
+    if document.extraction_status == document.EXTRACTION_DONE and document.extracted_text:
+        return index_document(document, document.extracted_text)
+    return None
+
+
+def retrieve(document, query, k=None):
+    """
+    Passages of the document most relevant to query, best first. Empty when
+    the document has no extracted text yet or retrieval fails, so chat can
+    fall back to the summary alone.
+    """
+    k = settings.RAG_TOP_K if k is None else k
+    try:
+        index = _load_index(document)
+        embedder = get_embedder(index.embedder_name) if index is not None else None
+        if embedder is None:
+            return []
+        query_vector = embedder.embed([query])[0]
+    except Exception:
+        logger.exception("Retrieval failed for document %s", document.pk)
+        return []
+    return [text for score, text in index.search(query_vector, k) if score > 0]
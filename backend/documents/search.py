@@ -0,0 +1,151 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import Avg, Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+
+from .models import Document, SearchEntry, SearchPosting
+
+# Keyword search over a user's documents (file name + extracted text) and
+# summary sessions (title + summary + chat). Each object has one SearchEntry,
+# refreshed through the job queue whenever it changes. On PostgreSQL the entry
+# carries a GIN-indexed tsvector ranked with ts_rank; elsewhere SearchPosting
+# rows form an inverted index scored with BM25 inside the database.
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_TERM_LENGTH = 64
+
+KIND_DOCUMENT = "document"
+KIND_SUMMARY = "summary"
+KINDS = [KIND_DOCUMENT, KIND_SUMMARY]
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what "
+    "when where which who why how with does do did can".split()
+)
+
+
+def tokenize(text):
+    """Lowercased word tokens without common English stopwords."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def search_backend():
+    return "postgres" if connection.vendor == "postgresql" else "bm25"
+
+
+# ---------------- INDEXING ---------------- #
+def _write_entry(entry, title, body):
+    body = body[:settings.SEARCH_MAX_BODY_CHARS]
+    title_tokens = tokenize(title)
+    body_tokens = tokenize(body)
+
+    entry.title = title[:255]
+    entry.preview = " ".join(body.split())[:300]
+    entry.length = len(title_tokens) + len(body_tokens)
+
+    with transaction.atomic():
+        entry.save()
+        if search_backend() == "postgres":
+            config = settings.SEARCH_CONFIG
+            SearchEntry.objects.filter(pk=entry.pk).update(
+                search_vector=SearchVector(Value(title), weight="A", config=config)
+                + SearchVector(Value(body), weight="B", config=config)
+            )
+            return
+
+        # Title terms count double
+        counts = Counter(title_tokens * 2 + body_tokens)
+        SearchPosting.objects.filter(entry=entry).delete()
+        SearchPosting.objects.bulk_create(
+            [
+                SearchPosting(entry=entry, user_id=entry.user_id, term=term, tf=tf, length=entry.length)
+                for term, tf in counts.items()
+                if len(term) <= MAX_TERM_LENGTH
+            ],
+            batch_size=1000,
+        )
+
+
+def update_document_entry(document):
+    entry = SearchEntry.objects.filter(document=document).first() or SearchEntry(
+        user_id=document.user_id, document=document
+    )
+    body = document.extracted_text if document.extraction_status == Document.EXTRACTION_DONE else ""
+    _write_entry(entry, document.filename or f"Document {document.id}", body)
+    return entry
+
+
+def update_session_entry(session):
+    entry = SearchEntry.objects.filter(session=session).first() or SearchEntry(
+        user_id=session.user_id, session=session
+    )
+    # The opening assistant message repeats the summary
+    chat = session.messages.order_by("id").values_list("content", flat=True)[1:]
+    _write_entry(entry, session.title, "\n\n".join([session.summary_text, *chat]))
+    return entry
+
+
+# ---------------- QUERYING ---------------- #
+def _kind_filter(kind, prefix=""):
+    if kind == KIND_DOCUMENT:
+        return {f"{prefix}document__isnull": False}
+    if kind == KIND_SUMMARY:
+        return {f"{prefix}session__isnull": False}
+    return {}
+
+
+def _search_postgres(user, query, kind, limit):
+    search_query = SearchQuery(query, search_type="websearch", config=settings.SEARCH_CONFIG)
+    return list(
+        SearchEntry.objects.filter(user=user, search_vector=search_query, **_kind_filter(kind))
+        .annotate(score=SearchRank(F("search_vector"), search_query, normalization=Value(1)))
+        .order_by("-score", "-updated_at")[:limit]
+    )
+
+
+def _search_bm25(user, query, kind, limit):
+    terms = list(dict.fromkeys(t for t in tokenize(query) if len(t) <= MAX_TERM_LENGTH))
+    if not terms:
+        return []
+
+    # Collection statistics over the entries being searched, like the document frequencies
+    stats = SearchEntry.objects.filter(user=user, **_kind_filter(kind)).aggregate(n=Count("id"), avgdl=Avg("length"))
+    postings = SearchPosting.objects.filter(user=user, term__in=terms, **_kind_filter(kind, "entry__"))
+    doc_freq = dict(postings.order_by().values_list("term").annotate(df=Count("id")))
+    if not doc_freq:
+        return []
+
+    n = stats["n"]
+    idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+    tf = Cast("tf", FloatField())
+    length_norm = Value(BM25_K1 * (1 - BM25_B)) + Value(BM25_K1 * BM25_B / (stats["avgdl"] or 1)) * Cast(
+        "length", FloatField()
+    )
+    term_weight = Case(*[When(term=term, then=Value(weight)) for term, weight in idf.items()], output_field=FloatField())
+
+    top = list(
+        postings.values("entry_id")
+        .annotate(score=Sum(term_weight * tf * Value(BM25_K1 + 1) / (tf + length_norm)))
+        .order_by("-score")[:limit]
+    )
+    entries = SearchEntry.objects.in_bulk([row["entry_id"] for row in top])
+    results = []
+    for row in top:
+        entry = entries[row["entry_id"]]
+        entry.score = row["score"]
+        results.append(entry)
+    return results
+
+
+def search(user, query, kind=None, limit=20):
+    """The user's best matching SearchEntry rows, each with a .score, best first."""
+    if search_backend() == "postgres":
+        return _search_postgres(user, query, kind, limit)
+    return _search_bm25(user, query, kind, limit)
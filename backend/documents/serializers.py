@@ -1,6 +1,8 @@
 import os
 from rest_framework import serializers
-from .models import Document, SummarizationSession, SummarizationMessage
+from .extraction import find_extractor
+from .extractors import SNIFF_BYTES
+from .models import Document, SummarizationSession, SummarizationMessage, SearchEntry, SummarizeBatchItem
 
 
 # ---------------- DOCUMENT SERIALIZER ---------------- #
@@ -10,21 +12,22 @@ class DocumentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Document
-        fields = ["id", "user", "file", "file_url", "uploaded_at"]
-        read_only_fields = ["user", "uploaded_at"]
+        fields = [
+            "id", "user", "file", "file_url", "uploaded_at",
+            "extraction_status", "extraction_error", "extracted_at",
+        ]
+        read_only_fields = ["user", "uploaded_at", "extraction_status", "extraction_error", "extracted_at"]
 
     def create(self, validated_data):
         validated_data["user"] = self.context["request"].user
         return super().create(validated_data)
 
     def validate_file(self, value):
-        allowed_extensions = [
-            ".txt", ".pdf", ".docx", ".csv", ".json",
-            ".html", ".htm", ".xml",
-            ".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp"
-        ]
+        # Same detection as extraction: magic bytes first, then the extension
         ext = os.path.splitext(value.name)[-1].lower()
-        if ext not in allowed_extensions:
+        head = value.read(SNIFF_BYTES)
+        value.seek(0)
+        if find_extractor(head, ext, fallback=False) is None:
             raise serializers.ValidationError(f"❌ Unsupported file type: {ext}")
         return value
 
@@ -50,3 +53,34 @@ class SummarizationSessionSerializer(serializers.ModelSerializer):
     class Meta:
         model = SummarizationSession
         fields = "__all__"
+
+
+class SummarizationSessionListSerializer(serializers.ModelSerializer):
+    """Sidebar row: no messages and only the start of the summary; both come from queryset annotations."""
+    summary_preview = serializers.CharField(read_only=True)
+    message_count = serializers.IntegerField(read_only=True)
+    last_message_at = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = SummarizationSession
+        fields = ["id", "title", "document", "created_at", "last_message_at", "message_count", "summary_preview"]
+
+
+class SummarizeBatchItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SummarizeBatchItem
+        fields = ["document", "status", "session", "error", "updated_at"]
+
+
+# ---------------- SEARCH SERIALIZER ---------------- #
+class SearchResultSerializer(serializers.ModelSerializer):
+    kind = serializers.CharField(read_only=True)
+    object_id = serializers.SerializerMethodField()
+    score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SearchEntry
+        fields = ["kind", "object_id", "title", "preview", "score", "updated_at"]
+
+    def get_object_id(self, obj):
+        return obj.document_id or obj.session_id
@@ -0,0 +1,174 @@
+import json
+
+from adrf.views import APIView
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework import permissions
+from rest_framework.response import Response
+
+from .models import SummarizationSession, SummarizationMessage
+from .audio import stream_audio
+from .extraction import aget_documents_text
+from .gateway import llm_user
+from .llm import astream_text, count_tokens
+from .memory import chat_context
+from .tasks import enqueue_memory_compaction, enqueue_search_update
+from .tts import get_tts_backend
+from .summarize import aprepare_summary_prompt, build_chat_prompt, max_input_chars
+from .views import parse_summarize_request, use_llm_cache
+
+# Server-sent-events versions of the summarize and chat endpoints, plus a
+# progressive MP3 stream of the audio summary. Served through
+# backend/asgi.py, tokens (and audio segments) reach the client as soon as
+# they are produced.
+#
+# Event stream:
+#   event: status  data: {"stage": ...}           progress before the first token
+#   data: {"delta": "..."}                         one per Gemini text fragment
+#   event: done    data: {...}                     after the rows are saved
+#   event: error   data: {"error": "..."}
+
+
+# ---------------- HELPERS ---------------- #
+def _event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def _sse_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let proxies buffer the stream
+    return response
+
+
+# ---------------- STREAMING SUMMARIZE ---------------- #
+class SummarizeStreamView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request):
+        user = request.user
+        docs, mode, error = await sync_to_async(parse_summarize_request)(request.data, user)
+        if error:
+            return Response({"error": error}, status=400)
+
+        async def events():
+            try:
+                yield _event({"stage": "extracting"}, event="status")
+                texts = await aget_documents_text(docs, max_chars=max_input_chars(mode))
+                combined_text = "\n\n".join(texts)
+                if not combined_text.strip():
+                    yield _event({"error": "No readable text could be extracted (scanned PDFs need OCR)."}, event="error")
+                    return
+
+                yield _event({"stage": "summarizing"}, event="status")
+                with llm_user(user.id):
+                    prompt, stats = await aprepare_summary_prompt(combined_text, mode)
+
+                parts = []
+                async for delta in astream_text(prompt, user=user.id):
+                    parts.append(delta)
+                    yield _event({"delta": delta})
+
+                summary_text = "".join(parts)
+                if not summary_text:
+                    yield _event({"error": "Gemini returned no summary text."}, event="error")
+                    return
+
+                # ✅ Save summarization session once the full text is known
+                session = await sync_to_async(SummarizationSession.create_for_documents)(user, docs, summary_text)
+                await sync_to_async(enqueue_search_update)(session=session)
+            except Exception as e:
+                yield _event({"error": f"Gemini summarization failed: {str(e)}"}, event="error")
+                return
+
+            done = {
+                "session_id": session.id,
+                "title": session.title,
+                "created_at": session.created_at,
+            }
+            if stats:
+                done["hierarchical"] = stats
+            yield _event(done, event="done")
+
+        return _sse_response(events())
+
+
+# ---------------- STREAMING CHAT ---------------- #
+class SummarizeChatStreamView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request, session_id):
+        query = str(request.data.get("query", "")).strip()
+        if not query:
+            return Response({"error": "Query cannot be empty."}, status=400)
+
+        try:
+            session = await SummarizationSession.objects.select_related("document").aget(id=session_id, user=request.user)
+        except SummarizationSession.DoesNotExist:
+            return Response({"error": "Session not found"}, status=404)
+
+        from .retrieval import retrieve  # numpy: imported on the first chat message
+
+        use_cache = use_llm_cache(request.data)
+        with llm_user(request.user.id):
+            excerpts = await sync_to_async(retrieve)(session.document, query)
+        digest, history = await sync_to_async(chat_context)(session)
+        prompt = build_chat_prompt(session.summary_text, query, excerpts, history, digest)
+
+        async def events():
+            try:
+                parts = []
+                async for delta in astream_text(prompt, use_cache=use_cache, user=request.user.id):
+                    parts.append(delta)
+                    yield _event({"delta": delta})
+
+                answer = "".join(parts) or "⚠️ Gemini returned no response."
+
+                # Save chat messages
+                await SummarizationMessage.objects.acreate(session=session, role="user", content=query)
+                await SummarizationMessage.objects.acreate(session=session, role="assistant", content=answer)
+                await sync_to_async(enqueue_search_update)(session=session)
+                await sync_to_async(enqueue_memory_compaction)(session)
+            except Exception as e:
+                yield _event({"error": f"Gemini chat failed: {str(e)}"}, event="error")
+                return
+
+            yield _event({"reply": answer, "prompt_tokens": count_tokens(prompt)}, event="done")
+
+        return _sse_response(events())
+
+
+# ---------------- STREAMING AUDIO ---------------- #
+class AudioStreamView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, session_id):
+        lang = request.query_params.get("language", "en")
+        if not get_tts_backend().supports(lang):
+            return Response({"error": f"Unsupported language: {lang}"}, status=400)
+
+        try:
+            session = await SummarizationSession.objects.aget(id=session_id, user=request.user)
+        except SummarizationSession.DoesNotExist:
+            return Response({"error": "Session not found"}, status=404)
+
+        # Wait for the first segment so failures still get a JSON error
+        segments = stream_audio(session, lang)
+        try:
+            first = await anext(segments)
+        except StopAsyncIteration:
+            return Response({"error": "No audio was produced."}, status=500)
+        except Exception as e:
+            return Response({"error": str(e)}, status=500)
+
+        async def body():
+            yield first
+            async for segment in segments:
+                yield segment
+
+        response = StreamingHttpResponse(body(), content_type="audio/mpeg")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
@@ -0,0 +1,314 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .llm import agenerate_text, generate_text
+
+# Characters of document text sent to Gemini in a single summarize prompt
+PROMPT_CHAR_LIMIT = 12000
+
+# Split points tried in order when chunking: page breaks, markdown headings,
+# paragraphs, lines, sentences, words
+CHUNK_SEPARATORS = ["\f", "\n#", "\n\n", "\n", ". ", " "]
+
+MODE_SINGLE = "single"
+MODE_HIERARCHICAL = "hierarchical"
+MODE_AUTO = "auto"
+MODES = (MODE_SINGLE, MODE_HIERARCHICAL, MODE_AUTO)
+
+
+# ---------------- PROMPTS ---------------- #
+def build_summary_prompt(content, source_label="📄 Document Content"):
+    return f"""
+You are a professional document analyst. 
+Summarize the following document(s) into a **highly detailed, well-structured Markdown report**.
+
+⚠️ IMPORTANT: 
+- Use clear markdown headers: `### 1. Overview`, `### 2. Important Details`, etc. 
+- Always use bullet points (`- ...`) for lists, never long paragraphs. 
+- Highlight key terms/dates/names in **bold**.
+- Add line breaks between sections for readability.
+
+Your output MUST strictly follow this structure:
+
+### 1. Overview
+(2–4 sentences max, in plain text.)
+
+### 2. Important Details
+- **Clause/Instruction** → explanation
+- **Date/Name/Number** → explanation
+- (Continue listing EVERYTHING important)
+
+### 3. Context & Purpose
+- Why the document exists
+- Who it is for
+- How it is used
+
+### 4. Implications
+- **Rule broken** → consequence
+- **Missed requirement** → penalty
+
+### 5. Extra Observations
+- Errors, missing parts, inconsistencies
+- Anything unusual or noteworthy
+
+### 6. Verbatim Quotes
+- "Copy key phrases here"
+- "Use exact wording from the text"
+
+---
+{source_label}:
+{content}
+"""
+
+
+def build_map_prompt(chunk, index, total):
+    return f"""
+You are summarizing part {index} of {total} of a longer document.
+Write dense bullet-point notes (`- ...`) that keep EVERY important clause, instruction,
+date, name, number, obligation and penalty in this part. Copy short key phrases verbatim
+in quotes. Do not add an introduction or conclusion.
+
+---
+📄 Document Part {index}/{total}:
+{chunk}
+"""
+
+
+def build_combine_prompt(partials):
+    joined = "\n\n".join(f"--- Notes {i} ---\n{p}" for i, p in enumerate(partials, 1))
+    return f"""
+Merge the following consecutive sets of notes about one document into a single set of
+dense bullet-point notes. Keep every clause, date, name, number, obligation, penalty and
+verbatim quote; only remove exact duplicates. Do not add an introduction or conclusion.
+
+{joined}
+"""
+
+
+def format_turns(messages):
+    speakers = {"user": "User", "assistant": "Assistant"}
+    return "\n\n".join(f"{speakers.get(m['role'], m['role'])}: {m['content']}" for m in messages)
+
+
+def build_chat_prompt(summary_text, query, excerpts=None, history=None, digest=""):
+    excerpt_block = ""
+    instructions = (
+        "Answer based ONLY on the summary context above. \n"
+        'If the summary does not mention something, reply: "⚠️ Not available in the provided summary."'
+    )
+    if excerpts:
+        numbered = "\n\n".join(f"[{i}] {excerpt}" for i, excerpt in enumerate(excerpts, start=1))
+        excerpt_block = f"""
+### Relevant Excerpts from the Document:
+{numbered}
+"""
+        instructions = (
+            "Answer based ONLY on the summary context and document excerpts above.\n"
+            'If neither mentions something, reply: "⚠️ Not available in the provided summary."'
+        )
+
+    conversation_block = ""
+    if digest:
+        conversation_block += f"""
+### Earlier Conversation (condensed):
+{digest}
+"""
+    if history:
+        conversation_block += f"""
+### Recent Conversation:
+{format_turns(history)}
+"""
+    if conversation_block:
+        instructions += "\nUse the conversation so far only to understand what the user is referring to."
+
+    return f"""
+You are chatting with a user about a previously summarized document.
+
+### Summary Context:
+{summary_text}
+{excerpt_block}{conversation_block}
+### User Query:
+{query}
+
+{instructions}
+"""
+
+
+def build_memory_prompt(digest, messages, max_words):
+    current = digest or "(empty)"
+    return f"""
+You keep the running memory of a conversation between a user and an assistant about a document.
+Update the memory below with the new messages. Keep the user's questions and goals, the facts,
+numbers and conclusions given in answers, and anything still unresolved; drop pleasantries and
+repetition. Reply with the updated memory only, as bullet points (`- ...`), at most {max_words} words.
+
+### Current Memory:
+{current}
+
+### New Messages:
+{format_turns(messages)}
+"""
+
+
+# ---------------- CHUNKING ---------------- #
+def _split(text, chunk_chars, separators):
+    if len(text) <= chunk_chars:
+        return [text]
+    if not separators:
+        return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+    separator, rest = separators[0], separators[1:]
+    pieces = text.split(separator)
+    if len(pieces) == 1:
+        return _split(text, chunk_chars, rest)
+
+    chunks = []
+    current = []
+    current_len = 0
+    for i, piece in enumerate(pieces):
+        if i:
+            piece = separator + piece  # keep the boundary with the following piece
+        if len(piece) > chunk_chars:
+            if current:
+                chunks.append("".join(current))
+                current, current_len = [], 0
+            chunks.extend(_split(piece, chunk_chars, rest))
+            continue
+        if current_len + len(piece) > chunk_chars:
+            chunks.append("".join(current))
+            current, current_len = [], 0
+        current.append(piece)
+        current_len += len(piece)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def chunk_text(text, chunk_chars):
+    """Split text into chunks of at most chunk_chars, preferring section/page boundaries."""
+    return [c.strip() for c in _split(text, chunk_chars, CHUNK_SEPARATORS) if c.strip()]
+
+
+# ---------------- SUMMARIZATION ---------------- #
+def resolve_mode(mode, text):
+    if mode == MODE_AUTO:
+        return MODE_HIERARCHICAL if len(text) > PROMPT_CHAR_LIMIT else MODE_SINGLE
+    return mode
+
+
+def max_input_chars(mode):
+    """Characters of document text worth extracting for a summarize mode."""
+    if mode == MODE_SINGLE:
+        return PROMPT_CHAR_LIMIT
+    return settings.SUMMARY_CHUNK_CHARS * settings.SUMMARY_MAX_CHUNKS
+
+
+def _check_partials(results):
+    if not all(results):
+        raise RuntimeError("Gemini returned an empty partial summary.")
+    return results
+
+
+def _generate_all(prompts):
+    """Run prompts concurrently (bounded in-flight), keeping their order."""
+    with ThreadPoolExecutor(max_workers=max(1, settings.SUMMARY_MAP_CONCURRENCY)) as pool:
+        # Each call keeps the caller's context (llm_user for fair queuing)
+        futures = [pool.submit(contextvars.copy_context().run, generate_text, prompt) for prompt in prompts]
+        return _check_partials([future.result() for future in futures])
+
+
+async def _agenerate_all(prompts):
+    semaphore = asyncio.Semaphore(max(1, settings.SUMMARY_MAP_CONCURRENCY))
+
+    async def run(prompt):
+        async with semaphore:
+            return await agenerate_text(prompt)
+
+    return _check_partials(await asyncio.gather(*(run(prompt) for prompt in prompts)))
+
+
+def _hierarchical_steps(text):
+    """
+    Map-reduce plan shared by the sync and async drivers: yields batches of
+    prompts and is sent back their results. Chunks are summarized first,
+    then the partial notes are merged SUMMARY_REDUCE_FANIN at a time for up
+    to SUMMARY_MAX_REDUCE_DEPTH rounds. Returns the six-section report
+    prompt over what is left, and stats. Text that fits one chunk and one
+    prompt skips map/reduce (stats None).
+    """
+    all_chunks = chunk_text(text, settings.SUMMARY_CHUNK_CHARS)
+    if len(all_chunks) <= 1 and len(text) <= PROMPT_CHAR_LIMIT:
+        return build_summary_prompt(text), None
+    chunks = all_chunks[:settings.SUMMARY_MAX_CHUNKS]
+
+    started = time.perf_counter()
+    partials = yield [build_map_prompt(chunk, i, len(chunks)) for i, chunk in enumerate(chunks, 1)]
+    map_seconds = time.perf_counter() - started
+
+    fanin = max(2, settings.SUMMARY_REDUCE_FANIN)
+    depth = 0
+    while len(partials) > fanin and depth < settings.SUMMARY_MAX_REDUCE_DEPTH:
+        groups = [partials[i:i + fanin] for i in range(0, len(partials), fanin)]
+        partials = yield [build_combine_prompt(group) for group in groups]
+        depth += 1
+
+    notes = "\n\n".join(partials)
+    stats = {
+        "chunks": len(chunks),
+        "chunks_skipped": len(all_chunks) - len(chunks),
+        "reduce_depth": depth,
+        "map_ms": round(map_seconds * 1000),
+        "reduce_ms": round((time.perf_counter() - started - map_seconds) * 1000),
+    }
+    return build_summary_prompt(notes, source_label="📝 Notes From All Parts"), stats
+
+
+def prepare_hierarchical_prompt(text):
+    steps = _hierarchical_steps(text)
+    try:
+        prompts = next(steps)
+        while True:
+            prompts = steps.send(_generate_all(prompts))
+    except StopIteration as finished:
+        return finished.value
+
+
+async def aprepare_hierarchical_prompt(text):
+    steps = _hierarchical_steps(text)
+    try:
+        prompts = next(steps)
+        while True:
+            prompts = steps.send(await _agenerate_all(prompts))
+    except StopIteration as finished:
+        return finished.value
+
+
+def prepare_summary_prompt(text, mode=MODE_AUTO):
+    """
+    Final report prompt for text. Returns (prompt, stats); stats is None
+    unless the hierarchical map/reduce phases ran.
+    """
+    if resolve_mode(mode, text) == MODE_HIERARCHICAL:
+        return prepare_hierarchical_prompt(text)
+    return build_summary_prompt(text[:PROMPT_CHAR_LIMIT]), None
+
+
+async def aprepare_summary_prompt(text, mode=MODE_AUTO):
+    if resolve_mode(mode, text) == MODE_HIERARCHICAL:
+        return await aprepare_hierarchical_prompt(text)
+    return build_summary_prompt(text[:PROMPT_CHAR_LIMIT]), None
+
+
+def summarize_text(text, mode=MODE_AUTO):
+    """Returns (summary_text, stats); stats is None for single-prompt summaries."""
+    prompt, stats = prepare_summary_prompt(text, mode)
+    return generate_text(prompt), stats
+
+
+async def asummarize_text(text, mode=MODE_AUTO):
+    prompt, stats = await aprepare_summary_prompt(text, mode)
+    return await agenerate_text(prompt), stats
@@ -0,0 +1,674 @@
+import csv
+import itertools
+import json
+import math
+import random
+import re
+
+import numpy as np
+
+# Column-wise digests of CSV and JSON data, for the summarizer instead of raw
+# rows. Rows are streamed in batches of BATCH_ROWS; every column of a batch
+# becomes a numpy string array and its statistics (nulls, numeric min/max/
+# mean/std, date range, text lengths, value counts) are computed on the whole
+# array at once. Memory is bounded by the batch, the capped value counters and
+# the row samples, not by the size of the file.
+#
+# No Django imports: runs in the extraction process pool like parsers.py.
+
+BATCH_ROWS = 10000
+# Decoded JSON records are much larger than CSV rows
+JSON_BATCH_ROWS = 2000
+MAX_COLUMNS = 100
+SAMPLE_ROWS = 10
+HEAD_ROWS = 5
+TOP_VALUES = 5
+# Distinct values counted per column; past this the counter keeps the most frequent half
+COUNTER_CAPACITY = 2000
+# Sampled cells and shown values are cut to this many characters
+MAX_CELL_CHARS = 80
+CSV_SNIFF_BYTES = 64 * 1024
+JSON_READ_CHARS = 256 * 1024
+# A single JSON value (record, field) is read ahead at most this far before giving up
+JSON_MAX_VALUE_CHARS = 16 * 1024 * 1024
+# Fields of a root object beside its table are kept short: arrays are cut to
+# MAX_FIELD_ITEMS elements, other values longer than MAX_FIELD_CHARS skipped
+MAX_FIELD_ITEMS = MAX_COLUMNS
+MAX_FIELD_CHARS = 64 * 1024
+
+STRING = np.dtypes.StringDType()
+
+
+def _tokens(*words):
+    # Common spellings are listed instead of lowercasing every cell (much slower)
+    return np.array(sorted({form for word in words for form in (word, word.upper(), word.title())}), dtype=STRING)
+
+
+NULL_TOKENS = _tokens("", "null", "none", "nan", "n/a", "na", "-")
+BOOLEAN_TOKENS = _tokens("true", "false", "yes", "no")
+
+
+# ---------------- COLUMN STATISTICS ---------------- #
+class Column:
+    """Running statistics of one column, updated a batch (numpy string array) at a time."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.numeric = True
+        self.integer = True
+        self.boolean = True
+        self.date = True
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.first_date = None
+        self.last_date = None
+        self.length_min = None
+        self.length_max = 0
+        self.length_total = 0
+        self.counts = {}
+        self.counts_pruned = False
+        self.high_cardinality = False
+
+    def update(self, values):
+        values = np.strings.strip(values)
+        null = np.isin(values, NULL_TOKENS)
+        present = values[~null]
+        self.nulls += int(null.sum())
+        self.count += present.size
+        if not present.size:
+            return
+
+        if self.numeric:
+            try:
+                numbers = present.astype(np.float64)
+            except ValueError:
+                self.numeric = self.integer = False
+            else:
+                if not np.isfinite(numbers).all():
+                    self.numeric = self.integer = False
+                else:
+                    self.minimum = min(self.minimum, float(numbers.min()))
+                    self.maximum = max(self.maximum, float(numbers.max()))
+                    self.total += float(numbers.sum())
+                    self.total_sq += float(np.square(numbers).sum())
+                    if self.integer:
+                        self.integer = not any((np.strings.find(present, char) >= 0).any() for char in ".eE")
+
+        if self.date and not self.numeric:
+            try:
+                dates = present.astype("datetime64[s]")
+            except ValueError:
+                self.date = False
+            else:
+                first, last = dates.min(), dates.max()
+                self.first_date = first if self.first_date is None else min(self.first_date, first)
+                self.last_date = last if self.last_date is None else max(self.last_date, last)
+
+        if self.boolean:
+            self.boolean = bool(np.isin(present, BOOLEAN_TOKENS).all())
+
+        lengths = np.strings.str_len(present)
+        self.length_min = int(lengths.min()) if self.length_min is None else min(self.length_min, int(lengths.min()))
+        self.length_max = max(self.length_max, int(lengths.max()))
+        self.length_total += int(lengths.sum())
+
+        if not self.high_cardinality:
+            self._count_values(present)
+
+    def _count_values(self, present):
+        distinct, counts = np.unique(present, return_counts=True)
+        # Mostly unique values (ids, free text, measurements): stop counting
+        if len(self.counts) + distinct.size > COUNTER_CAPACITY and distinct.size > present.size // 2:
+            self.high_cardinality = True
+            self.counts = {}
+            return
+        # Only the batch's most frequent values are merged into the counter
+        if distinct.size > COUNTER_CAPACITY:
+            keep = np.argpartition(counts, -COUNTER_CAPACITY)[-COUNTER_CAPACITY:]
+            distinct, counts = distinct[keep], counts[keep]
+            self.counts_pruned = True
+        for value, n in zip(distinct.tolist(), counts.tolist()):
+            self.counts[value] = self.counts.get(value, 0) + n
+        if len(self.counts) > COUNTER_CAPACITY:
+            ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+            self.counts = dict(ranked[:COUNTER_CAPACITY // 2])
+            self.counts_pruned = True
+
+    @property
+    def kind(self):
+        if not self.count:
+            return "empty"
+        if self.numeric:
+            return "integer" if self.integer else "number"
+        if self.boolean:
+            return "boolean"
+        if self.date:
+            return "date"
+        return "text"
+
+    def describe(self):
+        """One line: name, type, nulls, then the statistics that fit the type."""
+        parts = [f"{self.name} ({self.kind})", f"nulls {self.nulls:,}"]
+        if self.count and self.numeric:
+            mean = self.total / self.count
+            std = math.sqrt(max(self.total_sq / self.count - mean * mean, 0.0))
+            parts.append(f"min {_number(self.minimum)}, max {_number(self.maximum)}, "
+                         f"mean {_number(mean)}, std {_number(std)}")
+        elif self.count and self.date and not self.boolean:
+            parts.append(f"from {_date(self.first_date)} to {_date(self.last_date)}")
+        elif self.count and not self.boolean:
+            parts.append(f"length {self.length_min}-{self.length_max} "
+                         f"(mean {self.length_total / self.count:.1f})")
+
+        if self.high_cardinality:
+            parts.append("mostly distinct values")
+        elif self.counts:
+            distinct = f"{len(self.counts):,}{'+' if self.counts_pruned else ''}"
+            top = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:TOP_VALUES]
+            shown = ", ".join(f"{_cell(value)!r} ×{n:,}" for value, n in top)
+            parts.append(f"{distinct} distinct, top: {shown}")
+        return "- " + "; ".join(parts)
+
+
+def _number(value):
+    if value == int(value) and abs(value) < 1e15:
+        return f"{int(value):,}"
+    return f"{value:,.4g}" if abs(value) >= 1e-3 else f"{value:.4g}"
+
+
+def _date(value):
+    text = str(value)
+    return text[:10] if text.endswith("T00:00:00") else text
+
+
+def _cell(value):
+    value = str(value)
+    return value if len(value) <= MAX_CELL_CHARS else value[:MAX_CELL_CHARS - 1] + "…"
+
+
+# ---------------- TABLE DIGEST ---------------- #
+class Sampler:
+    """Reservoir sample of rows (Algorithm L: random draws only when a row is taken)."""
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.rows = []
+        self.random = random.Random(seed)
+        self.weight = 1.0
+        self.next_index = size  # 1-based index of the next row to take
+        self._advance()
+
+    def _draw(self):
+        return math.log(self.random.random() or 1e-300)
+
+    def _advance(self):
+        self.weight *= math.exp(self._draw() / self.size)
+        self.next_index += math.floor(self._draw() / math.log1p(-min(self.weight, 1 - 1e-16))) + 1
+
+    def offer(self, start, batch):
+        """Consider the batch of rows numbered from start (0-based)."""
+        fill = min(self.size - len(self.rows), len(batch))
+        self.rows.extend((start + i, batch[i]) for i in range(fill))
+        end = start + len(batch)
+        while self.next_index <= end:
+            index = self.next_index - 1
+            self.rows[self.random.randrange(self.size)] = (index, batch[index - start])
+            self._advance()
+
+
+class TableDigest:
+    """Feeds batches of rows (lists of cells) to one Column per header, and keeps row samples."""
+
+    def __init__(self, header):
+        self.columns = []
+        self.dropped_columns = 0
+        self.rows = 0
+        self.head = []
+        self.sampler = Sampler(SAMPLE_ROWS)
+        for name in header:
+            self.add_column(name)
+
+    def add_column(self, name):
+        """Add a column (JSON records may bring new keys); it is null in the rows seen so far."""
+        if len(self.columns) >= MAX_COLUMNS:
+            self.dropped_columns += 1
+            return False
+        column = Column(_cell(name) or f"column_{len(self.columns) + 1}")
+        column.nulls = self.rows
+        self.columns.append(column)
+        return True
+
+    def add_batch(self, batch):
+        width = len(self.columns)
+        if set(map(len, batch)) != {width}:
+            batch = [row[:width] if len(row) >= width else row + [""] * (width - len(row)) for row in batch if row]
+        if not batch or not width:
+            return
+        if len(self.head) < HEAD_ROWS:
+            self.head.extend(batch[:HEAD_ROWS - len(self.head)])
+        self.sampler.offer(self.rows, batch)
+        self.rows += len(batch)
+        cells = np.array(batch, dtype=STRING)
+        for index, column in enumerate(self.columns):
+            column.update(cells[:, index])
+
+    def _row(self, row):
+        return " | ".join(_cell(value) for value in row)
+
+    def render(self, title):
+        lines = [f"{title}: {self.rows:,} rows × {len(self.columns)} columns"]
+        if self.dropped_columns:
+            lines.append(f"({self.dropped_columns} more columns not analysed)")
+        lines.append("")
+        lines.append("Columns:")
+        lines.extend(column.describe() for column in self.columns)
+        if self.head:
+            lines.append("")
+            lines.append("First rows:")
+            lines.append(self._row(column.name for column in self.columns))
+            lines.extend(self._row(row) for row in self.head)
+        sampled = [row for index, row in sorted(self.sampler.rows) if index >= len(self.head)]
+        if sampled:
+            lines.append("")
+            lines.append("Random sample of rows:")
+            lines.extend(self._row(row) for row in sampled)
+        return "\n".join(lines)
+
+
+def _batches(rows, size=BATCH_ROWS):
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+# ---------------- CSV ---------------- #
+CSV_DELIMITERS = ",;\t|"
+
+
+def _sniff(sample):
+    """Dialect and whether the first row is a header, guessed from the start of the file."""
+    sniffer = csv.Sniffer()
+    try:
+        dialect = sniffer.sniff(sample, delimiters=CSV_DELIMITERS)
+        if sniffer.has_header(sample):
+            return dialect, True
+        # The sample may end mid-row
+        rows = [row for row in csv.reader(sample.splitlines()[:-1] or [sample], dialect) if row]
+        return dialect, _looks_like_header(rows)
+    except csv.Error:
+        # Ragged rows defeat the sniffer: use the most frequent delimiter of the first line
+        first_line = next(line for line in sample.splitlines() if line.strip())
+        dialect = csv.excel()
+        dialect.delimiter = max(CSV_DELIMITERS, key=first_line.count)
+        first_row = next(csv.reader([first_line], dialect), [])
+        return dialect, not all(_is_number(cell) for cell in first_row)
+
+
+def _looks_like_header(rows):
+    """
+    has_header votes "no header" when every column is text: a first row of
+    distinct non-numeric names that never recur in their column is one.
+    """
+    if len(rows) < 2:
+        return False
+    first = rows[0]
+    if len(set(first)) != len(first) or any(not cell.strip() or _is_number(cell) for cell in first):
+        return False
+    return all(row[i] != name for row in rows[1:] for i, name in enumerate(first[:len(row)]))
+
+
+def _is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+def csv_digest(stream):
+    """Digest of a CSV text stream (opened with newline=""); delimiter and header are sniffed."""
+    sample = stream.read(CSV_SNIFF_BYTES)
+    if not sample.strip():
+        return ""
+    dialect, has_header = _sniff(sample)
+    stream.seek(0)
+    reader = csv.reader(stream, dialect)
+
+    first = next((row for row in reader if row), None)
+    if first is None:
+        return ""
+    if has_header:
+        digest = TableDigest(first)
+    else:
+        digest = TableDigest([f"column_{i + 1}" for i in range(len(first))])
+        digest.add_batch([first])
+    for batch in _batches(reader):
+        digest.add_batch(batch)
+    return digest.render("CSV table")
+
+
+
+# ---------------- JSON ---------------- #
+_JSON_STRUCTURE = re.compile(r'[\[\]{}"]')
+_JSON_STRING_END = re.compile(r'["\\]')
+
+
+class JSONValueTooLong(ValueError):
+    pass
+
+
+class JSONStream:
+    """Reads JSON values one at a time from a text stream, so arrays can be walked element by element."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=JSON_READ_CHARS):
+        chunk = self.stream.read(size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character ("" at the end), without consuming it."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Invalid JSON: expected {char!r} at {self.peek()!r}")
+        self.pos += 1
+
+    def value(self, limit=None):
+        """
+        The next value. Past limit characters (default JSON_MAX_VALUE_CHARS)
+        JSONValueTooLong is raised, with the stream left at the value's start.
+        """
+        limit = limit or JSON_MAX_VALUE_CHARS
+        self.peek()
+        size = JSON_READ_CHARS
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # Only a value cut off by the buffer end (or an open string) can be completed by reading on
+                if e.pos < len(self.buffer) - 16 and not e.msg.startswith("Unterminated string"):
+                    raise ValueError(f"Invalid JSON: {e.msg}")
+                end = None
+            # A value ending with the buffer may continue in the stream (numbers, literals)
+            if end is not None and end < len(self.buffer):
+                break
+            if len(self.buffer) - self.pos > limit:
+                raise JSONValueTooLong(f"JSON value longer than {limit:,} characters")
+            size *= 2  # read ahead faster for big values, each retry decodes from the start
+            if not self._fill(size):
+                if end is None:
+                    raise ValueError("Invalid JSON document")
+                break
+        if end - self.pos > limit:
+            raise JSONValueTooLong(f"JSON value longer than {limit:,} characters")
+        self.pos = end
+        return value
+
+    def skip(self):
+        """Move past the string, array or object starting here without decoding it."""
+        self.peek()
+        depth = 0
+        in_string = False
+        while True:
+            match = (_JSON_STRING_END if in_string else _JSON_STRUCTURE).search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+            elif match.group() == "\\" and match.end() == len(self.buffer):
+                self.pos = match.start()  # the escaped character is in the next chunk
+            elif match.group() == "\\":
+                self.pos = match.end() + 1
+                continue
+            else:
+                self.pos = match.end()
+                char = match.group()
+                if char == '"':
+                    in_string = not in_string
+                else:
+                    depth += 1 if char in "[{" else -1
+                if depth == 0 and not in_string:
+                    return
+                continue
+            if not self._fill():
+                raise ValueError("Invalid JSON document")
+
+    def items(self):
+        """Elements of the array starting here, decoded lazily."""
+        self.take("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Invalid JSON: expected ',' or ']' at {char!r}")
+
+    def values(self):
+        """Top-level values until the end (JSON Lines)."""
+        while self.peek():
+            yield self.value()
+
+
+def _text(value):
+    """A JSON value as cell text."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _flatten(value, prefix, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(item, f"{prefix}.{key}" if prefix else str(key), out)
+    else:
+        out[prefix] = _text(value)
+    return out
+
+
+def _capped(items):
+    """The first MAX_FIELD_ITEMS elements of an array; the others are counted, not kept."""
+    kept = list(itertools.islice(items, MAX_FIELD_ITEMS))
+    more = sum(1 for _ in items)
+    if more:
+        kept.append(f"… {more:,} more items")
+    return kept
+
+
+def _field(reader):
+    """A field of a root object other than its table, kept short."""
+    if reader.peek() == "[":
+        return _capped(reader.items())
+    try:
+        return reader.value(MAX_FIELD_CHARS)
+    except JSONValueTooLong:
+        reader.skip()
+        return f"… more than {MAX_FIELD_CHARS:,} characters, skipped"
+
+
+def _object_records(reader, fields, found):
+    """
+    Walk a root object, keeping its other fields (see _field), and yield the
+    elements of its first array of objects or arrays (the table); found[0]
+    is set to that array's key.
+    """
+    reader.take("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.value()
+        reader.take(":")
+        if found[0] is None and reader.peek() == "[":
+            items = reader.items()
+            first = next(items, None)
+            if isinstance(first, (dict, list)):
+                found[0] = key
+                yield first
+                yield from items
+            else:
+                fields[key] = _capped(itertools.chain([] if first is None else [first], items))
+        else:
+            fields[key] = _field(reader)
+        char = reader.peek()
+        reader.pos += 1
+        if char == "}":
+            return
+        if char != ",":
+            raise ValueError(f"Invalid JSON: expected ',' or '}}' at {char!r}")
+
+
+def _digest_records(records):
+    digest = TableDigest([])
+    keys = []
+    known = set()
+    for batch in _batches(records, JSON_BATCH_ROWS):
+        flat = [_flatten(record if isinstance(record, dict) else {"value": record}, "", {}) for record in batch]
+        for row in flat:
+            for key in row:
+                if key not in known:
+                    known.add(key)
+                    if digest.add_column(key):
+                        keys.append(key)
+        digest.add_batch([[row.get(key, "") for key in keys] for row in flat])
+    return digest
+
+
+def _value_end(text, start, stop):
+    """End of the array or object at text[start] if it closes before stop, else None."""
+    depth = 0
+    in_string = False
+    pos = start
+    while True:
+        match = (_JSON_STRING_END if in_string else _JSON_STRUCTURE).search(text, pos, stop)
+        if match is None:
+            return None
+        char = match.group()
+        if char == "\\":
+            pos = match.end() + 1
+            continue
+        pos = match.end()
+        if char == '"':
+            in_string = not in_string
+        else:
+            depth += 1 if char in "[{" else -1
+        if depth == 0 and not in_string:
+            return pos
+
+
+def _is_json_lines(reader):
+    """
+    Whether the object starting here is the first line of JSON Lines: it
+    closes on its first line and another value follows. Scans the buffer
+    without decoding or consuming anything.
+    """
+    reader.peek()
+    size = JSON_READ_CHARS
+    while (newline := reader.buffer.find("\n", reader.pos)) < 0:
+        if len(reader.buffer) - reader.pos > JSON_MAX_VALUE_CHARS or not reader._fill(size):
+            return False
+        size *= 2
+    end = _value_end(reader.buffer, reader.pos, newline)
+    if end is None or reader.buffer[end:newline].strip():
+        return False
+    # _fill keeps the buffer from reader.pos on, so offsets from it stay valid
+    rest = newline + 1 - reader.pos
+    while not reader.buffer[reader.pos + rest:].strip():
+        if not reader._fill():
+            return False
+    return True
+
+
+def _is_text_row(row):
+    return isinstance(row, list) and bool(row) and all(isinstance(cell, str) for cell in row)
+
+
+def _digest_rows(rows, header=None):
+    """
+    Digest of rows given as arrays. Without a header, a first row of strings
+    followed by one that isn't (numbers, nulls...) is taken as the header.
+    """
+    rows = iter(rows)
+    if header is None:
+        leading = list(itertools.islice(rows, 2))
+        if len(leading) == 2 and _is_text_row(leading[0]) and not _is_text_row(leading[1]):
+            header = leading.pop(0)
+        else:
+            first = leading[0] if leading else []
+            header = [""] * (len(first) if isinstance(first, list) else 1)
+        rows = itertools.chain(leading, rows)
+    digest = TableDigest([_text(name) for name in header])
+    for batch in _batches(rows, JSON_BATCH_ROWS):
+        digest.add_batch([[_text(cell) for cell in row] if isinstance(row, list) else [_text(row)] for row in batch])
+    return digest
+
+
+def json_digest(stream):
+    """
+    Digest of a JSON text stream: a root array (of objects or of arrays), the
+    first such array in a root object, or JSON Lines. Other documents are
+    pretty-printed.
+    """
+    reader = JSONStream(stream)
+    first = reader.peek()
+    if not first:
+        return ""
+    if first == "[":
+        items = reader.items()
+        head = next(items, None)
+        if isinstance(head, list):
+            return _digest_rows(itertools.chain([head], items)).render("JSON array")
+        return _digest_records(itertools.chain([] if head is None else [head], items)).render("JSON array")
+    if first != "{":
+        return json.dumps(reader.value(), indent=2, ensure_ascii=False)
+    if _is_json_lines(reader):
+        # Checked first: the arrays of a record must not be taken for the table of a single document
+        return _digest_records(reader.values()).render("JSON Lines")
+
+    fields = {}
+    found = [None]
+    records = _object_records(reader, fields, found)
+    head = next(records, None)
+    if head is not None:
+        if isinstance(head, list):
+            # pandas "split" layout: {"columns": [...], "index": [...], "data": [[...], ...]}
+            columns = fields.pop("columns", None)
+            header = columns[:MAX_COLUMNS] if isinstance(columns, list) and columns else None
+            digest = _digest_rows(itertools.chain([head], records), header)
+        else:
+            digest = _digest_records(itertools.chain([head], records))
+        text = digest.render(f'JSON records under "{found[0]}"')
+        if fields:
+            other = [f"- {key}: {_cell(json.dumps(value, ensure_ascii=False))}" for key, value in fields.items()]
+            text += "\n\nOther fields:\n" + "\n".join(other)
+        return text
+    if reader.peek():
+        # More values after a first object spanning several lines
+        return _digest_records(itertools.chain([fields], reader.values())).render("JSON Lines")
+    return json.dumps(fields, indent=2, ensure_ascii=False)
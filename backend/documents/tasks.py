@@ -0,0 +1,340 @@
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import BackgroundJob, Document, SummarizationSession, SummarizeBatch, SummarizeBatchItem
+from .extraction import get_documents_text, parse_document
+from .gateway import llm_user
+from .llm import is_rate_limited
+from .memory import compact, needs_compaction
+from .search import update_document_entry, update_session_entry
+from .summarize import max_input_chars, summarize_text
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------- JOB HANDLERS ---------------- #
+def run_extraction(job):
+    try:
+        document = Document.objects.get(id=job.payload["document_id"])
+    except Document.DoesNotExist:
+        return  # deleted before the job ran
+
+    document.extraction_status = Document.EXTRACTION_PROCESSING
+    document.save(update_fields=["extraction_status"])
+
+    try:
+        text = parse_document(document)
+    except Exception as e:
+        final = job.attempts >= job.max_attempts
+        document.extraction_status = Document.EXTRACTION_FAILED if final else Document.EXTRACTION_PENDING
+        document.extraction_error = str(e)
+        document.save(update_fields=["extraction_status", "extraction_error"])
+        raise
+
+    document.extracted_text = text
+    document.extraction_status = Document.EXTRACTION_DONE
+    document.extraction_error = ""
+    document.extracted_at = timezone.now()
+    document.save(update_fields=["extracted_text", "extraction_status", "extraction_error", "extracted_at"])
+
+    from .retrieval import index_document  # numpy: only imported by workers that index
+
+    try:
+        index_document(document, text)
+    except Exception:
+        # Chat retries indexing on demand; the extraction itself succeeded
+        logger.exception("Indexing document %s for retrieval failed", document.pk)
+    update_document_entry(document)
+
+
+def run_search_index(job):
+    if "document_id" in job.payload:
+        document = Document.objects.filter(id=job.payload["document_id"]).first()
+        if document is not None:
+            update_document_entry(document)
+    else:
+        session = SummarizationSession.objects.filter(id=job.payload["session_id"]).first()
+        if session is not None:
+            update_session_entry(session)
+
+
+def run_memory_compaction(job):
+    session = SummarizationSession.objects.filter(id=job.payload["session_id"]).first()
+    if session is not None:
+        compact(session)
+
+
+def run_summarize(job):
+    item = SummarizeBatchItem.objects.select_related("batch", "document").filter(id=job.payload["item_id"]).first()
+    if item is None:
+        return  # batch deleted before the job ran
+    item.status = SummarizeBatchItem.STATUS_RUNNING
+    item.save(update_fields=["status", "updated_at"])
+
+    mode = item.batch.mode
+    try:
+        text = get_documents_text([item.document], max_chars=max_input_chars(mode))[0]
+        if not text.strip():
+            raise ValueError("No readable text could be extracted (scanned PDFs need OCR).")
+        with llm_user(item.batch.user_id):
+            summary_text, _ = summarize_text(text, mode)
+        if not summary_text:
+            raise RuntimeError("Gemini returned no summary text.")
+        # Storing the session is guarded too: a failure must not leave the item RUNNING
+        with transaction.atomic():
+            item.session = SummarizationSession.create_for_documents(item.batch.user, [item.document], summary_text)
+            item.status = SummarizeBatchItem.STATUS_DONE
+            item.error = ""
+            item.save(update_fields=["session", "status", "error", "updated_at"])
+            enqueue_search_update(session=item.session)
+    except Exception as e:
+        # Rate-limited jobs are retried without using up an attempt
+        final = job.attempts >= job.max_attempts and not is_rate_limited(e)
+        item.session = None
+        item.status = SummarizeBatchItem.STATUS_FAILED if final else SummarizeBatchItem.STATUS_QUEUED
+        item.error = str(e)
+        item.save(update_fields=["session", "status", "error", "updated_at"])
+        raise
+
+
+HANDLERS = {
+    BackgroundJob.KIND_EXTRACT: run_extraction,
+    BackgroundJob.KIND_INDEX: run_search_index,
+    BackgroundJob.KIND_MEMORY: run_memory_compaction,
+    BackgroundJob.KIND_SUMMARIZE: run_summarize,
+}
+
+
+# ---------------- ENQUEUE ---------------- #
+def enqueue(kind, payload):
+    job = BackgroundJob.objects.create(
+        kind=kind,
+        payload=payload,
+        max_attempts=settings.BACKGROUND_JOB_MAX_ATTEMPTS,
+    )
+    # Only wake workers once the job row is visible to other connections
+    transaction.on_commit(wake_worker)
+    return job
+
+
+def enqueue_summarize_batch(user, documents, mode):
+    """
+    Create a SummarizeBatch with one summarize job per document. The user's
+    jobs share a group, so a large batch never holds more than
+    BACKGROUND_JOB_GROUP_CONCURRENCY workers while other users wait.
+    """
+    with transaction.atomic():
+        batch = SummarizeBatch.objects.create(user=user, mode=mode)
+        items = SummarizeBatchItem.objects.bulk_create(
+            [SummarizeBatchItem(batch=batch, document=document) for document in documents]
+        )
+        BackgroundJob.objects.bulk_create(
+            [
+                BackgroundJob(
+                    kind=BackgroundJob.KIND_SUMMARIZE,
+                    payload={"item_id": item.id},
+                    group=f"user:{user.id}",
+                    max_attempts=settings.BACKGROUND_JOB_MAX_ATTEMPTS,
+                )
+                for item in items
+            ],
+            batch_size=500,
+        )
+        transaction.on_commit(wake_worker)
+    return batch
+
+
+def enqueue_extraction(document):
+    return enqueue(BackgroundJob.KIND_EXTRACT, {"document_id": document.id})
+
+
+def enqueue_once(kind, payload):
+    """enqueue unless an identical job is still waiting to run."""
+    pending = BackgroundJob.objects.filter(kind=kind, status=BackgroundJob.STATUS_QUEUED, payload=payload)
+    if pending.exists():
+        return None
+    return enqueue(kind, payload)
+
+
+def enqueue_search_update(document=None, session=None):
+    """Refresh the search entry of a document or session (once per pending change)."""
+    payload = {"document_id": document.id} if document is not None else {"session_id": session.id}
+    return enqueue_once(BackgroundJob.KIND_INDEX, payload)
+
+
+def enqueue_memory_compaction(session):
+    """Compress older chat messages once they no longer fit the history budget."""
+    if not needs_compaction(session):
+        return None
+    return enqueue_once(BackgroundJob.KIND_MEMORY, {"session_id": session.id})
+
+
+# ---------------- WORKER ---------------- #
+def _saturated_groups(stale_before):
+    return (
+        BackgroundJob.objects.filter(status=BackgroundJob.STATUS_RUNNING, locked_at__gte=stale_before)
+        .exclude(group="")
+        .order_by()
+        .values("group")
+        .annotate(running=Count("id"))
+        .filter(running__gte=settings.BACKGROUND_JOB_GROUP_CONCURRENCY)
+        .values("group")
+    )
+
+
+def claim_next_job():
+    """Atomically move the oldest runnable job to RUNNING and return it."""
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.BACKGROUND_JOB_LOCK_TIMEOUT)
+
+    while True:
+        with transaction.atomic():
+            job = (
+                BackgroundJob.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=BackgroundJob.STATUS_QUEUED, run_after__lte=now)
+                    # Jobs left RUNNING by a crashed worker are picked up again
+                    | Q(status=BackgroundJob.STATUS_RUNNING, locked_at__lt=stale_before)
+                )
+                .exclude(group__in=_saturated_groups(stale_before))
+                .order_by("run_after", "id")
+                .first()
+            )
+            if job is None:
+                return None
+
+            # Compare-and-set, for databases without row locks (SQLite with several worker threads)
+            claimed = BackgroundJob.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts).update(
+                status=BackgroundJob.STATUS_RUNNING, attempts=F("attempts") + 1, locked_at=now, updated_at=now
+            )
+            if not claimed:
+                continue
+        job.status = BackgroundJob.STATUS_RUNNING
+        job.attempts += 1
+        job.locked_at = now
+        return job
+
+
+@contextmanager
+def _heartbeat(job):
+    """
+    Refresh the job's locked_at every third of BACKGROUND_JOB_LOCK_TIMEOUT
+    while the block runs, so only jobs of a dead worker go stale and are
+    claimed again.
+    """
+    stop = threading.Event()
+    interval = settings.BACKGROUND_JOB_LOCK_TIMEOUT / 3
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    # No-op once another worker has reclaimed the job (attempts moved on)
+                    BackgroundJob.objects.filter(
+                        pk=job.pk, status=BackgroundJob.STATUS_RUNNING, attempts=job.attempts
+                    ).update(locked_at=timezone.now())
+                except Exception:
+                    logger.exception("Heartbeat of background job %s failed", job.pk)
+        finally:
+            connection.close()  # this thread's connection
+
+    thread = threading.Thread(target=beat, name=f"documents-heartbeat-{job.pk}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    handler = HANDLERS[job.kind]
+    try:
+        with _heartbeat(job):
+            handler(job)
+    except Exception as e:
+        job.last_error = str(e)
+        if is_rate_limited(e):
+            # Gemini quota exhausted: back off without using up an attempt
+            logger.warning("Background job %s rate limited by Gemini, retrying later", job.pk)
+            job.attempts -= 1
+            job.status = BackgroundJob.STATUS_QUEUED
+            delay = settings.BACKGROUND_JOB_RATE_LIMIT_DELAY * random.uniform(1, 2)
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            logger.exception("Background job %s failed", job.pk)
+            if job.attempts >= job.max_attempts:
+                job.status = BackgroundJob.STATUS_FAILED
+            else:
+                # Exponential backoff with jitter before the next attempt
+                delay = (2 ** job.attempts) + random.uniform(0, 1)
+                job.status = BackgroundJob.STATUS_QUEUED
+                job.run_after = timezone.now() + timedelta(seconds=delay)
+    else:
+        job.status = BackgroundJob.STATUS_DONE
+        job.last_error = ""
+    job.locked_at = None
+    job.save(update_fields=["status", "attempts", "last_error", "run_after", "locked_at", "updated_at"])
+
+
+def work(stop_event=None, once=False):
+    """Drain the queue, sleeping between polls until stop_event is set."""
+    poll_interval = settings.BACKGROUND_JOB_POLL_SECONDS
+    while not (stop_event and stop_event.is_set()):
+        close_old_connections()
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+            continue
+        if once:
+            return
+        _wake_event.wait(poll_interval)
+        _wake_event.clear()
+
+
+# ---------------- IN-PROCESS WORKER ---------------- #
+_wake_event = threading.Event()
+_worker_lock = threading.Lock()
+_worker_pid = None
+
+
+def wake_worker():
+    if settings.BACKGROUND_WORKER_IN_PROCESS:
+        start_in_process_worker()
+    _wake_event.set()
+
+
+def start_in_process_worker():
+    """
+    Start BACKGROUND_WORKER_THREADS daemon threads draining the queue inside
+    this web process, so a deployment without a separate `process_jobs`
+    worker still extracts text. Guarded by pid so forked gunicorn workers
+    each get their own threads.
+    """
+    global _worker_pid
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+        for n in range(max(1, settings.BACKGROUND_WORKER_THREADS)):
+            thread = threading.Thread(target=_run_in_process_worker, name=f"documents-worker-{n}", daemon=True)
+            thread.start()
+
+
+def _run_in_process_worker():
+    while True:
+        try:
+            work()
+        except Exception:
+            logger.exception("In-process worker crashed, restarting")
+            time.sleep(settings.BACKGROUND_JOB_POLL_SECONDS)
@@ -1,3 +1,1982 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import cloudinary
+import httpx
+import numpy as np
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import audio, cache, extraction, gateway, llm, markup, memory, ocr, parsers, retrieval, search, streaming, summarize, tabular, tasks, views
+from .benchmarking import measure_startup
+from .gateway import CircuitBreaker, CircuitOpenError, Gateway, QueueTimeoutError
+from .extraction import EXTRACTION_VERSION, _get_cached, _Spool, document_content_key, find_extractor
+from .extractors import Extractor
+from .instrumentation import start_request_timings, stop_request_timings
+from .models import (
+    AudioArtifact, BackgroundJob, Document, DocumentChunk, ExtractedText, RateLimitBucket, SummarizationMessage,
+    SummarizationSession, SummarizeBatch, SummarizeBatchItem,
+)
+from .tts import TTSBackend, asynthesize, split_text, strip_id3
+
+
+_cloudinary_config = {}
+
+
+def setUpModule():
+    # Document.filename builds a Cloudinary URL: give the SDK a cloud name so
+    # the suite doesn't depend on CLOUDINARY_URL being set
+    config = cloudinary.config()
+    _cloudinary_config.update(config.__dict__)
+    cloudinary.config(cloud_name="test")
+
+
+def tearDownModule():
+    config = cloudinary.config()
+    config.__dict__.clear()
+    config.__dict__.update(_cloudinary_config)
+
+
+def make_user(email="reader@example.com"):
+    return get_user_model().objects.create_user(email=email)
+
+
+def make_document(user, name="report.pdf", content_hash="", **fields):
+    document = Document.objects.create(
+        user=user, file=f"documents/{name}", content_hash=content_hash or name.ljust(64, "0"), **fields
+    )
+    # Reloaded so file is a CloudinaryResource, as in views
+    return Document.objects.get(pk=document.pk)
+
+
+def query_plan(queryset):
+    """EXPLAIN output; PostgreSQL seq scans are disabled so tiny test tables still show the index choice."""
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+    return queryset.explain()
+
+
+# ---------------- QUERY PLANS ---------------- #
+class HotQueryPlanTests(TestCase):
+    def test_summaries_list_uses_user_created_index(self):
+        plan = query_plan(SummarizationSession.objects.filter(user_id=1).order_by("-created_at", "-id"))
+        self.assertIn("session_user_created_idx", plan)
+        # The index already returns rows newest first
+        self.assertNotRegex(plan, r"TEMP B-TREE|\bSort\b")
+
+    def test_summarize_document_lookup_is_an_index_lookup(self):
+        # Served by the primary key or the (user_id, rowid) FK index; never a full scan
+        plan = query_plan(Document.objects.filter(id__in=[1, 2, 3], user_id=1))
+        self.assertNotRegex(plan, r"\bSCAN documents_document\b|Seq Scan")
+
+
+# ---------------- EXTRACTED TEXT CACHE ---------------- #
+class ExtractedTextCacheTests(TestCase):
+    def setUp(self):
+        self.document = make_document(make_user())
+
+    def test_hit_and_miss(self):
+        cache.store_extracted_text(self.document, "a" * 64, 1, "full text")
+        self.assertEqual(cache.get_extracted_text(self.document, "a" * 64, 1), "full text")
+        self.assertIsNone(cache.get_extracted_text(self.document, "b" * 64, 1))
+        self.assertIsNone(cache.get_extracted_text(self.document, "a" * 64, 2))
+
+    def test_truncated_entry_only_serves_smaller_budgets(self):
+        cache.store_extracted_text(self.document, "a" * 64, 1, "abcdef", truncated=True)
+        self.assertEqual(cache.get_extracted_text(self.document, "a" * 64, 1, max_chars=4), "abcdef")
+        self.assertIsNone(cache.get_extracted_text(self.document, "a" * 64, 1, max_chars=10))
+        self.assertIsNone(cache.get_extracted_text(self.document, "a" * 64, 1))
+
+    def test_store_replaces_older_rows_of_the_document(self):
+        cache.store_extracted_text(self.document, "a" * 64, 1, "old file")
+        cache.store_extracted_text(self.document, "b" * 64, 1, "new file")
+        self.assertEqual(list(ExtractedText.objects.values_list("text", flat=True)), ["new file"])
+        self.assertIsNone(cache.get_extracted_text(self.document, "a" * 64, 1))
+
+    def test_hit_touches_the_entry(self):
+        cache.store_extracted_text(self.document, "a" * 64, 1, "text")
+        ExtractedText.objects.update(last_accessed_at=timezone.now() - timedelta(days=1))
+        cache.get_extracted_text(self.document, "a" * 64, 1)
+        self.assertGreater(ExtractedText.objects.get().last_accessed_at, timezone.now() - timedelta(minutes=1))
+
+    @override_settings(EXTRACTION_CACHE_MAX_BYTES=10)
+    def test_eviction_drops_least_recently_used(self):
+        user = self.document.user
+        first, second, third = self.document, make_document(user, "b.txt"), make_document(user, "c.txt")
+        cache.store_extracted_text(first, "a" * 64, 1, "aaaa")
+        cache.store_extracted_text(second, "b" * 64, 1, "bbbb")
+        ExtractedText.objects.filter(document=first).update(last_accessed_at=timezone.now() - timedelta(hours=2))
+        ExtractedText.objects.filter(document=second).update(last_accessed_at=timezone.now() - timedelta(hours=1))
+        cache.get_extracted_text(first, "a" * 64, 1)  # now the most recently used
+
+        cache.store_extracted_text(third, "c" * 64, 1, "cccc")
+
+        self.assertEqual(
+            set(ExtractedText.objects.values_list("document_id", flat=True)), {first.id, third.id}
+        )
+        self.assertLessEqual(sum(ExtractedText.objects.values_list("size_bytes", flat=True)), 10)
+
+    @override_settings(EXTRACTION_CACHE_MAX_BYTES=10)
+    def test_entries_over_the_limit_are_not_stored(self):
+        cache.store_extracted_text(self.document, "a" * 64, 1, "x" * 11)
+        self.assertFalse(ExtractedText.objects.exists())
+
+    def test_older_extraction_version_is_ignored(self):
+        key = document_content_key(self.document)
+        cache.store_extracted_text(self.document, key, EXTRACTION_VERSION - 1, "old parser output")
+        self.assertIsNone(_get_cached(self.document))
+        cache.store_extracted_text(self.document, key, EXTRACTION_VERSION, "new parser output")
+        self.assertEqual(_get_cached(self.document), "new parser output")
+
+
+# ---------------- JOB QUEUE ---------------- #
+def failing_handler(job):
+    raise RuntimeError("boom")
+
+
+@override_settings(BACKGROUND_WORKER_IN_PROCESS=False)
+class JobQueueTests(TestCase):
+    def job(self, group="", **fields):
+        return BackgroundJob.objects.create(kind=BackgroundJob.KIND_INDEX, payload={"session_id": 1}, group=group, **fields)
+
+    def test_claim_moves_the_oldest_job_to_running(self):
+        first, second = self.job(), self.job()
+        claimed = tasks.claim_next_job()
+        self.assertEqual(claimed.pk, first.pk)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (BackgroundJob.STATUS_RUNNING, 1))
+        self.assertEqual(tasks.claim_next_job().pk, second.pk)
+        self.assertIsNone(tasks.claim_next_job())
+
+    def test_claim_lost_to_another_worker_moves_on(self):
+        first, second = self.job(), self.job()
+        select = QuerySet.first
+
+        def select_then_race(queryset):
+            job = select(queryset)
+            if job is not None and job.pk == first.pk:
+                # Another worker claims the row between our select and our update
+                BackgroundJob.objects.filter(pk=job.pk).update(
+                    status=BackgroundJob.STATUS_RUNNING, attempts=1, locked_at=timezone.now()
+                )
+            return job
+
+        with mock.patch.object(QuerySet, "first", select_then_race):
+            claimed = tasks.claim_next_job()
+
+        self.assertEqual(claimed.pk, second.pk)
+        first.refresh_from_db()
+        self.assertEqual(first.attempts, 1)  # claimed once, by the other worker
+
+    def test_stale_running_job_is_claimed_again(self):
+        stale = self.job(status=BackgroundJob.STATUS_RUNNING, attempts=1, locked_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(tasks.claim_next_job().pk, stale.pk)
+
+    def test_delayed_job_waits_for_run_after(self):
+        self.job(run_after=timezone.now() + timedelta(minutes=5))
+        self.assertIsNone(tasks.claim_next_job())
+
+    @override_settings(BACKGROUND_JOB_GROUP_CONCURRENCY=2)
+    def test_group_concurrency(self):
+        grouped = [self.job(group="user:1") for _ in range(3)]
+        other = self.job(group="user:2")
+        claimed = [tasks.claim_next_job().pk for _ in range(3)]
+        self.assertEqual(claimed, [grouped[0].pk, grouped[1].pk, other.pk])
+        self.assertIsNone(tasks.claim_next_job())
+
+        BackgroundJob.objects.filter(pk=grouped[0].pk).update(status=BackgroundJob.STATUS_DONE)
+        self.assertEqual(tasks.claim_next_job().pk, grouped[2].pk)
+
+    def test_enqueue_once_skips_waiting_duplicates(self):
+        payload = {"session_id": 7}
+        job = tasks.enqueue_once(BackgroundJob.KIND_INDEX, payload)
+        self.assertIsNotNone(job)
+        self.assertIsNone(tasks.enqueue_once(BackgroundJob.KIND_INDEX, payload))
+        self.assertIsNotNone(tasks.enqueue_once(BackgroundJob.KIND_INDEX, {"session_id": 8}))
+        self.assertEqual(BackgroundJob.objects.filter(payload=payload).count(), 1)
+
+        # Once it runs, a later change needs a new job
+        tasks.claim_next_job()
+        self.assertIsNotNone(tasks.enqueue_once(BackgroundJob.KIND_INDEX, payload))
+
+    def test_failure_is_retried_with_backoff(self):
+        self.job(max_attempts=3)
+        with mock.patch.dict(tasks.HANDLERS, {BackgroundJob.KIND_INDEX: failing_handler}), \
+                self.assertLogs("documents.tasks", "ERROR"):
+            tasks.run_job(tasks.claim_next_job())
+        job = BackgroundJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), (BackgroundJob.STATUS_QUEUED, 1, "boom"))
+        self.assertIsNone(job.locked_at)
+        # 2 ** attempts seconds plus up to a second of jitter
+        delay = (job.run_after - job.updated_at).total_seconds()
+        self.assertTrue(1.9 <= delay <= 3.1, delay)
+        self.assertIsNone(tasks.claim_next_job())
+
+    def test_last_attempt_fails_the_job(self):
+        self.job(max_attempts=2, attempts=1)
+        with mock.patch.dict(tasks.HANDLERS, {BackgroundJob.KIND_INDEX: failing_handler}), \
+                self.assertLogs("documents.tasks", "ERROR"):
+            tasks.run_job(tasks.claim_next_job())
+        job = BackgroundJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (BackgroundJob.STATUS_FAILED, 2))
+        self.assertIsNone(tasks.claim_next_job())
+
+    @override_settings(BACKGROUND_JOB_RATE_LIMIT_DELAY=30)
+    def test_rate_limited_job_keeps_its_attempt(self):
+        self.job(max_attempts=1)
+        with mock.patch.dict(tasks.HANDLERS, {BackgroundJob.KIND_INDEX: failing_handler}), \
+                mock.patch.object(tasks, "is_rate_limited", return_value=True), \
+                self.assertLogs("documents.tasks", "WARNING"):
+            tasks.run_job(tasks.claim_next_job())
+        job = BackgroundJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (BackgroundJob.STATUS_QUEUED, 0))
+        self.assertGreaterEqual((job.run_after - job.updated_at).total_seconds(), 29)
+
+    def test_success_marks_the_job_done(self):
+        self.job()
+        with mock.patch.dict(tasks.HANDLERS, {BackgroundJob.KIND_INDEX: lambda job: None}):
+            tasks.work(once=True)
+        job = BackgroundJob.objects.get()
+        self.assertEqual((job.status, job.last_error), (BackgroundJob.STATUS_DONE, ""))
+
+
+# ---------------- JOB HEARTBEAT ---------------- #
+@override_settings(BACKGROUND_WORKER_IN_PROCESS=False, BACKGROUND_JOB_LOCK_TIMEOUT=0.6)
+class JobHeartbeatTests(TransactionTestCase):
+    # The heartbeat writes from its own thread and connection
+
+    def test_long_job_is_not_claimed_again_while_it_runs(self):
+        BackgroundJob.objects.create(kind=BackgroundJob.KIND_INDEX, payload={"session_id": 1})
+        reclaimed = []
+
+        def long_handler(job):
+            time.sleep(0.7)  # past the lock timeout, between two heartbeats (every 0.2s)
+            reclaimed.append(tasks.claim_next_job())
+
+        with mock.patch.dict(tasks.HANDLERS, {BackgroundJob.KIND_INDEX: long_handler}):
+            tasks.run_job(tasks.claim_next_job())
+
+        self.assertEqual(reclaimed, [None])
+        job = BackgroundJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (BackgroundJob.STATUS_DONE, 1))
+
+    def test_job_without_a_heartbeat_is_claimed_again(self):
+        job = BackgroundJob.objects.create(kind=BackgroundJob.KIND_INDEX, payload={"session_id": 1})
+        self.assertEqual(tasks.claim_next_job().pk, job.pk)
+        time.sleep(0.7)  # the worker died: nothing refreshes locked_at
+        self.assertEqual(tasks.claim_next_job().pk, job.pk)
+
+
+# ---------------- GEMINI RESPONSE CACHE ---------------- #
+class StubGateway:
+    """Stands in for documents.gateway.Gateway: answers every call without touching Gemini."""
+
+    def __init__(self, text="answer"):
+        self.text = text
+        self.calls = 0
+
+    def call(self, func, cost, user=None):
+        self.calls += 1
+        return SimpleNamespace(text=self.text)
+
+    async def acall(self, func, cost, user=None):
+        return self.call(func, cost, user)
+
+
+class LLMCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches[llm.CACHE_ALIAS].clear()
+        self.gateway = StubGateway()
+        patcher = mock.patch.object(llm, "get_gateway", return_value=self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stats_since(self, before):
+        return {name: count - before[name] for name, count in llm.cache_stats().items()}
+
+    def test_unicode_form_and_whitespace_share_a_key(self):
+        self.assertEqual(llm.cache_key("Summarize  this\n\n text "), llm.cache_key("Summarize this text"))
+        # NFKC: full-width letters and a no-break space fold to ASCII
+        self.assertEqual(llm.cache_key("ＡＢＣ\u00a0def"), llm.cache_key("ABC def"))
+        self.assertNotEqual(llm.cache_key("ABC def"), llm.cache_key("ABC deg"))
+
+        before = llm.cache_stats()
+        self.assertEqual(llm.generate_text("  Explain\tthis "), "answer")
+        self.assertEqual(llm.generate_text("Explain this"), "answer")
+        self.assertEqual(self.gateway.calls, 1)
+        self.assertEqual(self.stats_since(before), {"hits": 1, "misses": 1, "bypassed": 0})
+
+    def test_config_and_model_are_part_of_the_key(self):
+        llm.generate_text("Explain this", config={"temperature": 0.2})
+        llm.generate_text("Explain this", config={"temperature": 0.7})
+        llm.generate_text("Explain this", model="gemini-other", config={"temperature": 0.7})
+        self.assertEqual(self.gateway.calls, 3)
+        llm.generate_text("Explain this", config={"temperature": 0.7})
+        self.assertEqual(self.gateway.calls, 3)
+
+    @override_settings(LLM_CACHE_ENABLED=False)
+    def test_disabled_cache_is_bypassed(self):
+        before = llm.cache_stats()
+        llm.generate_text("Explain this")
+        llm.generate_text("Explain this")
+        self.assertEqual(self.gateway.calls, 2)
+        self.assertEqual(self.stats_since(before), {"hits": 0, "misses": 0, "bypassed": 2})
+        self.assertIsNone(caches[llm.CACHE_ALIAS].get(llm.cache_key("Explain this")))
+
+    def test_use_cache_false_skips_the_lookup_but_refreshes_the_entry(self):
+        llm.generate_text("Explain this")
+        self.gateway.text = "fresh answer"
+        self.assertEqual(llm.generate_text("Explain this", use_cache=False), "fresh answer")
+        self.assertEqual(llm.generate_text("Explain this"), "fresh answer")
+        self.assertEqual(self.gateway.calls, 2)
+
+    def test_empty_responses_are_not_cached(self):
+        self.gateway.text = None
+        llm.generate_text("Explain this")
+        llm.generate_text("Explain this")
+        self.assertEqual(self.gateway.calls, 2)
+
+    def test_async_calls_share_the_cache(self):
+        llm.generate_text("Explain this")
+        with mock.patch.object(llm, "_aio_models"):
+            self.assertEqual(async_to_sync(llm.agenerate_text)("Explain   this"), "answer")
+        self.assertEqual(self.gateway.calls, 1)
+
+
+# ---------------- AUDIO ---------------- #
+class StubTTSBackend(TTSBackend):
+    """Fake MP3 per chunk: an ID3v2 header, the chunk text as the "frames" and an ID3v1 trailer."""
+
+    max_chunk_chars = 40
+    delay = 0.0
+    calls = []
+    _lock = threading.Lock()
+
+    def synthesize(self, text, lang):
+        with self._lock:
+            self.calls.append(text)
+        time.sleep(self.delay)
+        tag = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"\x00" * 5
+        return tag + text.encode("utf-8") + b"TAG" + b"\x00" * 125
+
+
+@override_settings(TTS_BACKEND="documents.tests.StubTTSBackend", BACKGROUND_WORKER_IN_PROCESS=False)
+class AudioGenerationTests(TransactionTestCase):
+    # Generations run in a fresh context, so their queries use another
+    # connection: the rows they read must be committed
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        StubTTSBackend.calls.clear()
+        StubTTSBackend.delay = 0.2  # long enough for the second request to arrive mid-generation
+        self.narrations = 0
+        patcher = mock.patch.object(audio, "agenerate_text", self.narrate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = make_user()
+        self.session = SummarizationSession.objects.create(
+            user=user, document=make_document(user), title="Summary", summary_text="A summary."
+        )
+
+    async def narrate(self, prompt, **kwargs):
+        self.narrations += 1
+        await asyncio.sleep(0.05)
+        return "First sentence. Second sentence."
+
+    async def test_concurrent_requests_share_one_generation(self):
+        (first, generated), (second, _) = await asyncio.gather(
+            audio.get_audio(self.session, "en"), audio.get_audio(self.session, "en")
+        )
+        self.assertEqual(first.pk, second.pk)
+        self.assertTrue(generated)
+        self.assertEqual(first.status, AudioArtifact.STATUS_READY)
+        self.assertEqual(self.narrations, 1)
+        self.assertEqual(StubTTSBackend.calls, ["First sentence. Second sentence."])
+
+        artifact, generated = await audio.get_audio(self.session, "en")
+        self.assertFalse(generated)
+        self.assertEqual(artifact.pk, first.pk)
+        self.assertEqual(self.narrations, 1)
+
+    async def test_stream_follows_the_running_generation(self):
+        async def collect():
+            return b"".join([segment async for segment in audio.stream_audio(self.session, "en")])
+
+        streamed, (artifact, _) = await asyncio.gather(collect(), audio.get_audio(self.session, "en"))
+        self.assertEqual(streamed, b"First sentence. Second sentence.")
+        with open(audio._absolute(artifact.file_path), "rb") as f:
+            self.assertEqual(f.read(), streamed)
+        self.assertEqual(len(StubTTSBackend.calls), 1)
+
+    async def test_fresh_claim_of_another_worker_is_respected(self):
+        summary_hash = AudioArtifact.hash_text(self.session.summary_text)
+        await AudioArtifact.objects.acreate(session=self.session, language="en", summary_hash=summary_hash)
+        artifact, owner = await audio._claim(self.session, "en", summary_hash, force=False)
+        self.assertFalse(owner)
+        self.assertEqual(artifact.status, AudioArtifact.STATUS_GENERATING)
+
+    async def test_stale_claim_is_taken_over(self):
+        summary_hash = AudioArtifact.hash_text(self.session.summary_text)
+        abandoned = await AudioArtifact.objects.acreate(session=self.session, language="en", summary_hash=summary_hash)
+        # A worker that crashed mid-generation (update() leaves updated_at alone)
+        await AudioArtifact.objects.filter(pk=abandoned.pk).aupdate(
+            updated_at=timezone.now() - timedelta(seconds=settings.AUDIO_GENERATION_TIMEOUT + 1)
+        )
+
+        artifact, generated = await audio.get_audio(self.session, "en")
+        self.assertTrue(generated)
+        self.assertEqual(artifact.pk, abandoned.pk)
+        self.assertEqual(artifact.status, AudioArtifact.STATUS_READY)
+        self.assertEqual(len(StubTTSBackend.calls), 1)
+
+    async def test_failed_generation_is_reported_to_every_waiter(self):
+        async def no_narration(prompt, **kwargs):
+            return ""
+
+        with mock.patch.object(audio, "agenerate_text", no_narration):
+            results = await asyncio.gather(
+                audio.get_audio(self.session, "en"), audio.get_audio(self.session, "en"), return_exceptions=True
+            )
+        self.assertTrue(all(isinstance(result, audio.AudioGenerationError) for result in results))
+        artifact = await AudioArtifact.objects.aget(session=self.session)
+        self.assertEqual(artifact.status, AudioArtifact.STATUS_FAILED)
+
+
+# ---------------- TTS ---------------- #
+class SlowFirstTTSBackend(StubTTSBackend):
+    """Earlier chunks take longer, so they finish last."""
+
+    max_chunk_chars = 20
+
+    def synthesize(self, text, lang):
+        time.sleep(0.05 * (4 - int(text[-2])))
+        return super().synthesize(text, lang)
+
+
+class TTSChunkingTests(SimpleTestCase):
+    def test_chunks_pack_whole_sentences_up_to_the_limit(self):
+        chunks = split_text("One two. Three four five.   Six!  Seven?", 20)
+        self.assertEqual(chunks, ["One two.", "Three four five.", "Six! Seven?"])
+        self.assertEqual(split_text("Abcde fghij. Klmno.", 19), ["Abcde fghij. Klmno."])  # exactly the limit
+        self.assertEqual(split_text("Abcde fghij. Klmno.", 18), ["Abcde fghij.", "Klmno."])
+
+    def test_long_sentences_split_on_words_and_long_words_are_cut(self):
+        chunks = split_text("alpha beta gamma delta " + "x" * 25, 10)
+        self.assertEqual(chunks, ["alpha beta", "gamma", "delta", "xxxxxxxxxx", "xxxxxxxxxx", "xxxxx"])
+        self.assertTrue(all(len(chunk) <= 10 for chunk in chunks))
+
+    def test_devanagari_sentence_ends(self):
+        self.assertEqual(split_text("पहला वाक्य। दूसरा वाक्य।", 12), ["पहला वाक्य।", "दूसरा वाक्य।"])
+
+    def test_strip_id3(self):
+        frames = b"\xff\xfb\x90\x00" * 4
+        v2 = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"12345"
+        v2_footer = b"ID3\x04\x00\x10\x00\x00\x00\x02" + b"12" + b"3DI" + b"\x00" * 7
+        v1 = b"TAG" + b"\x00" * 125
+        self.assertEqual(strip_id3(v2 + frames + v1), frames)
+        self.assertEqual(strip_id3(v2_footer + frames), frames)
+        self.assertEqual(strip_id3(frames + v1), frames)
+        self.assertEqual(strip_id3(frames), frames)
+
+    def test_segments_come_out_in_order_without_tags(self):
+        text = "Chunk one 1. Chunk two 2. Chunk three 3."
+
+        async def collect():
+            return [segment async for segment in asynthesize(text, "en", backend=SlowFirstTTSBackend())]
+
+        StubTTSBackend.calls.clear()
+        segments = async_to_sync(collect)()
+        self.assertEqual(segments, [b"Chunk one 1.", b"Chunk two 2.", b"Chunk three 3."])
+        # Synthesized in parallel: the last chunk finished first
+        self.assertEqual(StubTTSBackend.calls[0], "Chunk three 3.")
+
+
+# ---------------- SEARCH ---------------- #
+class BM25SearchTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+
+    def document(self, name, text, user=None):
+        document = make_document(
+            user or self.user, name, extraction_status=Document.EXTRACTION_DONE, extracted_text=text
+        )
+        search.update_document_entry(document)
+        return document
+
+    def summary(self, title, text):
+        session = SummarizationSession.objects.create(
+            user=self.user, document=make_document(self.user, f"{title}.pdf"), title=title, summary_text=text
+        )
+        search.update_session_entry(session)
+        return session
+
+    def results(self, query, **kwargs):
+        return [(entry.document_id or entry.session_id, round(entry.score, 6)) for entry in search.search(self.user, query, **kwargs)]
+
+    def test_term_frequency_and_rarity_rank_results(self):
+        once = self.document("once.txt", "quarterly revenue grew, costs fell")
+        twice = self.document("twice.txt", "revenue revenue grew, costs fell")
+        rare = self.document("rare.txt", "costs fell, unusual turbine outage")
+
+        ranked = [document_id for document_id, _ in self.results("revenue")]
+        self.assertEqual(ranked, [twice.id, once.id])
+        # "turbine" appears once in the collection, "costs" everywhere: the rare term wins
+        self.assertEqual(self.results("costs turbine")[0][0], rare.id)
+
+    def test_title_terms_count_double(self):
+        titled = self.document("budget.txt", "figures for the year")
+        body = self.document("notes.txt", "budget figures for the year")
+        self.assertEqual([document_id for document_id, _ in self.results("budget")], [titled.id, body.id])
+
+    def test_stopwords_and_other_users_are_ignored(self):
+        self.document("mine.txt", "solar panels")
+        self.document("theirs.txt", "solar panels", user=make_user("other@example.com"))
+        self.assertEqual(len(self.results("solar")), 1)
+        self.assertEqual(self.results("the of and"), [])
+        self.assertEqual(self.results("nothing matches"), [])
+
+    def test_reindexing_replaces_postings(self):
+        document = self.document("draft.txt", "first draft")
+        document.extracted_text = "final version"
+        search.update_document_entry(document)
+        self.assertEqual(self.results("first"), [])
+        self.assertEqual(len(self.results("final")), 1)
+
+    def test_idf_is_computed_within_the_searched_kind(self):
+        for n in range(3):
+            self.document(f"doc{n}.txt", "unrelated quarterly report")
+        session = self.summary("Summary", "zebra stripes")
+
+        # One summary, containing the term, of length 3 (= avgdl): the score is the idf alone
+        expected = round(math.log(1 + 0.5 / 1.5), 6)
+        self.assertEqual(self.results("zebra", kind=search.KIND_SUMMARY), [(session.id, expected)])
+        self.assertEqual(self.results("zebra", kind=search.KIND_DOCUMENT), [])
+
+
+# ---------------- SUMMARIES LIST ---------------- #
+class SummariesListTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.document = make_document(self.user)
+
+    def test_rows_carry_a_preview_instead_of_the_summary(self):
+        SummarizationSession.create_for_documents(self.user, [self.document], "word " * 1000)
+        row = self.client.get("/documents/summaries/").json()["results"][0]
+        self.assertNotIn("summary_text", row)
+        self.assertEqual(row["summary_preview"], ("word " * 1000)[:200])
+        self.assertEqual(row["message_count"], 1)
+
+    def test_pages_follow_the_cursor_newest_first(self):
+        sessions = [
+            SummarizationSession.create_for_documents(self.user, [self.document], f"Summary {n}") for n in range(5)
+        ]
+        SummarizationSession.create_for_documents(make_user("other@example.com"), [self.document], "Not mine")
+
+        seen = []
+        url = "/documents/summaries/?page_size=2"
+        while url:
+            page = self.client.get(url).json()
+            seen += [row["id"] for row in page["results"]]
+            url = page["next"]
+        self.assertEqual(seen, [session.id for session in reversed(sessions)])
+
+
+# ---------------- CHAT MEMORY ---------------- #
+@override_settings(CHAT_HISTORY_TOKENS=100, CHAT_DIGEST_TOKENS=50, BACKGROUND_WORKER_IN_PROCESS=False)
+class ChatMemoryTests(TestCase):
+    def setUp(self):
+        user = make_user()
+        self.session = SummarizationSession.create_for_documents(user, [make_document(user)], "The summary.")
+        self.prompts = []
+        patcher = mock.patch.object(memory, "generate_text", self.digest)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def digest(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return f"- digest {len(self.prompts)}"
+
+    def add_messages(self, count):
+        # 12 one-token words + MESSAGE_OVERHEAD_TOKENS = 16 tokens each
+        return [
+            SummarizationMessage.objects.create(
+                session=self.session, role="user" if n % 2 == 0 else "assistant", content=f"m{n} " + "word " * 11
+            )
+            for n in range(count)
+        ]
+
+    def test_threshold(self):
+        self.add_messages(6)  # 96 tokens
+        self.assertFalse(memory.needs_compaction(self.session))
+        self.assertIsNone(tasks.enqueue_memory_compaction(self.session))
+
+        self.add_messages(1)  # 112 tokens
+        self.assertTrue(memory.needs_compaction(self.session))
+        self.assertIsNotNone(tasks.enqueue_memory_compaction(self.session))
+        self.assertIsNone(tasks.enqueue_memory_compaction(self.session))  # already queued
+
+    def test_context_skips_the_opening_summary_and_fits_the_budget(self):
+        messages = self.add_messages(10)
+        digest, recent = memory.chat_context(self.session)
+        self.assertEqual(digest, "")
+        self.assertEqual([m["id"] for m in recent], [m.id for m in messages[-6:]])
+
+    def test_compaction_folds_the_oldest_messages_in_bounded_batches(self):
+        messages = self.add_messages(10)
+        tasks.run_memory_compaction(SimpleNamespace(payload={"session_id": self.session.id}))
+
+        # Half the budget (3 messages) stays verbatim; 7 are folded, at most 100 tokens per call
+        self.assertEqual(len(self.prompts), 2)
+        self.assertIn("m0 ", self.prompts[0])
+        self.assertIn("m5 ", self.prompts[0])
+        self.assertNotIn("m6 ", self.prompts[0])
+        self.assertIn("- digest 1", self.prompts[1])  # the second call extends the first digest
+        self.assertIn("m6 ", self.prompts[1])
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.memory_digest, "- digest 2")
+        self.assertEqual(self.session.memory_through_id, messages[6].id)
+        digest, recent = memory.chat_context(self.session)
+        self.assertEqual(digest, "- digest 2")
+        self.assertEqual([m["id"] for m in recent], [m.id for m in messages[7:]])
+        self.assertFalse(memory.needs_compaction(self.session))
+
+    def test_compaction_under_the_budget_does_nothing(self):
+        self.add_messages(3)
+        memory.compact(self.session)
+        self.assertEqual(self.prompts, [])
+
+    def test_compaction_stops_when_another_worker_got_there_first(self):
+        messages = self.add_messages(10)
+        stale = SummarizationSession.objects.get(pk=self.session.pk)
+        memory.compact(self.session)
+        memory.compact(stale)  # built on memory_through_id=None, which is no longer current
+        self.assertEqual(len(self.prompts), 3)
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.memory_digest, self.session.memory_through_id), ("- digest 2", messages[6].id))
+
+    def test_long_digests_are_clipped(self):
+        self.add_messages(10)
+        with mock.patch.object(memory, "generate_text", return_value="- point\n" * 200):
+            memory.compact(self.session)
+        self.assertLessEqual(llm.count_tokens(self.session.memory_digest), 50)
+
+
+# ---------------- RETRIEVAL ---------------- #
+LEASE = "\n\n".join([
+    "The tenant pays the monthly rent of 900 euros on the first day of each month.",
+    "Pets are not allowed in the apartment without written permission from the landlord.",
+    "Either party may terminate the lease with three months notice in writing.",
+])
+
+
+@override_settings(
+    RAG_EMBEDDER="documents.retrieval.HashingEmbedder", RAG_CHUNK_CHARS=100, RAG_TOP_K=1,
+    BACKGROUND_WORKER_IN_PROCESS=False,
+)
+class RetrievalTests(TestCase):
+    def setUp(self):
+        # Indexes are cached per (document id, content), and ids repeat across tests
+        retrieval._indexes.clear()
+        self.addCleanup(retrieval._indexes.clear)
+        self.user = make_user()
+
+    def test_hashing_embedder_is_deterministic_and_normalized(self):
+        embedder = retrieval.HashingEmbedder()
+        vectors = embedder.embed(["monthly rent", "monthly rent", ""])
+        self.assertEqual(vectors.shape, (3, embedder.dimensions))
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertTrue(np.array_equal(vectors[0], vectors[1]))
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1.0, places=5)
+        self.assertFalse(vectors[2].any())
+
+    def test_query_retrieves_the_relevant_passage(self):
+        document = make_document(self.user, "lease.txt", extraction_status=Document.EXTRACTION_DONE, extracted_text=LEASE)
+        retrieval.index_document(document, LEASE)
+        self.assertEqual(DocumentChunk.objects.filter(document=document).count(), 3)
+
+        passages = LEASE.split("\n\n")
+        self.assertEqual(retrieval.retrieve(document, "When is the rent paid?"), [passages[0]])
+        retrieval._indexes.clear()  # a fresh worker loads the stored vectors
+        self.assertEqual(retrieval.retrieve(document, "Can I keep pets?"), [passages[1]])
+        self.assertEqual(retrieval.retrieve(document, "notice to terminate", k=3)[0], passages[2])
+
+    def test_unrelated_query_retrieves_nothing(self):
+        document = make_document(self.user, "lease.txt", extraction_status=Document.EXTRACTION_DONE, extracted_text=LEASE)
+        self.assertEqual(retrieval.retrieve(document, "zebra xylophone"), [])
+
+    def test_extracted_document_without_chunks_is_indexed_on_first_question(self):
+        document = make_document(self.user, "lease.txt", extraction_status=Document.EXTRACTION_DONE, extracted_text=LEASE)
+        self.assertFalse(DocumentChunk.objects.exists())
+        self.assertEqual(retrieval.retrieve(document, "Can I keep pets?"), [LEASE.split("\n\n")[1]])
+        self.assertEqual(DocumentChunk.objects.filter(document=document).count(), 3)
+
+    def test_chat_falls_back_to_the_summary_without_chunks(self):
+        document = make_document(self.user, "scan.pdf")  # not extracted yet
+        session = SummarizationSession.create_for_documents(self.user, [document], "A lease summary.")
+        client = APIClient()
+        client.force_authenticate(self.user)
+        prompts = []
+
+        async def answer(prompt, **kwargs):
+            prompts.append(prompt)
+            return "The rent is 900 euros."
+
+        with mock.patch.object(views, "agenerate_text", answer):
+            response = client.post(f"/documents/summaries/{session.id}/chat/", {"query": "What is the rent?"}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["reply"], "The rent is 900 euros.")
+        self.assertIn("A lease summary.", prompts[0])
+        self.assertNotIn("Relevant Excerpts", prompts[0])
+        self.assertFalse(DocumentChunk.objects.exists())
+
+    def test_chat_prompt_carries_the_retrieved_passage(self):
+        document = make_document(self.user, "lease.txt", extraction_status=Document.EXTRACTION_DONE, extracted_text=LEASE)
+        session = SummarizationSession.create_for_documents(self.user, [document], "A lease summary.")
+        client = APIClient()
+        client.force_authenticate(self.user)
+        prompts = []
+
+        async def answer(prompt, **kwargs):
+            prompts.append(prompt)
+            return "Only with permission."
+
+        with mock.patch.object(views, "agenerate_text", answer):
+            client.post(f"/documents/summaries/{session.id}/chat/", {"query": "Can I keep pets?"}, format="json")
+
+        self.assertIn("Relevant Excerpts", prompts[0])
+        pets = LEASE.split("\n\n")[1]
+        self.assertIn(f"[1] {pets}", prompts[0])
+
+
+# ---------------- SUMMARIZE ---------------- #
+class FakeGemini:
+    """generate_text stand-in: map prompts get "notes N", merge prompts list what they merged."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        if "You are summarizing part" in prompt:
+            return "notes " + re.search(r"part (\d+) of", prompt).group(1)
+        if prompt.lstrip().startswith("Merge the following"):
+            return "merged(" + ",".join(re.findall(r"^(?:notes \d+|merged\(.*\))$", prompt, re.M)) + ")"
+        return "report"
+
+    async def agenerate(self, prompt):
+        return self(prompt)
+
+
+class SummarizeTests(SimpleTestCase):
+    def test_chunks_break_at_pages_first(self):
+        page = "word " * 8  # 40 characters
+        chunks = summarize.chunk_text("\f".join([page] * 5), 100)
+        self.assertEqual(chunks, [f"{page}\f{page}".strip()] * 2 + [page.strip()])
+
+    def test_chunks_neither_overlap_nor_lose_text(self):
+        text = "\n\n".join(f"# Section {n}\n" + "Some sentence here. " * (n * 7) for n in range(1, 12))
+        raw = summarize._split(text, 300, summarize.CHUNK_SEPARATORS)
+        self.assertEqual("".join(raw), text)
+        self.assertTrue(all(len(chunk) <= 300 for chunk in raw))
+        sections = text.split("\n\n")
+        self.assertEqual(summarize.chunk_text(text, 300)[:2], [section.strip() for section in sections[:2]])
+
+    def test_words_longer_than_a_chunk_are_cut(self):
+        self.assertEqual(summarize.chunk_text("x" * 25 + " ab", 10), ["x" * 10, "x" * 10, "x" * 5, "ab"])
+
+    def test_text_that_fits_one_prompt_skips_map_reduce(self):
+        gemini = FakeGemini()
+        with mock.patch.object(summarize, "generate_text", gemini):
+            summary, stats = summarize.summarize_text("A short memo.", summarize.MODE_HIERARCHICAL)
+        self.assertEqual((summary, stats), ("report", None))
+        self.assertEqual(len(gemini.prompts), 1)
+        self.assertIn("A short memo.", gemini.prompts[0])
+
+    @override_settings(SUMMARY_CHUNK_CHARS=100, SUMMARY_REDUCE_FANIN=6)
+    def test_the_report_prompt_gets_every_partial_summary(self):
+        gemini = FakeGemini()
+        text = "\n\n".join(f"Paragraph {n} " + "x" * 70 for n in range(1, 6))
+        with mock.patch.object(summarize, "generate_text", gemini):
+            summary, stats = summarize.summarize_text(text, summarize.MODE_HIERARCHICAL)
+        self.assertEqual(summary, "report")
+        self.assertEqual((stats["chunks"], stats["reduce_depth"]), (5, 0))
+        self.assertEqual(len(gemini.prompts), 6)
+        self.assertIn("\n".join(f"notes {n}\n" for n in range(1, 6)).strip(), gemini.prompts[-1])
+
+    @override_settings(SUMMARY_CHUNK_CHARS=100, SUMMARY_REDUCE_FANIN=2, SUMMARY_MAX_REDUCE_DEPTH=5)
+    async def test_partials_are_merged_fanin_at_a_time(self):
+        gemini = FakeGemini()
+        text = "\n\n".join(f"Paragraph {n} " + "x" * 70 for n in range(1, 6))
+        with mock.patch.object(summarize, "agenerate_text", gemini.agenerate):
+            summary, stats = await summarize.asummarize_text(text, summarize.MODE_HIERARCHICAL)
+        self.assertEqual(summary, "report")
+        self.assertEqual(stats["reduce_depth"], 2)
+        self.assertIn("merged(merged(notes 1,notes 2),merged(notes 3,notes 4))\n\nmerged(merged(notes 5))", gemini.prompts[-1])
+
+
+# ---------------- STREAMING ---------------- #
+def sse_events(body):
+    """(event, data) pairs of an SSE body; events without a name are "message"."""
+    events = []
+    for block in body.split("\n\n")[:-1]:
+        *head, data = block.split("\n")
+        events.append((head[0].removeprefix("event: ") if head else "message", json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def fake_astream_text(*fragments, error=None):
+    async def astream_text(prompt, **kwargs):
+        for fragment in fragments:
+            yield fragment
+        if error:
+            raise error
+    return astream_text
+
+
+@override_settings(BACKGROUND_WORKER_IN_PROCESS=False, TTS_BACKEND="documents.tests.StubTTSBackend")
+class StreamingViewTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.document = make_document(self.user)
+        self.session = SummarizationSession.create_for_documents(self.user, [self.document], "The summary.")
+
+    async def request(self, view, method, data=None, **kwargs):
+        factory = APIRequestFactory()
+        request = factory.post("/", data, format="json") if method == "post" else factory.get("/", data)
+        force_authenticate(request, user=self.user)
+        return await view.as_view()(request, **kwargs)
+
+    async def body(self, response):
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_summary_is_streamed_between_status_and_done_events(self):
+        async def texts(docs, max_chars=None):
+            return ["The contract text."]
+
+        with mock.patch.object(streaming, "aget_documents_text", texts), \
+                mock.patch.object(streaming, "astream_text", fake_astream_text("Sum", "mary")):
+            response = await self.request(streaming.SummarizeStreamView, "post", {"files": [self.document.id]})
+            body = await self.body(response)
+
+        self.assertTrue(body.startswith('event: status\ndata: {"stage": "extracting"}\n\n'))
+        events = sse_events(body)
+        self.assertEqual(events[:4], [
+            ("status", {"stage": "extracting"}),
+            ("status", {"stage": "summarizing"}),
+            ("message", {"delta": "Sum"}),
+            ("message", {"delta": "mary"}),
+        ])
+        self.assertEqual(events[4][0], "done")
+        session = await SummarizationSession.objects.aget(id=events[4][1]["session_id"])
+        self.assertEqual(session.summary_text, "Summary")
+
+    async def test_extraction_failure_ends_the_stream_with_an_error_event(self):
+        async def texts(docs, max_chars=None):
+            raise RuntimeError("download failed")
+
+        with mock.patch.object(streaming, "aget_documents_text", texts):
+            response = await self.request(streaming.SummarizeStreamView, "post", {"files": [self.document.id]})
+            events = sse_events(await self.body(response))
+
+        self.assertEqual(events[-1][0], "error")
+        self.assertIn("download failed", events[-1][1]["error"])
+        self.assertEqual(await SummarizationSession.objects.acount(), 1)
+
+    async def test_gemini_failure_mid_stream_saves_nothing(self):
+        async def texts(docs, max_chars=None):
+            return ["The contract text."]
+
+        with mock.patch.object(streaming, "aget_documents_text", texts), \
+                mock.patch.object(streaming, "astream_text", fake_astream_text("Sum", error=RuntimeError("quota"))):
+            response = await self.request(streaming.SummarizeStreamView, "post", {"files": [self.document.id]})
+            events = sse_events(await self.body(response))
+
+        self.assertEqual(events[-2:], [("message", {"delta": "Sum"}), ("error", {"error": "Gemini summarization failed: quota"})])
+        self.assertEqual(await SummarizationSession.objects.acount(), 1)
+
+    async def test_chat_reply_is_streamed_and_saved(self):
+        with mock.patch.object(streaming, "astream_text", fake_astream_text("Ans", "wer")):
+            response = await self.request(
+                streaming.SummarizeChatStreamView, "post", {"query": "Who signed?"}, session_id=self.session.id
+            )
+            events = sse_events(await self.body(response))
+
+        self.assertEqual(events[:2], [("message", {"delta": "Ans"}), ("message", {"delta": "wer"})])
+        self.assertEqual(events[2][0], "done")
+        self.assertEqual(events[2][1]["reply"], "Answer")
+        contents = [m.content async for m in SummarizationMessage.objects.filter(session=self.session).order_by("id")]
+        self.assertEqual(contents, ["The summary.", "Who signed?", "Answer"])
+
+    async def test_chat_failure_is_an_error_event(self):
+        with mock.patch.object(streaming, "astream_text", fake_astream_text(error=RuntimeError("quota"))):
+            response = await self.request(
+                streaming.SummarizeChatStreamView, "post", {"query": "Who signed?"}, session_id=self.session.id
+            )
+            events = sse_events(await self.body(response))
+
+        self.assertEqual(events, [("error", {"error": "Gemini chat failed: quota"})])
+        self.assertEqual(await SummarizationMessage.objects.filter(session=self.session).acount(), 1)
+
+    async def test_audio_segments_are_streamed(self):
+        async def segments(session, lang):
+            yield b"first"
+            yield b"second"
+
+        with mock.patch.object(streaming, "stream_audio", segments):
+            response = await self.request(streaming.AudioStreamView, "get", session_id=self.session.id)
+            body = b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(response["Content-Type"], "audio/mpeg")
+        self.assertEqual(body, b"firstsecond")
+
+    async def test_audio_failure_before_the_first_segment_is_a_json_error(self):
+        async def segments(session, lang):
+            raise audio.AudioGenerationError("narration failed")
+            yield b""
+
+        with mock.patch.object(streaming, "stream_audio", segments):
+            response = await self.request(streaming.AudioStreamView, "get", session_id=self.session.id)
+
+        self.assertEqual((response.status_code, response.data), (500, {"error": "narration failed"}))
+
+
+# ---------------- BATCH SUMMARIZE ---------------- #
+def summarize_unless_broken(text, mode):
+    if "broken" in text:
+        raise ValueError("Gemini refused this one.")
+    return f"Summary of {text}", mode
+
+
+@override_settings(BACKGROUND_WORKER_IN_PROCESS=False, BACKGROUND_JOB_MAX_ATTEMPTS=1)
+class SummarizeBatchTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.documents = [
+            make_document(self.user, name, extraction_status=Document.EXTRACTION_DONE, extracted_text=text)
+            for name, text in [("a.txt", "alpha report"), ("b.txt", "broken report"), ("c.txt", "gamma report")]
+        ]
+
+    def create(self, ids, **data):
+        return self.client.post("/documents/summarize/batch/", {"files": ids, **data}, format="json")
+
+    def poll(self, batch_id):
+        return self.client.get(f"/documents/summarize/batch/{batch_id}/")
+
+    def test_create_queues_one_grouped_job_per_document(self):
+        other = make_document(make_user("other@example.com"), "x.txt")
+        ids = [d.id for d in self.documents]
+        response = self.create(ids + [ids[0], other.id], mode="single")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["total"], 3)  # duplicates and other users' files dropped
+
+        batch = SummarizeBatch.objects.get(pk=response.json()["batch_id"])
+        self.assertEqual(batch.mode, "single")
+        self.assertEqual(list(batch.items.values_list("document_id", flat=True)), ids)
+        jobs = BackgroundJob.objects.filter(kind=BackgroundJob.KIND_SUMMARIZE)
+        self.assertEqual(set(jobs.values_list("group", flat=True)), {f"user:{self.user.id}"})
+        self.assertEqual(jobs.count(), 3)
+
+        body = self.poll(batch.id).json()
+        self.assertEqual(body["status"], "running")
+        self.assertEqual(body["progress"], {"queued": 3, "running": 0, "done": 0, "failed": 0, "total": 3})
+
+    def test_invalid_requests(self):
+        self.enterContext(self.assertLogs("django.request", "WARNING"))
+        self.assertEqual(self.create("1,2").status_code, 400)
+        self.assertEqual(self.create([self.documents[0].id], mode="nope").status_code, 400)
+        self.assertEqual(self.create([10 ** 6]).json(), {"error": "No documents found"})
+        with override_settings(SUMMARIZE_BATCH_MAX_DOCUMENTS=2):
+            self.assertEqual(self.create([d.id for d in self.documents]).status_code, 400)
+        self.assertFalse(SummarizeBatch.objects.exists())
+
+    def test_partial_failure(self):
+        batch_id = self.create([d.id for d in self.documents]).json()["batch_id"]
+        with mock.patch.object(tasks, "summarize_text", summarize_unless_broken), \
+                self.assertLogs("documents.tasks", "ERROR"):
+            tasks.work(once=True)
+
+        body = self.poll(batch_id).json()
+        self.assertEqual(body["status"], "done")
+        self.assertEqual(body["progress"], {"queued": 0, "running": 0, "done": 2, "failed": 1, "total": 3})
+        done, failed, _ = body["items"]
+        self.assertEqual(failed["error"], "Gemini refused this one.")
+        self.assertIsNone(failed["session"])
+        session = SummarizationSession.objects.get(pk=done["session"])
+        self.assertEqual(session.summary_text, "Summary of alpha report")
+        self.assertEqual(session.document_id, self.documents[0].id)
+
+    @override_settings(BACKGROUND_JOB_MAX_ATTEMPTS=2)
+    def test_failing_to_store_the_session_does_not_leave_the_item_running(self):
+        batch_id = self.create([self.documents[0].id]).json()["batch_id"]
+        with mock.patch.object(tasks, "summarize_text", summarize_unless_broken), \
+                mock.patch.object(SummarizationSession, "create_for_documents", side_effect=RuntimeError("db down")), \
+                self.assertLogs("documents.tasks", "ERROR"):
+            tasks.work(once=True)  # first attempt: queued again
+            self.assertEqual(self.poll(batch_id).json()["items"][0]["status"], "queued")
+            BackgroundJob.objects.update(run_after=timezone.now())
+            tasks.work(once=True)
+
+        body = self.poll(batch_id).json()
+        self.assertEqual(body["status"], "done")
+        self.assertEqual(body["items"][0]["status"], "failed")
+        self.assertEqual(body["items"][0]["error"], "db down")
+        self.assertFalse(SummarizationSession.objects.exists())
+
+    def test_other_users_cannot_poll(self):
+        batch_id = self.create([self.documents[0].id]).json()["batch_id"]
+        self.client.force_authenticate(make_user("other@example.com"))
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.poll(batch_id).status_code, 404)
+
+
+# ---------------- GEMINI GATEWAY ---------------- #
+def gemini_down():
+    raise httpx.ConnectError("Gemini is down")
+
+
+async def agemini_down():
+    gemini_down()
+
+
+async def aok():
+    return SimpleNamespace(text="ok")
+
+
+async def chunks(*texts):
+    for text in texts:
+        yield SimpleNamespace(text=text)
+
+
+@override_settings(
+    LLM_CIRCUIT_FAILURES=1, LLM_CIRCUIT_COOLDOWN=0, LLM_MAX_RETRIES=0,
+    LLM_REQUESTS_PER_MINUTE=0, LLM_TOKENS_PER_MINUTE=0, LLM_RATE_LIMIT_BACKEND="process",
+)
+class CircuitBreakerProbeTests(SimpleTestCase):
+    """With no cooldown, the call after an outage is the half-open probe."""
+
+    def setUp(self):
+        self.gateway = Gateway()
+        self.enterContext(self.assertLogs("documents.gateway", "WARNING"))
+        with self.assertRaises(httpx.ConnectError):
+            self.gateway.call(gemini_down, 10)
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+
+    def assert_recovers(self):
+        self.assertEqual(self.gateway.call(lambda: SimpleNamespace(text="ok"), 10).text, "ok")
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_only_one_probe_at_a_time(self):
+        probe = self.gateway.breaker.before_call()
+        self.assertIsNotNone(probe)
+        with self.assertRaises(CircuitOpenError):
+            self.gateway.call(lambda: SimpleNamespace(text="ok"), 10)
+        self.gateway.breaker.release(probe)
+        self.assert_recovers()
+
+    def test_failed_probe_reopens_the_circuit(self):
+        with self.assertRaises(httpx.ConnectError):
+            self.gateway.call(gemini_down, 10)
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+        self.assert_recovers()
+
+    def test_stale_release_keeps_a_newer_probe(self):
+        breaker = self.gateway.breaker
+        first = breaker.before_call()
+        breaker.record_failure(ValueError("bad request"))  # no verdict on Gemini's health
+        second = breaker.before_call()
+        breaker.release(first)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.release(second)
+        self.assertIsNotNone(breaker.before_call())
+
+    def test_cancelled_probe(self):
+        async def scenario():
+            started = asyncio.Event()
+
+            async def hang():
+                started.set()
+                await asyncio.sleep(60)
+
+            probe = asyncio.ensure_future(self.gateway.acall(hang, 10))
+            await started.wait()
+            with self.assertRaises(CircuitOpenError):
+                await self.gateway.acall(aok, 10)  # the probe is in flight
+            probe.cancel()  # e.g. the client disconnected
+            with self.assertRaises(asyncio.CancelledError):
+                await probe
+            return await self.gateway.acall(aok, 10)
+
+        self.assertEqual(async_to_sync(scenario)().text, "ok")
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    @override_settings(LLM_REQUESTS_PER_MINUTE=1, LLM_MAX_QUEUE_WAIT=0.01)
+    def test_probe_rejected_by_the_queue(self):
+        self.gateway = Gateway()
+        with self.assertRaises(httpx.ConnectError):
+            self.gateway.call(gemini_down, 10)  # spends the only request of the minute
+        for _ in range(2):
+            # Each probe times out in the queue; neither leaves the circuit stuck
+            with self.assertRaises(QueueTimeoutError):
+                self.gateway.call(lambda: SimpleNamespace(text="ok"), 10)
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_abandoned_stream_probe(self):
+        async def open_stream():
+            return chunks("a", "b")
+
+        async def scenario():
+            stream = self.gateway.astream(open_stream, 10)
+            first = await stream.__anext__()
+            await stream.aclose()  # the consumer went away after one chunk
+            return first.text, [chunk.text async for chunk in self.gateway.astream(open_stream, 10)]
+
+        self.assertEqual(async_to_sync(scenario)(), ("a", ["a", "b"]))
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_stream_failing_before_the_first_chunk_reopens_the_circuit(self):
+        async def scenario():
+            async for _ in self.gateway.astream(agemini_down, 10):
+                pass
+
+        with self.assertRaises(httpx.ConnectError):
+            async_to_sync(scenario)()
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+
+
+class RecordingWaiter:
+    def __init__(self, name, granted):
+        self.name = name
+        self.cancelled = False
+        self.granted = granted
+        self.event = threading.Event()
+
+    def grant(self):
+        self.granted.append(self.name)
+        self.event.set()
+
+
+class RateLimitTests(SimpleTestCase):
+    def test_bucket_refills_at_its_rate(self):
+        bucket = gateway.TokenBucket(60)  # one token a second
+        now = bucket.updated
+        self.assertEqual(bucket.time_until(60, now), 0.0)
+        bucket.take(60, now)
+        self.assertAlmostEqual(bucket.time_until(1, now), 1.0)
+        self.assertAlmostEqual(bucket.time_until(1, now + 0.5), 0.5)
+        self.assertAlmostEqual(bucket.time_until(10, now + 4), 6.0)
+        # Refill stops at capacity, and a cost above it waits for a full bucket only
+        self.assertEqual(bucket.time_until(60, now + 600), 0.0)
+        self.assertEqual(bucket.time_until(1000, now + 600), 0.0)
+
+    def test_drained_bucket_waits_for_a_refill(self):
+        bucket = gateway.TokenBucket(60)
+        bucket.drain(bucket.updated)
+        self.assertAlmostEqual(bucket.time_until(1, bucket.updated), 1.0)
+
+    def test_disabled_bucket_never_waits(self):
+        bucket = gateway.TokenBucket(0)
+        bucket.take(10**6, 0.0)
+        self.assertEqual(bucket.time_until(10**6, 0.0), 0.0)
+
+    def test_queued_calls_are_admitted_fairly_across_users(self):
+        scheduler = gateway.FairScheduler(0, 6000)  # 100 tokens a second
+        scheduler.drain()
+        granted = []
+        waiters = [RecordingWaiter(name, granted) for name in ("batch 1", "batch 2", "batch 3", "chat")]
+        for waiter in waiters:
+            user = "chat user" if waiter.name == "chat" else "batch user"
+            self.assertFalse(scheduler.submit(10, user, waiter))
+        self.assertEqual(scheduler.queued, 4)
+
+        self.assertTrue(all(waiter.event.wait(5) for waiter in waiters))
+        # The chat call queued last but goes ahead of the rest of the batch
+        self.assertEqual(granted, ["batch 1", "chat", "batch 2", "batch 3"])
+        self.assertEqual(scheduler.queued, 0)
+
+    def test_cancelled_waiters_are_skipped(self):
+        scheduler = gateway.FairScheduler(0, 6000)
+        scheduler.drain()
+        granted = []
+        gone, waiting = RecordingWaiter("gone", granted), RecordingWaiter("waiting", granted)
+        scheduler.submit(10, "a", gone)
+        scheduler.submit(10, "b", waiting)
+        gone.cancelled = True
+        self.assertTrue(waiting.event.wait(5))
+        self.assertEqual(granted, ["waiting"])
+
+
+class SharedRateLimitTests(TestCase):
+    def test_callers_reserve_consecutive_slots(self):
+        self.assertEqual(gateway.reserve_shared("gemini:test", 60, 60), 0.0)  # spends the full bucket
+        self.assertAlmostEqual(gateway.reserve_shared("gemini:test", 30, 60), 30.0, delta=0.5)
+        self.assertAlmostEqual(gateway.reserve_shared("gemini:test", 30, 60), 60.0, delta=0.5)
+        self.assertEqual(gateway.reserve_shared("gemini:other", 30, 60), 0.0)
+
+    def test_disabled_limit_is_not_stored(self):
+        self.assertEqual(gateway.reserve_shared("gemini:test", 10**6, 0), 0.0)
+        self.assertFalse(RateLimitBucket.objects.exists())
+
+
+def rate_limited():
+    from google.genai import errors
+
+    raise errors.ClientError(429, {"error": {"message": "slow down", "status": "RESOURCE_EXHAUSTED"}})
+
+
+def bad_request():
+    from google.genai import errors
+
+    raise errors.ClientError(400, {"error": {"message": "bad prompt", "status": "INVALID_ARGUMENT"}})
+
+
+class Flaky:
+    """Call that raises each error in turn, then answers "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            error = self.errors.pop(0)
+            error()
+        return SimpleNamespace(text="ok")
+
+    async def acall(self):
+        return self()
+
+
+@override_settings(
+    LLM_CIRCUIT_FAILURES=100, LLM_MAX_RETRIES=2,
+    LLM_REQUESTS_PER_MINUTE=0, LLM_TOKENS_PER_MINUTE=0, LLM_RATE_LIMIT_BACKEND="process",
+)
+class GatewayRetryTests(SimpleTestCase):
+    def setUp(self):
+        self.gateway = Gateway()
+        self.backoff = self.enterContext(mock.patch.object(gateway, "_backoff", return_value=0))
+
+    def test_outages_are_retried_with_backoff(self):
+        fn = Flaky(gemini_down, gemini_down)
+        self.assertEqual(self.gateway.call(fn, 10).text, "ok")
+        self.assertEqual(fn.calls, 3)
+        self.assertEqual([call.args for call in self.backoff.call_args_list], [(0,), (1,)])
+
+    def test_retries_stop_at_the_limit(self):
+        fn = Flaky(gemini_down, gemini_down, gemini_down)
+        with self.assertRaises(httpx.ConnectError):
+            self.gateway.call(fn, 10)
+        self.assertEqual(fn.calls, 3)
+
+    def test_rate_limit_is_retried_and_drains_the_bucket(self):
+        with override_settings(LLM_REQUESTS_PER_MINUTE=600):
+            self.gateway = Gateway()
+        throttled = gateway.gateway_stats()["throttled"]
+        fn = Flaky(rate_limited)
+        self.assertEqual(self.gateway.call(fn, 10).text, "ok")
+        self.assertEqual(fn.calls, 2)
+        # The retry had to wait for the emptied bucket to refill
+        self.assertEqual(gateway.gateway_stats()["throttled"], throttled + 1)
+
+    def test_client_errors_are_not_retried(self):
+        for error in (bad_request, lambda: json.loads("not json")):
+            fn = Flaky(error)
+            with self.assertRaises(Exception):
+                self.gateway.call(fn, 10)
+            self.assertEqual(fn.calls, 1)
+        self.backoff.assert_not_called()
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_async_calls_retry_too(self):
+        fn = Flaky(gemini_down)
+        self.assertEqual((await self.gateway.acall(fn.acall, 10)).text, "ok")
+        fn = Flaky(bad_request)
+        with self.assertRaises(Exception):
+            await self.gateway.acall(fn.acall, 10)
+        self.assertEqual(fn.calls, 1)
+
+
+# ---------------- METRICS ---------------- #
+def text_spool(file_url, ext):
+    spool = _Spool(ext)
+    spool.write(b"Quarterly revenue grew by four percent.")
+    return spool
+
+
+async def atext_spool(file_url, ext):
+    return text_spool(file_url, ext)
+
+
+async def fake_summary(text, mode):
+    return f"Summary of {text}", None
+
+
+@override_settings(METRICS_ENABLED=True, BACKGROUND_WORKER_IN_PROCESS=False)
+class MetricsTests(TestCase):
+    def get_metrics(self, token=None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        return self.client.get("/metrics", headers=headers)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_metrics_are_off_without_a_token(self):
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.get_metrics().status_code, 404)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_require_the_token(self):
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.get_metrics().status_code, 401)
+            self.assertEqual(self.get_metrics("wrong").status_code, 401)
+        response = self.get_metrics("s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE intellicore_stage_duration_seconds histogram", response.content)
+
+    @override_settings(METRICS_TOKEN="s3cret", METRICS_ENABLED=False)
+    def test_metrics_can_be_disabled(self):
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.get_metrics("s3cret").status_code, 404)
+
+    def test_server_timing_includes_parsing_in_the_executor(self):
+        user = make_user()
+        document = make_document(user, "notes.txt")
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch.object(extraction, "_adownload", atext_spool), \
+                mock.patch.object(views, "asummarize_text", fake_summary), \
+                mock.patch.object(views, "enqueue_search_update"):
+            response = client.post("/documents/summarize/", {"files": [document.id]}, format="json")
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["summary"], "Summary of Quarterly revenue grew by four percent.")
+        stages = [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["parse", "extract", "summarize", "db", "total"])
+
+    def test_sync_extraction_threads_report_their_spans(self):
+        document = make_document(make_user(), "notes.txt")
+        token = start_request_timings()
+        try:
+            with mock.patch.object(extraction, "_download", text_spool):
+                extraction.get_documents_text([document])
+        finally:
+            timings = stop_request_timings(token)
+        self.assertEqual([stage for stage, _ in timings], ["parse"])
+
+
+# ---------------- PDF PARSING ---------------- #
+def text_pdf(pages):
+    """A PDF with one line of Helvetica text per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for n in range(pages):
+        content = f"BT /F1 12 Tf 72 720 Td (Page {n + 1} text) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class PDFParsingTests(SimpleTestCase):
+    def counted_pages(self):
+        """Patch iter_pdf_pages to count the pages callers pull from it."""
+        pulled = []
+        real = parsers.iter_pdf_pages
+
+        def counting(source, backend="auto"):
+            for text in real(source, backend=backend):
+                pulled.append(text)
+                yield text
+
+        return pulled, mock.patch.object(parsers, "iter_pdf_pages", counting)
+
+    def test_pages_are_separated_by_page_breaks(self):
+        for backend in parsers.PDF_BACKENDS:
+            with self.subTest(backend=backend):
+                text = parsers.parse_pdf(text_pdf(3), backend=backend)
+                self.assertEqual(text.split("\n" + parsers.PAGE_BREAK), ["Page 1 text", "Page 2 text", "Page 3 text"])
+
+    def test_pages_are_parsed_lazily(self):
+        pages = parsers.iter_pdf_pages(io.BytesIO(text_pdf(50)), backend="pdfium")
+        self.assertEqual(next(pages), "Page 1 text")
+        pages.close()  # closes the document without parsing the other pages
+
+    def test_parsing_stops_once_max_chars_are_available(self):
+        pulled, patch = self.counted_pages()
+        with patch:
+            text = parsers.parse_pdf(text_pdf(50), max_chars=30)
+        self.assertEqual(len(pulled), 3)  # 3 pages of 11 characters fill the budget
+        self.assertEqual(text, "Page 1 text\n\fPage 2 text\n\fPage")
+
+    def test_blank_pages_keep_their_slot(self):
+        pulled, patch = self.counted_pages()
+        with patch, mock.patch.object(parsers, "_pdfium_page_text", lambda page: ""):
+            text = parsers.parse_pdf(text_pdf(4), max_chars=100, backend="pdfium", blank_pages=True)
+        self.assertEqual(len(pulled), 4)
+        self.assertEqual(text, "\n\f" * 3)
+
+
+# ---------------- INLINE EXTRACTION ---------------- #
+class FakeParses:
+    """
+    Stands in for _download_and_parse: the later a document comes, the
+    sooner it finishes; "broken" files raise. Records the peak concurrency.
+    """
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def _enter(self):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _exit(self):
+        with self.lock:
+            self.active -= 1
+
+    def _result(self, file_url):
+        name = os.path.basename(file_url)
+        if name.startswith("broken"):
+            raise ValueError("corrupt file")
+        return f"text of {name}"
+
+    def __call__(self, file_url, max_chars=None):
+        self._enter()
+        try:
+            time.sleep(self.delays[os.path.basename(file_url)])
+            return self._result(file_url)
+        finally:
+            self._exit()
+
+    async def parse_async(self, file_url, max_chars=None):
+        self._enter()
+        try:
+            await asyncio.sleep(self.delays[os.path.basename(file_url)])
+            return self._result(file_url)
+        finally:
+            self._exit()
+
+
+@override_settings(EXTRACTION_MAX_PER_REQUEST=2)
+class DocumentsTextTests(TestCase):
+    def setUp(self):
+        user = make_user()
+        names = ["a.txt", "b.txt", "broken.txt", "d.txt", "e.txt", "f.txt"]
+        self.documents = [make_document(user, name) for name in names]
+        self.fake = FakeParses({name: 0.05 - 0.008 * n for n, name in enumerate(names)})
+        self.expected = [
+            "text of a.txt", "text of b.txt", "⚠️ Error extracting text from broken.txt: corrupt file",
+            "text of d.txt", "text of e.txt", "text of f.txt",
+        ]
+
+    def test_texts_keep_the_input_order_within_the_concurrency_limit(self):
+        with mock.patch.object(extraction, "_download_and_parse", self.fake):
+            texts = extraction.get_documents_text(self.documents)
+        self.assertEqual(texts, self.expected)
+        self.assertEqual(self.fake.peak, 2)
+        # Only successful extractions are cached
+        self.assertEqual(ExtractedText.objects.count(), 5)
+
+    async def test_async_texts_keep_the_input_order_within_the_concurrency_limit(self):
+        with mock.patch.object(extraction, "_adownload_and_parse", self.fake.parse_async):
+            texts = await extraction.aget_documents_text(self.documents)
+        self.assertEqual(texts, self.expected)
+        self.assertEqual(self.fake.peak, 2)
+
+    def test_stored_and_cached_texts_are_not_extracted_again(self):
+        Document.objects.filter(pk=self.documents[0].pk).update(
+            extraction_status=Document.EXTRACTION_DONE, extracted_text="stored text"
+        )
+        self.documents[0].refresh_from_db()
+        cache.store_extracted_text(self.documents[1], document_content_key(self.documents[1]), EXTRACTION_VERSION, "cached text")
+        parse = mock.Mock(side_effect=self.fake)
+        with mock.patch.object(extraction, "_download_and_parse", parse):
+            texts = extraction.get_documents_text(self.documents, max_chars=6)
+        self.assertEqual(texts[:2], ["stored", "cached"])
+        self.assertEqual(parse.call_count, 4)
+
+
+# ---------------- DOWNLOAD SPOOL ---------------- #
+class BrokenDownload:
+    """requests response that fails after a few chunks."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield b"x" * 10
+        yield b"y" * 10
+        raise requests.ConnectionError("connection reset")
+
+
+class SpoolTests(SimpleTestCase):
+    @override_settings(EXTRACTION_SPOOL_MAX_BYTES=16)
+    def test_small_downloads_stay_in_memory(self):
+        with _Spool(".txt") as spool:
+            spool.write(b"0123456789")
+            spool.write(b"abcdef")
+            self.assertIsNone(spool.file)
+            self.assertEqual(spool.source(), b"0123456789abcdef")
+            self.assertEqual(spool.head(4), b"0123")
+
+    @override_settings(EXTRACTION_SPOOL_MAX_BYTES=16)
+    def test_spills_to_a_temp_file_above_the_limit(self):
+        with _Spool(".txt") as spool:
+            spool.write(b"0123456789")
+            spool.write(b"abcdefgh")
+            path = spool.source()
+            self.assertIsNone(spool.buffer)
+            self.assertTrue(path.endswith(".txt"))
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"0123456789abcdefgh")
+            self.assertEqual(spool.head(4), b"0123")
+            spool.write(b"!")  # head() leaves the file positioned for more writes
+            self.assertEqual(spool.size, 19)
+            with open(spool.source(), "rb") as f:
+                self.assertEqual(f.read(), b"0123456789abcdefgh!")
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(EXTRACTION_SPOOL_MAX_BYTES=4)
+    def test_failed_download_removes_the_temp_file(self):
+        created = []
+
+        def record(ext):
+            created.append(_Spool(ext))
+            return created[-1]
+
+        with mock.patch.object(extraction, "_Spool", record), \
+                mock.patch.object(extraction.requests, "get", return_value=BrokenDownload()):
+            with self.assertRaises(requests.ConnectionError):
+                extraction._download("https://cdn.example.com/raw/upload/report.txt", ".txt")
+        self.assertIsNotNone(created[0].file)
+        self.assertFalse(os.path.exists(created[0].file.name))
+
+    @override_settings(EXTRACTION_SPOOL_MAX_BYTES=4)
+    def test_failed_parse_removes_the_temp_file(self):
+        created = []
+
+        def spilled(file_url, ext):
+            created.append(_Spool(ext))
+            created[-1].write(b"\x00\x01\x02 not a known format")
+            return created[-1]
+
+        with mock.patch.object(extraction, "_download", spilled):
+            with self.assertRaisesMessage(ValueError, "Unsupported file type"):
+                extraction._download_and_parse("https://cdn.example.com/raw/upload/blob.bin")
+        self.assertFalse(os.path.exists(created[0].file.name))
+
+
+# ---------------- CSV DIGEST ---------------- #
+def csv_text(text):
+    return tabular.csv_digest(io.StringIO(text, newline=""))
+
+
+class CSVDigestTests(SimpleTestCase):
+    def test_column_statistics(self):
+        text = csv_text("id,score,day,city\n1,2.5,2024-01-02,Pune\n2,,2024-03-04,Delhi\n3,4.5,2024-02-01,Pune\n")
+        self.assertIn("CSV table: 3 rows × 4 columns", text)
+        self.assertIn("- id (integer); nulls 0; min 1, max 3, mean 2", text)
+        self.assertIn("- score (number); nulls 1; min 2.5, max 4.5, mean 3.5", text)
+        self.assertIn("from 2024-01-02 to 2024-03-04", text)
+        self.assertIn("'Pune' ×2", text)
+
+    def test_header_of_text_columns(self):
+        text = csv_text("name,city\nalice,paris\nbob,london\ncarol,rome\n")
+        self.assertIn("CSV table: 3 rows × 2 columns", text)
+        self.assertIn("- name (text)", text)
+        self.assertNotIn("'name'", text)
+
+    def test_files_without_a_header(self):
+        text = csv_text("1;2\n3;4\n5;6\n")
+        self.assertIn("CSV table: 3 rows × 2 columns", text)
+        self.assertIn("- column_2 (integer); nulls 0; min 2, max 6", text)
+
+    def test_ragged_rows_are_padded_or_cut(self):
+        text = csv_text("a,b,c\n1,2,3\n4,5\n6,7,8,9\n")
+        self.assertIn("CSV table: 3 rows × 3 columns", text)
+        self.assertIn("- c (integer); nulls 1", text)
+
+    def test_rows_are_read_in_batches(self):
+        rows = 2 * tabular.BATCH_ROWS + 5
+        text = csv_text("n,label\n" + "".join(f"{i},item {i % 7}\n" for i in range(rows)))
+        self.assertIn(f"CSV table: {rows:,} rows × 2 columns", text)
+        self.assertIn(f"- n (integer); nulls 0; min 0, max {rows - 1:,}", text)
+        self.assertIn("7 distinct", text)
+        sample = text.split("Random sample of rows:\n")[1].splitlines()
+        self.assertEqual(len(sample), tabular.SAMPLE_ROWS)
+
+    @mock.patch.object(tabular, "MAX_COLUMNS", 3)
+    def test_extra_columns_are_counted(self):
+        text = csv_text("a,b,c,d,e\n1,2,3,4,5\n6,7,8,9,10\n")
+        self.assertIn("CSV table: 2 rows × 3 columns", text)
+        self.assertIn("(2 more columns not analysed)", text)
+
+
+# ---------------- JSON DIGEST ---------------- #
+class JSONDigestTests(SimpleTestCase):
+    def test_records_of_a_root_array(self):
+        text = tabular.json_digest(io.StringIO('[{"city": "Pune", "rain": 12}, {"city": "Delhi", "rain": 3}]'))
+        self.assertIn("JSON array", text)
+        self.assertIn("city", text)
+        self.assertIn("rain", text)
+
+    def test_json_lines_whose_records_hold_arrays_of_objects(self):
+        lines = '{"id": 1, "tags": [{"a": 1}]}\n{"id": 2, "tags": []}\n{"id": 3, "tags": [{"a": 2}]}\n'
+        self.assertIn("JSON Lines: 3 rows", tabular.json_digest(io.StringIO(lines)))
+        # A single document on one line still has its table found
+        text = tabular.json_digest(io.StringIO('{"rows": [{"a": 1}, {"a": 2}]}\n'))
+        self.assertIn('JSON records under "rows": 2 rows', text)
+
+    def test_invalid_json_fails_without_reading_the_rest(self):
+        padding = ", ".join(['{"a": 1}'] * 200000)
+        stream = io.StringIO('[{"a": 1}, {"a" 2}, ' + padding + "]")
+        with self.assertRaisesMessage(ValueError, "Invalid JSON"):
+            tabular.json_digest(stream)
+        self.assertLess(stream.tell(), 2 * tabular.JSON_READ_CHARS)
+
+    def test_root_array_of_arrays_is_read_as_rows(self):
+        text = tabular.json_digest(io.StringIO('[["city", "rain"], ["Pune", 12], ["Delhi", null]]'))
+        self.assertIn("JSON array: 2 rows × 2 columns", text)
+        self.assertIn("- rain (integer); nulls 1", text)
+        text = tabular.json_digest(io.StringIO("[[1, 2.5], [3, 4.5]]"))
+        self.assertIn("JSON array: 2 rows × 2 columns", text)
+        self.assertIn("- column_2 (number)", text)
+
+    def test_pandas_split_layout_uses_its_columns(self):
+        frame = {"columns": ["id", "score"], "index": list(range(500)), "data": [[i, i / 2] for i in range(500)]}
+        text = tabular.json_digest(io.StringIO(json.dumps(frame)))
+        self.assertIn('JSON records under "data": 500 rows × 2 columns', text)
+        self.assertIn("- id (integer)", text)
+        self.assertIn("- score (number)", text)
+        self.assertIn("- index: [0, 1, 2", text)
+        self.assertNotIn("- columns:", text)
+
+    def test_other_fields_are_capped(self):
+        document = {"tags": list(range(1000)), "notes": "x" * (2 * tabular.MAX_FIELD_CHARS), "records": [{"a": 1}]}
+        text = tabular.json_digest(io.StringIO(json.dumps(document)))
+        self.assertIn("- notes: \"… more than", text)
+        text = tabular.json_digest(io.StringIO(json.dumps({"tags": list(range(1000)), "count": 3})))
+        self.assertIn(f'"… {1000 - tabular.MAX_FIELD_ITEMS:,} more items"', text)
+        self.assertIn('"count": 3', text)
+
+    def test_large_split_layout_is_streamed(self):
+        rows = 30000
+        frame = {
+            "columns": ["id", "name", "score"], "index": list(range(rows)),
+            "data": [[i, f"name {i}", i / 4] for i in range(rows)],
+        }
+        stream = io.StringIO(json.dumps(frame))
+        tracemalloc.start()
+        try:
+            text = tabular.json_digest(stream)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertIn(f"{rows:,} rows × 3 columns", text)
+        self.assertLess(peak, 4 * 1024 * 1024)
+
+    @mock.patch.object(tabular, "JSON_MAX_VALUE_CHARS", 1024 * 1024)
+    def test_unterminated_string_is_bounded(self):
+        stream = io.StringIO('[{"a": "open' + "x" * (8 * 1024 * 1024) + "}]")
+        with self.assertRaisesMessage(ValueError, "JSON value longer than"):
+            tabular.json_digest(stream)
+        self.assertLess(stream.tell(), 4 * 1024 * 1024)
+
+
+# ---------------- FORMAT DETECTION ---------------- #
+PDF_HEAD = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n1 0 obj"
+PNG_HEAD = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"
+
+
+class MarkdownExtractor(Extractor):
+    name = "markdown"
+    extensions = (".md",)
+    parser = "documents.tests.parse_markdown"
+
+
+def parse_markdown(source, max_chars=None):
+    return "markdown: " + bytes(source).decode()
+
+
+class FormatDetectionTests(SimpleTestCase):
+    def detected(self, head, ext, fallback=True):
+        extractor = find_extractor(head, ext, fallback=fallback)
+        return extractor.name if extractor else None
+
+    def test_magic_bytes_win_over_the_extension(self):
+        self.assertEqual(self.detected(PDF_HEAD, ".txt"), "pdf")
+        self.assertEqual(self.detected(PNG_HEAD, ".pdf"), "image")
+        self.assertEqual(self.detected(b"PK\x03\x04\x14\x00word/document.xml", ".zip"), "docx")
+
+    def test_binary_formats_need_their_magic_bytes(self):
+        self.assertEqual(self.detected(b"Just some notes", ".pdf"), "text")
+        self.assertIsNone(self.detected(b"Just some notes", ".pdf", fallback=False))
+        self.assertIsNone(self.detected(b"PK\x03\x04\x14\x00mimetype", ".zip"))
+        self.assertEqual(self.detected(b"PK\x03\x04\x14\x00[Content_Types].xml", ".docx"), "docx")
+
+    def test_text_formats_by_extension_then_content(self):
+        self.assertEqual(self.detected(b"a,b\n1,2\n", ".CSV"), "csv")
+        self.assertEqual(self.detected(b'\xef\xbb\xbf  [{"a": 1}]', ""), "json")
+        self.assertEqual(self.detected(b"<!DOCTYPE html><html>", ".dat"), "html")
+        self.assertEqual(self.detected(b"<?xml version='1.0'?><r/>", ""), "xml")
+
+    def test_unknown_binary_files_are_rejected(self):
+        self.assertIsNone(self.detected(b"\x00\x01\x02\x03", ".bin"))
+        self.assertIsNone(self.detected(b"\x00\x01\x02\x03", ""))
+
+    @override_settings(DOCUMENT_EXTRACTORS=["documents.tests.MarkdownExtractor", *settings.DOCUMENT_EXTRACTORS])
+    def test_registered_extractors_take_priority(self):
+        self.assertEqual(self.detected(b"# Notes", ".md"), "markdown")
+        self.assertEqual(self.detected(b"Notes", ".txt"), "text")
+        spool = _Spool(".md")
+        spool.write(b"# Notes")
+        with spool:
+            self.assertEqual(extraction._parse(spool, ".md"), "markdown: # Notes")
+
+    @override_settings(DOCUMENT_EXTRACTOR_LIMITS={"text": {"max_bytes": 4}})
+    def test_extractor_limits(self):
+        spool = _Spool(".txt")
+        spool.write(b"too long")
+        with spool, self.assertRaisesMessage(ValueError, "File too large for text extraction"):
+            extraction._parse(spool, ".txt")
+
+
+@override_settings(BACKGROUND_WORKER_IN_PROCESS=False)
+class UploadValidationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user())
+
+    def upload(self, name, content):
+        with self.assertLogs("django.request", "WARNING"):
+            return self.client.post("/documents/upload/", {"file": SimpleUploadedFile(name, content)}, format="multipart")
+
+    def test_unknown_formats_are_rejected(self):
+        response = self.upload("archive.bin", b"\x00\x01\x02\x03 binary")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unsupported file type: .bin", response.json()["file"][0])
+        self.assertFalse(Document.objects.exists())
+
+    def test_a_mislabelled_file_is_rejected(self):
+        response = self.upload("report.pdf", b"Plain text, not a PDF")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unsupported file type: .pdf", response.json()["file"][0])
+
+
+# ---------------- MARKUP ---------------- #
+def markup_text(data, html=True, max_chars=None):
+    return markup.extract_markup_text(io.BytesIO(data), html=html, max_chars=max_chars)
+
+
+class MarkupTextTests(SimpleTestCase):
+    def test_html_structure_is_kept_and_boilerplate_dropped(self):
+        text = markup_text(
+            b"<html><head><style>p {}</style><script>track()</script></head><body>"
+            b"<nav>Home | About</nav><h2>Results</h2><ul><li>First</li><li>Second</li></ul>"
+            b"<table><tr><th>City</th><th>Rain</th></tr><tr><td>Pune</td><td>12</td></tr></table>"
+            b"<p hidden>secret</p><div role='banner'>Sale</div><p>Closing   words</p></body></html>"
+        )
+        self.assertEqual(text, "## Results\n- First\n- Second\nCity | Rain\nPune | 12\nClosing words")
+
+    def test_xml_has_a_line_per_element(self):
+        text = markup_text(b"<?xml version='1.0'?><notes><note>Buy milk</note><note> Call  home </note></notes>", html=False)
+        self.assertEqual(text, "Buy milk\nCall home")
+
+    def test_xhtml_is_read_with_the_html_rules(self):
+        text = markup_text(
+            b"<?xml version='1.0'?><html xmlns='http://www.w3.org/1999/xhtml'><body><h1>Title</h1>"
+            b"<script>x()</script><p>Body</p></body></html>",
+            html=False,
+        )
+        self.assertEqual(text, "# Title\nBody")
+
+    def test_entities_are_not_expanded(self):
+        text = markup_text(
+            b"<?xml version='1.0'?><!DOCTYPE r [<!ENTITY e SYSTEM 'file:///etc/passwd'>]><r>before &e; after</r>",
+            html=False,
+        )
+        self.assertNotIn("root:", text)
+
+    def test_parsing_stops_at_max_chars(self):
+        stream = io.BytesIO(b"<html><body>" + b"<p>Some paragraph text.</p>" * 100000 + b"</body></html>")
+        text = markup.extract_markup_text(stream, html=True, max_chars=100)
+        self.assertEqual(len(text), 100)
+        self.assertLessEqual(stream.tell(), markup.FEED_BYTES)
+
+    def test_deeply_nested_documents(self):
+        depth = 5000
+        html = b"<html><body><p>before</p>" + b"<div>" * depth + b"deep" + b"</div>" * depth + b"<p>after</p></body></html>"
+        xml = b"<?xml version='1.0'?><r><p>before</p>" + b"<a>" * depth + b"deep" + b"</a>" * depth + b"<p>after</p></r>"
+        self.assertEqual(markup_text(html), "before\ndeep\nafter")
+        self.assertEqual(markup_text(xml, html=False), "before\ndeep\nafter")
+
+    def test_text_nodes_over_ten_megabytes(self):
+        size = 12 * 1024 * 1024
+        xml = b"<?xml version='1.0'?><r><![CDATA[" + b"x" * size + b"]]><p>after</p></r>"
+        text = markup_text(xml, html=False)
+        self.assertEqual(len(text), size + len("\nafter"))
+        self.assertTrue(text.endswith("x\nafter"))
+
+
+# ---------------- OCR ---------------- #
+class StubOCRBackend(ocr.OCRBackend):
+    """Reads out the size of each strip instead of running Tesseract."""
+
+    name = "stub"
+    calls = []
+
+    def recognize(self, image, languages):
+        self.calls.append(image.size)
+        return f"strip {image.width}x{image.height} ({languages})"
+
+
+def page_image(width, height, inset=5):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("L", (width, height), 255)
+    ImageDraw.Draw(image).rectangle((inset, inset, width - inset, height - inset), outline=0)
+    return image
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    page_image(width, height).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def scanned_pdf(pages):
+    """A PDF of images only, like a scan: no page has a text layer (each page differs, so none is cached)."""
+    images = [page_image(200, 100, inset=5 + n) for n in range(pages)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:], resolution=72)
+    return buffer.getvalue()
+
+
+def image_spool(data, ext=".png"):
+    spool = _Spool(ext)
+    spool.write(data)
+    return spool
+
+
+@override_settings(OCR_ENABLED=True, OCR_BACKEND="documents.tests.StubOCRBackend", OCR_LANGUAGES="eng")
+class OCRTests(SimpleTestCase):
+    def setUp(self):
+        StubOCRBackend.calls = []
+        caches[ocr.CACHE_ALIAS].clear()
+
+    def test_images_are_read_by_the_backend(self):
+        with image_spool(png(120, 60)) as spool:
+            self.assertEqual(extraction._parse(spool, ".png"), "strip 120x60 (eng)")
+
+    @override_settings(OCR_TILE_HEIGHT=100)
+    def test_tall_images_are_recognized_in_strips(self):
+        with image_spool(png(120, 250)) as spool:
+            text = extraction._parse(spool, ".png")
+        self.assertEqual(len(StubOCRBackend.calls), 3)
+        self.assertTrue(all(height <= 100 for _, height in StubOCRBackend.calls))
+        self.assertEqual(text.count("strip 120x"), 3)
+
+    @override_settings(EXTRACTION_PARSE_PROCESSES=0, OCR_PROCESSES=1, OCR_PDF_DPI=72)
+    def test_scanned_pdf_pages_are_recognized_until_max_chars(self):
+        with image_spool(scanned_pdf(10), ".pdf") as spool:
+            text = extraction._parse(spool, ".pdf")
+        self.assertEqual(len(StubOCRBackend.calls), 10)
+        self.assertEqual(text.count("strip 200x100"), 10)
+
+        StubOCRBackend.calls = []
+        caches[ocr.CACHE_ALIAS].clear()
+        with image_spool(scanned_pdf(10), ".pdf") as spool:
+            text = extraction._parse(spool, ".pdf", max_chars=30)
+        # One batch of OCR_PROCESSES * 2 pages already fills the budget
+        self.assertEqual(len(StubOCRBackend.calls), 2)
+        self.assertEqual(len(text), 30)
+
+    def test_recognized_pages_are_cached(self):
+        for _ in range(2):
+            with image_spool(png(120, 60)) as spool:
+                extraction._parse(spool, ".png")
+        self.assertEqual(len(StubOCRBackend.calls), 1)
+
+    @override_settings(OCR_ENABLED=False)
+    def test_disabled_ocr_skips_the_backend(self):
+        with image_spool(png(120, 60)) as spool:
+            self.assertEqual(extraction._parse(spool, ".png"), "")
+        self.assertEqual(StubOCRBackend.calls, [])
+
+    @override_settings(OCR_BACKEND="documents.ocr.TesseractBackend", OCR_TESSERACT_CMD="no-such-tesseract")
+    def test_missing_tesseract_logs_a_warning_once(self):
+        with mock.patch.object(ocr, "_unavailable_logged", set()):
+            with self.assertLogs("documents.ocr", "WARNING") as logs:
+                self.assertFalse(ocr.ocr_available())
+                self.assertFalse(ocr.ocr_available())
+            with image_spool(png(120, 60)) as spool:
+                self.assertEqual(extraction._parse(spool, ".png"), "")
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("is not available", logs.output[0])
+
+
+# ---------------- START-UP ---------------- #
+class StartupImportTests(SimpleTestCase):
+    """Workers must start without the heavy dependencies; see manage.py benchmark_startup."""
+
+    def test_worker_startup_skips_heavy_dependencies(self):
+        startup = measure_startup(settings.SETTINGS_MODULE, settings.BASE_DIR)
+        self.assertEqual(startup["lazy_loaded"], [])
@@ -0,0 +1,139 @@
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .extraction import _get_pool
+
+# Text-to-speech behind a small backend interface (settings.TTS_BACKEND), so
+# tests and benchmarks can swap the network TTS for a local stand-in.
+# Narrations are split on sentence boundaries, chunks are synthesized in
+# parallel, and the MP3 segments are concatenated frame by frame (no
+# re-encoding).
+
+
+# ---------------- BACKENDS ---------------- #
+class TTSBackend:
+    """Turns a chunk of text into MP3 bytes. synthesize() is called from worker threads."""
+
+    # Longest chunk handed to synthesize()
+    max_chunk_chars = 500
+
+    def supports(self, lang):
+        return True
+
+    def synthesize(self, text, lang):
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS through gTTS (one HTTP call per ~100 characters)."""
+
+    def supports(self, lang):
+        from gtts.lang import tts_langs
+
+        return lang in tts_langs()
+
+    def synthesize(self, text, lang):
+        from gtts import gTTS
+
+        buffer = BytesIO()
+        gTTS(text, lang=lang).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+_backends = {}
+
+
+def get_tts_backend():
+    path = settings.TTS_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+# ---------------- CHUNKING ---------------- #
+_SENTENCE_END = re.compile(r"(?<=[.!?।॥])\s+")
+
+
+def _fit(sentence, max_chars):
+    """Split a sentence longer than max_chars on whitespace (hard-cut overlong words)."""
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces = []
+    current = ""
+    for word in sentence.split():
+        while len(word) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:max_chars])
+            word = word[max_chars:]
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_text(text, max_chars):
+    """Pack whole sentences into chunks of at most max_chars."""
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END.split(" ".join(text.split())):
+        for piece in _fit(sentence, max_chars):
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# ---------------- MP3 SEGMENTS ---------------- #
+def strip_id3(data):
+    """MPEG frames of an MP3 without ID3v2 header / ID3v1 trailer, safe to concatenate."""
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+
+def get_tts_pool():
+    """Process-wide thread pool bounding concurrent TTS calls."""
+    return _get_pool(
+        "tts",
+        lambda: ThreadPoolExecutor(max_workers=settings.TTS_CONCURRENCY, thread_name_prefix="documents-tts"),
+    )
+
+
+async def asynthesize(text, lang, backend=None):
+    """
+    Yield MP3 segments for text in order. All chunks are submitted at once
+    (bounded by the TTS pool), so later chunks synthesize while earlier
+    segments are being delivered.
+    """
+    backend = backend or get_tts_backend()
+    loop = asyncio.get_running_loop()
+    pool = get_tts_pool()
+    futures = [
+        loop.run_in_executor(pool, backend.synthesize, chunk, lang)
+        for chunk in split_text(text, backend.max_chunk_chars)
+    ]
+    try:
+        for future in futures:
+            yield strip_id3(await future)
+    finally:
+        for future in futures:
+            future.cancel()
@@ -1,12 +1,21 @@
 # documents/urls.py
 
 from django.urls import path
-from documents.views import DocumentUploadView, SummarizeView, SummarizeListView, SummarizeChatView,AudioSummarizeView
+from documents.streaming import SummarizeStreamView, SummarizeChatStreamView, AudioStreamView
+from documents.views import DocumentUploadView, DocumentDetailView, SummarizeView, SummarizeBatchView, SummarizeBatchDetailView, SummarizeListView, SummaryDetailView, SummarizeChatView,AudioSummarizeView, SearchView
 
 urlpatterns = [
     path("upload/", DocumentUploadView.as_view(), name="upload"),
+    path("<int:document_id>/", DocumentDetailView.as_view(), name="document-detail"),
     path("summarize/", SummarizeView.as_view(), name="summarize"),
+    path("summarize/stream/", SummarizeStreamView.as_view(), name="summarize-stream"),
+    path("summarize/batch/", SummarizeBatchView.as_view(), name="summarize-batch"),
+    path("summarize/batch/<int:batch_id>/", SummarizeBatchDetailView.as_view(), name="summarize-batch-detail"),
+    path("search/", SearchView.as_view(), name="search"),
     path("summaries/", SummarizeListView.as_view(), name="summaries"),
+    path("summaries/<int:session_id>/", SummaryDetailView.as_view(), name="summary-detail"),
     path("summaries/<int:session_id>/chat/", SummarizeChatView.as_view(), name="summarization-chat"),
+    path("summaries/<int:session_id>/chat/stream/", SummarizeChatStreamView.as_view(), name="summarization-chat-stream"),
     path("summaries/<int:session_id>/audio/", AudioSummarizeView.as_view(), name="audio-summary"),
+    path("summaries/<int:session_id>/audio/stream/", AudioStreamView.as_view(), name="audio-summary-stream"),
 ]
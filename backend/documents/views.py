@@ -1,308 +1,361 @@
+import hmac
 import os
-import json
-import csv
-import requests
-import tempfile
-import docx
-import pdfplumber
-from bs4 import BeautifulSoup
-from PIL import Image
-
-from rest_framework.views import APIView
+import time
+
+from adrf.views import APIView
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.functions import Left
+from django.http import HttpResponse
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework import status, permissions
 
 from .serializers import (
     DocumentSerializer,
+    SearchResultSerializer,
     SummarizationSessionSerializer,
+    SummarizationSessionListSerializer,
     SummarizationMessageSerializer,
+    SummarizeBatchItemSerializer,
 )
-from .models import Document, SummarizationSession, SummarizationMessage
-
-# ✅ Gemini
-from google import genai
-from google.genai import types
-
-client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-
-# ---------------- TEXT EXTRACTION (Cloudinary URL) ---------------- #
-def extract_text_from_file(file_url):
-    ext = os.path.splitext(file_url)[-1].lower()
-    text = ""
-
-    try:
-        # Download file from Cloudinary URL into temp file
-        response = requests.get(file_url, stream=True)
-        response.raise_for_status()
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
-            for chunk in response.iter_content(chunk_size=8192):
-                tmp_file.write(chunk)
-            tmp_path = tmp_file.name
-
-        if ext == ".pdf":
-            with pdfplumber.open(tmp_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-
-        elif ext == ".docx":
-            doc = docx.Document(tmp_path)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-
-        elif ext == ".csv":
-            with open(tmp_path, newline="", encoding="utf-8", errors="ignore") as f:
-                reader = csv.reader(f)
-                for row in reader:
-                    text += ", ".join(row) + "\n"
-
-        elif ext == ".json":
-            with open(tmp_path, "r", encoding="utf-8", errors="ignore") as f:
-                data = json.load(f)
-                text = json.dumps(data, indent=2)
-
-        elif ext in [".html", ".htm", ".xml"]:
-            with open(tmp_path, "r", encoding="utf-8", errors="ignore") as f:
-                soup = BeautifulSoup(f, "html.parser")
-                text = soup.get_text(separator="\n")
-
-        elif ext in [".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp"]:
-            # OCR placeholder
-            img = Image.open(tmp_path)
-            text = "⚠️ OCR not implemented yet for images."
-
-        else:  # fallback: plain text
-            with open(tmp_path, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-
-        os.remove(tmp_path)
-
-    except Exception as e:
-        text = f"⚠️ Error extracting text from {os.path.basename(file_url)}: {str(e)}"
-
-    if not text.strip():
-        text = f"⚠️ Could not extract readable text from {os.path.basename(file_url)}."
-
-    return text.strip()
+from .models import Document, SummarizationSession, SummarizationMessage, SummarizeBatch
+from .extraction import aget_documents_text
+from .tasks import enqueue_extraction, enqueue_memory_compaction, enqueue_search_update, enqueue_summarize_batch
+from .audio import get_audio
+from .tts import get_tts_backend
+from .gateway import llm_user
+from .instrumentation import render_metrics, span
+from .llm import agenerate_text, count_tokens
+from .memory import chat_context
+from .search import KINDS, search, search_backend
+from .summarize import MODES, asummarize_text, build_chat_prompt, max_input_chars
+
+# Views are async (adrf APIView) and served through backend/asgi.py, so a
+# request waiting on Gemini or Cloudinary parks a coroutine rather than a
+# gunicorn worker. Blocking work (ORM, serializers, Cloudinary upload, gTTS)
+# goes through sync_to_async.
 
 
 # ---------------- DOCUMENT UPLOAD ---------------- #
 class DocumentUploadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(self.upload)(request)
+
+    def upload(self, request):
         serializer = DocumentSerializer(data=request.data, context={"request": request})
         if serializer.is_valid():
             document = serializer.save(user=request.user)
+            # ✅ Parse in the background so summarize can use the stored text
+            enqueue_extraction(document)
+            enqueue_search_update(document=document)
             # ✅ Return Cloudinary URL instead of local path
             return Response(DocumentSerializer(document).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-# ---------------- SUMMARIZE VIEW ---------------- #
-class SummarizeView(APIView):
+# ---------------- DOCUMENT STATUS ---------------- #
+class DocumentDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def post(self, request):
-        file_ids = request.data.get("files", [])
-        if not isinstance(file_ids, list):
-            return Response({"error": "files must be a list of IDs"}, status=400)
-
+    async def get(self, request, document_id):
         try:
-            file_ids = [int(fid) for fid in file_ids]
-        except ValueError:
-            return Response({"error": "Invalid file IDs"}, status=400)
-
-        docs = Document.objects.filter(id__in=file_ids, user=request.user)
-        if not docs.exists():
-            return Response({"error": "No documents found"}, status=400)
+            document = await Document.objects.aget(id=document_id, user=request.user)
+        except Document.DoesNotExist:
+            return Response({"error": "Document not found"}, status=404)
+        return Response(DocumentSerializer(document).data, status=200)
 
-        # ✅ Extract text from Cloudinary URLs
-        combined_text = "\n\n".join([extract_text_from_file(d.file.url) for d in docs])
 
-        if not combined_text.strip():
-            return Response(
-                {"error": "No readable text could be extracted (scanned PDFs need OCR)."},
-                status=400,
-            )
+def use_llm_cache(data):
+    """False when the client asked for a fresh Gemini answer ("refresh": true)."""
+    return str(data.get("refresh", "")).lower() not in ("true", "1")
 
-        prompt = f"""
-You are a professional document analyst. 
-Summarize the following document(s) into a **highly detailed, well-structured Markdown report**.
 
-⚠️ IMPORTANT: 
-- Use clear markdown headers: `### 1. Overview`, `### 2. Important Details`, etc. 
-- Always use bullet points (`- ...`) for lists, never long paragraphs. 
-- Highlight key terms/dates/names in **bold**.
-- Add line breaks between sections for readability.
+# ---------------- SUMMARIZE VIEW ---------------- #
+def parse_summarize_request(data, user):
+    """
+    Validate a summarize payload. Returns (documents, mode, error) with the
+    user's documents in the order their ids were sent.
+    """
+    file_ids = data.get("files", [])
+    if not isinstance(file_ids, list):
+        return None, None, "files must be a list of IDs"
 
-Your output MUST strictly follow this structure:
+    try:
+        file_ids = [int(fid) for fid in file_ids]
+    except (TypeError, ValueError):
+        return None, None, "Invalid file IDs"
 
-### 1. Overview
-(2–4 sentences max, in plain text.)
+    mode = data.get("mode", settings.SUMMARY_DEFAULT_MODE)
+    if mode not in MODES:
+        return None, None, f"mode must be one of: {', '.join(MODES)}"
 
-### 2. Important Details
-- **Clause/Instruction** → explanation
-- **Date/Name/Number** → explanation
-- (Continue listing EVERYTHING important)
+    docs_by_id = {d.id: d for d in Document.objects.filter(id__in=file_ids, user=user)}
+    if not docs_by_id:
+        return None, None, "No documents found"
+    # Keep the order the files were sent in
+    docs = [docs_by_id[fid] for fid in dict.fromkeys(file_ids) if fid in docs_by_id]
+    return docs, mode, None
 
-### 3. Context & Purpose
-- Why the document exists
-- Who it is for
-- How it is used
 
-### 4. Implications
-- **Rule broken** → consequence
-- **Missed requirement** → penalty
 
-### 5. Extra Observations
-- Errors, missing parts, inconsistencies
-- Anything unusual or noteworthy
+class SummarizeView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
 
-### 6. Verbatim Quotes
-- "Copy key phrases here"
-- "Use exact wording from the text"
+    async def post(self, request):
+        docs, mode, error = await sync_to_async(parse_summarize_request)(request.data, request.user)
+        if error:
+            return Response({"error": error}, status=400)
 
----
-📄 Document Content:
-{combined_text[:12000]}
-"""
+        # ✅ Use text extracted at upload time (pending files are extracted concurrently)
+        with span("extract"):
+            texts = await aget_documents_text(docs, max_chars=max_input_chars(mode))
+        combined_text = "\n\n".join(texts)
 
-        try:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[types.Content(role="user", parts=[types.Part(text=prompt)])]
+        if not combined_text.strip():
+            return Response(
+                {"error": "No readable text could be extracted (scanned PDFs need OCR)."},
+                status=400,
             )
 
-            summary_text = getattr(response, "text", None)
+        try:
+            # ✅ Long inputs are summarized chunk by chunk, then reduced
+            with llm_user(request.user.id), span("summarize"):
+                summary_text, stats = await asummarize_text(combined_text, mode)
             if not summary_text:
                 return Response({"error": "Gemini returned no summary text."}, status=500)
 
             # ✅ Save summarization session
-            first_doc = docs.first()
-            session = SummarizationSession.objects.create(
-                user=request.user,
-                document=first_doc,
-                title=f'Summarization "{os.path.basename(first_doc.file.name)}"',
-                summary_text=summary_text,
-            )
-            SummarizationMessage.objects.create(session=session, role="assistant", content=summary_text)
+            with span("db"):
+                session = await sync_to_async(SummarizationSession.create_for_documents)(
+                    request.user, docs, summary_text
+                )
+                await sync_to_async(enqueue_search_update)(session=session)
 
-            return Response({
+            data = {
                 "summary": summary_text,
                 "session_id": session.id,
                 "title": session.title,
                 "created_at": session.created_at,
-            }, status=200)
+            }
+            if stats:
+                data["hierarchical"] = stats
+            return Response(data, status=200)
 
         except Exception as e:
             return Response({"error": f"Gemini summarization failed: {str(e)}"}, status=500)
 
 
+# ---------------- BATCH SUMMARIZATION ---------------- #
+class SummarizeBatchView(APIView):
+    """Queue one summary per document; poll SummarizeBatchDetailView for progress."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request):
+        docs, mode, error = await sync_to_async(parse_summarize_request)(request.data, request.user)
+        if error:
+            return Response({"error": error}, status=400)
+        if len(docs) > settings.SUMMARIZE_BATCH_MAX_DOCUMENTS:
+            return Response(
+                {"error": f"A batch can hold at most {settings.SUMMARIZE_BATCH_MAX_DOCUMENTS} documents."},
+                status=400,
+            )
+
+        batch = await sync_to_async(enqueue_summarize_batch)(request.user, docs, mode)
+        return Response({"batch_id": batch.id, "mode": mode, "total": len(docs)}, status=202)
+
+
+class SummarizeBatchDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, batch_id):
+        try:
+            batch = await SummarizeBatch.objects.aget(id=batch_id, user=request.user)
+        except SummarizeBatch.DoesNotExist:
+            return Response({"error": "Batch not found"}, status=404)
+
+        def load():
+            progress = batch.progress()
+            items = SummarizeBatchItemSerializer(batch.items.all(), many=True).data
+            return progress, items
+
+        progress, items = await sync_to_async(load)()
+        finished = progress["queued"] == 0 and progress["running"] == 0
+        return Response(
+            {
+                "batch_id": batch.id,
+                "mode": batch.mode,
+                "created_at": batch.created_at,
+                "status": "done" if finished else "running",
+                "progress": progress,
+                "items": items,
+            },
+            status=200,
+        )
+
+
 # ---------------- LIST SUMMARIZATIONS ---------------- #
+# Characters of the summary shown on a sidebar row; the full text comes from the detail endpoint
+SUMMARY_PREVIEW_CHARS = 200
+
+
+class SummaryCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+
 class SummarizeListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def get(self, request):
-        sessions = SummarizationSession.objects.filter(user=request.user).order_by("-created_at")
-        serializer = SummarizationSessionSerializer(sessions, many=True)
-        return Response(serializer.data, status=200)
+    async def get(self, request):
+        return await sync_to_async(self.list)(request)
+
+    def list(self, request):
+        sessions = (
+            SummarizationSession.objects.filter(user=request.user)
+            .defer("summary_text", "memory_digest")
+            .annotate(
+                summary_preview=Left("summary_text", SUMMARY_PREVIEW_CHARS),
+                message_count=Count("messages"),
+                last_message_at=Max("messages__created_at"),
+            )
+        )
+        paginator = SummaryCursorPagination()
+        page = paginator.paginate_queryset(sessions, request, view=self)
+        return paginator.get_paginated_response(SummarizationSessionListSerializer(page, many=True).data)
+
+
+class SummaryDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, session_id):
+        try:
+            session = await SummarizationSession.objects.prefetch_related("messages").aget(
+                id=session_id, user=request.user
+            )
+        except SummarizationSession.DoesNotExist:
+            return Response({"error": "Session not found"}, status=404)
+        return Response(SummarizationSessionSerializer(session).data, status=200)
 
 
 # ---------------- CHAT WITH SUMMARY ---------------- #
 class SummarizeChatView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def post(self, request, session_id):
+    async def post(self, request, session_id):
         query = request.data.get("query", "").strip()
         if not query:
             return Response({"error": "Query cannot be empty."}, status=400)
 
         try:
-            session = SummarizationSession.objects.get(id=session_id, user=request.user)
+            session = await SummarizationSession.objects.select_related("document").aget(id=session_id, user=request.user)
         except SummarizationSession.DoesNotExist:
             return Response({"error": "Session not found"}, status=404)
 
-        # Build context with saved summary
-        context_prompt = f"""
-You are chatting with a user about a previously summarized document.
-
-### Summary Context:
-{session.summary_text}
-
-### User Query:
-{query}
+        from .retrieval import retrieve  # numpy: imported on the first chat message
 
-Answer based ONLY on the summary context above. 
-If the summary does not mention something, reply: "⚠️ Not available in the provided summary."
-"""
+        # Build context with saved summary, the passages of the document closest
+        # to the query and the conversation so far (digest + recent messages)
+        with llm_user(request.user.id), span("retrieve"):
+            excerpts = await sync_to_async(retrieve)(session.document, query)
+        with span("history"):
+            digest, history = await sync_to_async(chat_context)(session)
+        context_prompt = build_chat_prompt(session.summary_text, query, excerpts, history, digest)
 
         try:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[types.Content(role="user", parts=[types.Part(text=context_prompt)])]
-            )
-
-            answer = getattr(response, "text", None) or "⚠️ Gemini returned no response."
+            answer = await agenerate_text(
+                context_prompt, use_cache=use_llm_cache(request.data), user=request.user.id
+            ) or "⚠️ Gemini returned no response."
 
             # Save chat messages
-            SummarizationMessage.objects.create(session=session, role="user", content=query)
-            SummarizationMessage.objects.create(session=session, role="assistant", content=answer)
+            with span("db"):
+                await SummarizationMessage.objects.acreate(session=session, role="user", content=query)
+                await SummarizationMessage.objects.acreate(session=session, role="assistant", content=answer)
+                await sync_to_async(enqueue_search_update)(session=session)
+                await sync_to_async(enqueue_memory_compaction)(session)
 
-            return Response({"reply": answer}, status=200)
+            return Response({"reply": answer, "prompt_tokens": count_tokens(context_prompt)}, status=200)
 
         except Exception as e:
             return Response({"error": f"Gemini chat failed: {str(e)}"}, status=500)
 
 
 # ---------------- AUDIO SUMMARIZATION ---------------- #
-from gtts import gTTS
-from django.conf import settings
-
 class AudioSummarizeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def post(self, request, session_id):
-        try:
-            session = SummarizationSession.objects.get(id=session_id, user=request.user)
-            text_summary = session.summary_text
+    async def post(self, request, session_id):
+        lang = request.data.get("language", "en")
+        if not get_tts_backend().supports(lang):
+            return Response({"error": f"Unsupported language: {lang}"}, status=400)
 
-            lang = request.data.get("language", "en")
+        try:
+            session = await SummarizationSession.objects.aget(id=session_id, user=request.user)
 
-            narration_prompt = f"""
-                Rewrite the following summary into a natural, human-like spoken narration. 
-                - Remove all markdown, symbols like ** or ##, and any formatting. 
-                - Write in smooth, conversational { 'Hindi' if lang == 'hi' else 'English' }. 
-                - Pretend you are narrating the content aloud for an audiobook.
+            # ✅ Reuse the stored narration and mp3 unless the summary changed
+            with span("audio"):
+                artifact, generated = await get_audio(session, lang, refresh=not use_llm_cache(request.data))
 
-                ### Original Summary:
-                {text_summary}
-            """
+            audio_url = request.build_absolute_uri(f"{settings.MEDIA_URL}{artifact.file_path}")
 
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[types.Content(role="user", parts=[types.Part(text=narration_prompt)])]
+            return Response(
+                {"audio_url": audio_url, "narration": artifact.narration, "cached": not generated},
+                status=200,
             )
-            narration = response.text.strip()
 
-            # ✅ Convert narration to audio
-            tts = gTTS(narration, lang=lang)
+        except SummarizationSession.DoesNotExist:
+            return Response({"error": "Session not found"}, status=404)
+        except Exception as e:
+            return Response({"error": str(e)}, status=500)
 
-            audio_dir = os.path.join(settings.MEDIA_ROOT, "audio")
-            os.makedirs(audio_dir, exist_ok=True)
-            file_path = os.path.join(audio_dir, f"summary_{session.id}_{lang}.mp3")
 
-            tts.save(file_path)
+# ---------------- METRICS ---------------- #
+class MetricsView(APIView):
+    """Prometheus scrape endpoint; requires `Authorization: Bearer <METRICS_TOKEN>` (off until one is set)."""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
 
-            audio_url = request.build_absolute_uri(
-                f"{settings.MEDIA_URL}audio/summary_{session.id}_{lang}.mp3"
-            )
+    async def get(self, request):
+        token = settings.METRICS_TOKEN
+        if not (settings.METRICS_ENABLED and token):
+            return Response({"error": "Metrics are disabled."}, status=404)
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return Response({"error": "Invalid metrics token."}, status=401)
+        return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-            return Response({"audio_url": audio_url, "narration": narration}, status=200)
 
-        except SummarizationSession.DoesNotExist:
-            return Response({"error": "Session not found"}, status=404)
-        except Exception as e:
-            return Response({"error": str(e)}, status=500)
+# ---------------- SEARCH ---------------- #
+class SearchView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"error": "q cannot be empty."}, status=400)
+
+        kind = request.query_params.get("kind") or None
+        if kind is not None and kind not in KINDS:
+            return Response({"error": f"kind must be one of: {', '.join(KINDS)}"}, status=400)
+
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), 50)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=400)
+
+        started = time.perf_counter()
+        entries = await sync_to_async(search)(request.user, query, kind, limit)
+        took_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        return Response(
+            {
+                "results": SearchResultSerializer(entries, many=True).data,
+                "backend": search_backend(),
+                "took_ms": took_ms,
+            },
+            status=200,
+        )
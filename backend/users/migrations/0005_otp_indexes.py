@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='onetimepassword',
+            index=models.Index(fields=['user', 'code', '-created_at'], name='otp_user_code_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='onetimepassword',
+            index=models.Index(condition=models.Q(('is_used', False)), fields=['user', 'purpose'], name='otp_unused_user_purpose_idx'),
+        ),
+    ]
@@ -48,6 +48,18 @@ class OneTimePassword(models.Model):
     expires_at = models.DateTimeField()
     is_used = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # OTP verification: filter(user=..., code=...) newest first
+            models.Index(fields=["user", "code", "-created_at"], name="otp_user_code_created_idx"),
+            # create_for_user invalidates only the unused codes
+            models.Index(
+                fields=["user", "purpose"],
+                condition=models.Q(is_used=False),
+                name="otp_unused_user_purpose_idx",
+            ),
+        ]
+
     @staticmethod
     def generate_code():
         return f"{random.randint(100000, 999999)}"
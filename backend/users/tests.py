@@ -1,3 +1,27 @@
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from .models import OneTimePassword
+
+
+def query_plan(queryset):
+    """EXPLAIN output; PostgreSQL seq scans are disabled so tiny test tables still show the index choice."""
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+    return queryset.explain()
+
+
+# ---------------- QUERY PLANS ---------------- #
+class OtpQueryPlanTests(TestCase):
+    def test_verification_lookup_uses_user_code_index(self):
+        plan = query_plan(OneTimePassword.objects.filter(user_id=1, code="123456").order_by("-created_at"))
+        self.assertIn("otp_user_code_created_idx", plan)
+        self.assertNotRegex(plan, r"TEMP B-TREE|\bSort\b")
+
+    def test_invalidation_uses_partial_unused_index(self):
+        # Same WHERE clause as the bulk update in OneTimePassword.create_for_user
+        plan = query_plan(
+            OneTimePassword.objects.filter(user_id=1, purpose=OneTimePassword.PURPOSE_SIGNUP, is_used=False)
+        )
+        self.assertIn("otp_unused_user_purpose_idx", plan)
@@ -105,8 +105,6 @@ def resend_otp(request):
 
 
 
-from google.oauth2 import id_token as google_id_token
-from google.auth.transport import requests as google_requests
 import os
 
 @api_view(["POST"])
@@ -116,6 +114,10 @@ def google_login(request):
     Body: { "credential": "<ID_TOKEN_FROM_GOOGLE>" }
     Returns: { token, username, email }
     """
+    # google-auth is only needed here: keep it out of worker start-up
+    from google.oauth2 import id_token as google_id_token
+    from google.auth.transport import requests as google_requests
+
     id_token_from_client = request.data.get("credential")
     if not id_token_from_client:
         return Response({"detail": "Missing credential (ID token)."}, status=400)
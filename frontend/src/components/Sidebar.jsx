@@ -12,6 +12,9 @@ export default function Sidebar({
 }) {
   const [sessions, setSessions] = useState([])
   const [activeId, setActiveId] = useState(null)
+  // Cursor URL of the next page of summaries (null once everything is loaded)
+  const [nextUrl, setNextUrl] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   
   const BASE_URL = import.meta.env.VITE_BASIC_URL || ""
   const token = typeof window !== "undefined" ? localStorage.getItem("token") : null
@@ -31,29 +34,53 @@ export default function Sidebar({
     }
   }, [])
 
+  async function fetchPage(url) {
+    const res = await fetch(url, { headers: { Authorization: `Token ${token}` } })
+    if (!res.ok) {
+      console.warn("Could not fetch summaries, status:", res.status)
+      return null
+    }
+    const data = await res.json()
+    // Newest first, one cursor page at a time
+    return {
+      list: Array.isArray(data) ? data : data.results || data.summaries || [],
+      next: Array.isArray(data) ? null : data.next || null,
+    }
+  }
+
   async function fetchSessions() {
     if (!token) {
       setSessions([])
+      setNextUrl(null)
       return
     }
     try {
-      const url = `${BASE_URL.replace(/\/?$/, "/")}documents/summaries/`
-      const res = await fetch(url, { headers: { Authorization: `Token ${token}` } })
-      if (!res.ok) {
-        console.warn("Could not fetch summaries, status:", res.status)
-        setSessions([])
-        return
-      }
-      const data = await res.json()
-      const list = Array.isArray(data)
-        ? data
-        : Array.isArray(data.results)
-        ? data.results
-        : data.summaries || []
-      setSessions(list.slice().reverse())
+      const page = await fetchPage(`${BASE_URL.replace(/\/?$/, "/")}documents/summaries/`)
+      setSessions(page ? page.list : [])
+      setNextUrl(page ? page.next : null)
     } catch (err) {
       console.error("Failed to load sessions:", err)
       setSessions([])
+      setNextUrl(null)
+    }
+  }
+
+  async function loadMore() {
+    if (!nextUrl || loadingMore) return
+    setLoadingMore(true)
+    try {
+      const page = await fetchPage(nextUrl)
+      if (page) {
+        setSessions((prev) => {
+          const known = new Set(prev.map((p) => String(p.id)))
+          return [...prev, ...page.list.filter((s) => !known.has(String(s.id)))]
+        })
+        setNextUrl(page.next)
+      }
+    } catch (err) {
+      console.error("Failed to load more sessions:", err)
+    } finally {
+      setLoadingMore(false)
     }
   }
 
@@ -204,9 +231,9 @@ export default function Sidebar({
                       {s.created_at ? new Date(s.created_at).toLocaleString() : "—"}
                     </div>
 
-                    {(s.summary_text || s.summary) && (
+                    {(s.summary_preview || s.summary_text || s.summary) && (
                       <div className="text-xs text-slate-300 leading-relaxed line-clamp-3 opacity-80 transition-opacity">
-                        {s.summary_text || s.summary}
+                        {s.summary_preview || s.summary_text || s.summary}
                       </div>
                     )}
                   </div>
@@ -214,6 +241,16 @@ export default function Sidebar({
               </div>
             ))
           )}
+
+          {nextUrl && (
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="w-full mb-3 py-2 rounded-lg text-xs font-medium bg-slate-800/50 hover:bg-slate-800 text-slate-300 transition disabled:opacity-60"
+            >
+              {loadingMore ? "Loading..." : "Load more"}
+            </button>
+          )}
         </div>
       </aside>
     </>
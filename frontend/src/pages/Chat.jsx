@@ -200,21 +200,40 @@ export default function Chat() {
     }
   }
 
-  const handleSelectSession = (session) => {
-    setActiveSession(session)
-    setResults((prev) => ({
+  // ifCurrent: only while this session is still the one shown (a late response must not replace a newer pick)
+  const showSession = (session, content, ifCurrent = false) => {
+    setResults((prev) => ifCurrent && String(prev.summaries[0]?.id) !== String(session.id) ? prev : ({
       ...prev,
       summaries: [
         {
           id: session.id,
           title: session.title,
-          content: session.summary_text || "No content yet",
+          content: content || "No content yet",
           timestamp: new Date(session.created_at).toLocaleTimeString(),
         },
       ],
     }))
+  }
+
+  const handleSelectSession = async (session) => {
+    setActiveSession(session)
+    showSession(session, session.summary_text || session.summary_preview)
     setActiveTab("results")
     closeSidebar()
+
+    // Sidebar rows only carry a preview: load the full summary
+    if (session.summary_text || session.is_local) return
+    try {
+      const BASE_URL = import.meta.env.VITE_BASIC_URL || ""
+      const res = await fetch(`${BASE_URL.replace(/\/?$/, "/")}documents/summaries/${session.id}/`, {
+        headers: { Authorization: `Token ${localStorage.getItem("token")}` },
+      })
+      if (!res.ok) return
+      const data = await res.json()
+      showSession(session, data.summary_text, true)
+    } catch (err) {
+      console.error("Failed to load summary:", err)
+    }
   }
 
   return (